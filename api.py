@@ -0,0 +1,401 @@
+import argparse
+import io
+import math
+from urllib.parse import quote
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from core.logic import calculate_totals_in_cents, get_settlements, get_participant_statement, get_category_breakdown
+from core.models import Bill
+from core.allocation import MAX_PRICE, MAX_QUANTITY
+from core.exports import EXPORT_FORMATS
+from core.state import create_bill_store, RevisionConflict
+from core.collab import create_op_log, share_changes
+from core.statements import STATEMENT_RENDERERS, safe_file_name, stream_statements_zip
+from core.reconcile import load_transactions, reconcile
+from core.ledger import MerkleLedger
+from core.rollups import PERIODS
+
+# Shared with the Streamlit app, so bills created here can be opened there with ?bill=<id>
+STORE = create_bill_store()
+# Bills that have been live are changed through their shared log, like the app's non-live sessions do
+OP_LOG = create_op_log()
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Shared with the Streamlit app through ledger.jsonl
+LEDGER = MerkleLedger.load()
+
+
+class ApiError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _is_number(value):
+    # JSON bodies may carry NaN and Infinity, which no price or quantity can be
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_name_list(value):
+    return isinstance(value, list) and all(isinstance(name, str) and name for name in value)
+
+
+def _validate_items(items):
+    """Checks a batch of items before any of them is added, so a bad batch adds nothing.
+
+    Returns the items ready for Bill.add_items(). An item with ``quantities``
+    (units each participant consumed) may give a ``unit_price`` instead of a
+    price; the price is then the unit price times the units consumed.
+    """
+    if not isinstance(items, list):
+        raise ApiError("'items' must be a list")
+    checked = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ApiError(f"items[{i}] must be an object")
+        if not isinstance(item.get('item_name'), str) or not item['item_name']:
+            raise ApiError(f"items[{i}] needs an item_name string")
+        quantities = item.get('quantities')
+        if quantities is not None:
+            if (not isinstance(quantities, dict) or not quantities or not all(quantities)
+                    or not all(_is_number(units) and 0 <= units <= MAX_QUANTITY for units in quantities.values())
+                    or not any(units > 0 for units in quantities.values())):
+                raise ApiError(f"items[{i}] needs quantities mapping participants to units, some above zero "
+                               f"and none above {MAX_QUANTITY:,}")
+        elif not _is_name_list(item.get('participants')) or not item['participants']:
+            raise ApiError(f"items[{i}] needs a list of participant names")
+        price = item.get('price')
+        if (price is None and quantities is not None and _is_number(item.get('unit_price'))
+                and item['unit_price'] <= MAX_PRICE):
+            price = round(item['unit_price'] * sum(quantities.values()), 2)
+        if not _is_number(price) or not 0 < price <= MAX_PRICE:
+            raise ApiError(f"items[{i}] needs a positive price" + (" or unit_price" if quantities else "")
+                           + f" for a total of at most {MAX_PRICE:,}")
+        if not isinstance(item.get('category', ""), (str, type(None))):
+            raise ApiError(f"items[{i}] has a category that isn't a string")
+        checked.append({
+            'item_name': item['item_name'],
+            'price': float(price),
+            # Ignored for items split by quantity, whose participants are the quantities' names
+            'participants': item['participants'] if quantities is None else [],
+            'category': item.get('category'),
+            'quantities': quantities,
+        })
+    return checked
+
+
+def _build_bill(payload):
+    """Creates a bill from a request body with description, date, participants and items."""
+    if not isinstance(payload, dict):
+        raise ApiError("Request body must be a JSON object")
+    items = _validate_items(payload.get('items', []))
+    description = payload.get('description', "New Bill")
+    if not isinstance(description, str):
+        raise ApiError("'description' must be a string")
+    participants = payload.get('participants', [])
+    if not _is_name_list(participants):
+        raise ApiError("'participants' must be a list of names")
+    try:
+        # The date is checked here rather than when the rollups are updated during the save
+        bill = Bill(description, bill_date=payload.get('date'))
+    except ValueError as e:
+        raise ApiError(str(e))
+    for name in participants:
+        bill.add_participant(name)
+    if items:
+        bill.add_items(items)
+    return bill
+
+
+# Store calls and splitting block, so handlers run them in the thread pool rather than on the event loop
+async def _get_bill(request):
+    """Returns ``(bill, revision)`` for the bill named in the URL."""
+    bill, revision = await run_in_threadpool(STORE.load, request.path_params['bill_id'])
+    if bill is None:
+        raise ApiError("Bill not found", status_code=404)
+    return bill, revision
+
+
+def _store_bill(bill, revision):
+    if revision and OP_LOG.latest_seq(bill.bill_id):
+        # Live replicas save over the store, so the change goes through the bill's log first
+        stored, current = STORE.load(bill.bill_id)
+        if current != revision:
+            raise RevisionConflict(bill.bill_id, revision, current)
+        share_changes(bill, OP_LOG, stored.to_state())
+    return STORE.save(bill, revision)
+
+
+async def _save_bill(bill, revision):
+    """Saves a bill, returning its new revision; a concurrent save is a 409."""
+    try:
+        return await run_in_threadpool(_store_bill, bill, revision)
+    except RevisionConflict as e:
+        raise ApiError(f"{e}; retry the request", status_code=409)
+
+
+def _totals_payload(bill, revision=0):
+    totals = calculate_totals_in_cents(bill)
+    return {
+        'bill_id': bill.bill_id,
+        'revision': revision,
+        'total': sum(totals.values()) / 100.0,
+        'totals': {name: cents / 100.0 for name, cents in totals.items()},
+        'category_totals': get_category_breakdown(bill),
+    }
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise ApiError("Request body is not valid JSON")
+
+
+async def create_bill(request):
+    bill = await run_in_threadpool(_build_bill, await _read_json(request))
+    revision = await _save_bill(bill, 0)
+    return JSONResponse({'bill_id': bill.bill_id, 'revision': revision}, status_code=201)
+
+
+async def add_items(request):
+    bill, revision = await _get_bill(request)
+    payload = await _read_json(request)
+    items = _validate_items(payload.get('items') if isinstance(payload, dict) else None)
+    # One vectorized split and one recorded change for the whole batch
+    await run_in_threadpool(bill.add_items, items)
+    revision = await _save_bill(bill, revision)
+    return JSONResponse({'bill_id': bill.bill_id, 'revision': revision, 'item_count': len(bill.items)})
+
+
+async def get_totals(request):
+    return JSONResponse(await run_in_threadpool(_totals_payload, *await _get_bill(request)))
+
+
+async def get_settlement(request):
+    bill, _ = await _get_bill(request)
+    payer = request.query_params.get('payer')
+    if not payer:
+        raise ApiError("The 'payer' query parameter is required")
+    settlements = await run_in_threadpool(get_settlements, bill, payer)
+    return JSONResponse({'bill_id': bill.bill_id, 'payer': payer, 'settlements': settlements})
+
+
+async def get_statement(request):
+    bill, _ = await _get_bill(request)
+    name = request.path_params['name']
+    if name not in bill.participants:
+        raise ApiError(f"'{name}' is not part of this bill", status_code=404)
+    statement = await run_in_threadpool(get_participant_statement, bill, name)
+    return JSONResponse(dict(statement, bill_id=bill.bill_id))
+
+
+def _split_bills(bills):
+    results = []
+    for i, bill_payload in enumerate(bills):
+        try:
+            results.append(_totals_payload(_build_bill(bill_payload)))
+        except ApiError as e:
+            raise ApiError(f"bills[{i}]: {e}")
+    return results
+
+
+async def split_batch(request):
+    """Splits many bills in one request without storing them."""
+    payload = await _read_json(request)
+    bills = payload.get('bills') if isinstance(payload, dict) else None
+    if not isinstance(bills, list):
+        raise ApiError("'bills' must be a list")
+    return JSONResponse({'results': await run_in_threadpool(_split_bills, bills)})
+
+
+async def export_bill(request):
+    bill, _ = await _get_bill(request)
+    kind = request.path_params['kind']
+    if kind not in EXPORT_FORMATS:
+        raise ApiError(f"Unknown export format '{kind}'", status_code=404)
+    _, extension, mime, render = EXPORT_FORMATS[kind]
+    # Rendering is CPU-bound, so keep it off the event loop
+    data = await run_in_threadpool(render, bill)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    async def chunks():
+        view = memoryview(data)
+        for start in range(0, len(view), EXPORT_CHUNK_SIZE):
+            yield bytes(view[start:start + EXPORT_CHUNK_SIZE])
+
+    return StreamingResponse(
+        chunks(),
+        media_type=mime,
+        headers={'Content-Disposition': _attachment(f"{safe_file_name(bill.description)}.{extension}")}
+    )
+
+
+def _attachment(file_name):
+    """Returns the Content-Disposition header for a download named after a bill.
+
+    Header values are Latin-1, so ``filename`` gets an ASCII fallback and the
+    real name goes in ``filename*`` (RFC 5987).
+    """
+    fallback = file_name.encode('ascii', 'ignore').decode('ascii').strip('_')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name)}"
+
+
+def _statement_format(value):
+    file_format = value or 'pdf'
+    if file_format not in STATEMENT_RENDERERS:
+        raise ApiError(f"Unknown statement format '{file_format}'")
+    return file_format
+
+
+def _zip_response(chunks, file_name):
+    # A sync generator is iterated in a worker thread, one ZIP chunk at a time
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={'Content-Disposition': _attachment(file_name)}
+    )
+
+
+async def get_statements(request):
+    bill, _ = await _get_bill(request)
+    file_format = _statement_format(request.query_params.get('format'))
+    return _zip_response(stream_statements_zip([bill], file_format),
+                         f"{safe_file_name(bill.description)}_statements.zip")
+
+
+async def bulk_statements(request):
+    """Streams one ZIP with every participant's statement for many bills."""
+    payload = await _read_json(request)
+    bill_ids = payload.get('bill_ids') if isinstance(payload, dict) else None
+    if not _is_name_list(bill_ids) or not bill_ids:
+        raise ApiError("'bill_ids' must be a non-empty list of bill ids")
+    file_format = _statement_format(payload.get('format'))
+    missing = await run_in_threadpool(lambda: [bill_id for bill_id in bill_ids if STORE.revision(bill_id) == 0])
+    if missing:
+        raise ApiError(f"Bills not found: {', '.join(missing)}", status_code=404)
+    # Bills are loaded one at a time as the ZIP is written
+    bills = (STORE.load(bill_id)[0] for bill_id in bill_ids)
+    return _zip_response(stream_statements_zip(bills, file_format), "statements.zip")
+
+
+async def reconcile_payments(request):
+    """Checks a bank CSV for the transfers owed to one payer across many bills."""
+    payload = await _read_json(request)
+    if not isinstance(payload, dict):
+        raise ApiError("Expected a JSON object")
+    bill_ids = payload.get('bill_ids')
+    if not _is_name_list(bill_ids) or not bill_ids:
+        raise ApiError("'bill_ids' must be a non-empty list of bill ids")
+    payer = payload.get('payer')
+    if not isinstance(payer, str) or not payer:
+        raise ApiError("'payer' is required")
+    if not isinstance(payload.get('transactions_csv'), str):
+        raise ApiError("'transactions_csv' must be the bank CSV as text")
+    days_before, days_after = payload.get('days_before', 3), payload.get('days_after', 30)
+    if not all(isinstance(days, int) and not isinstance(days, bool) for days in (days_before, days_after)):
+        raise ApiError("'days_before' and 'days_after' must be whole numbers of days")
+    try:
+        transactions, skipped = await run_in_threadpool(
+            load_transactions, io.StringIO(payload['transactions_csv'], newline='')
+        )
+    except ValueError as e:
+        raise ApiError(str(e))
+
+    bills = []
+    for bill_id in bill_ids:
+        bill, _ = await run_in_threadpool(STORE.load, bill_id)
+        if bill is None:
+            raise ApiError(f"Bill not found: {bill_id}", status_code=404)
+        bills.append(bill)
+    report = await run_in_threadpool(reconcile, bills, transactions, payer, days_before, days_after)
+    report['skipped_rows'] = skipped
+    return JSONResponse(report)
+
+
+async def agree_bill(request):
+    """Records the bill's current state in the agreement ledger."""
+    bill, _ = await _get_bill(request)
+    entry = await run_in_threadpool(LEDGER.append, bill)
+    return JSONResponse(dict(entry, root=LEDGER.root()), status_code=201)
+
+
+async def get_proof(request):
+    """Checks the bill against its latest agreement, with the Merkle audit path."""
+    bill, _ = await _get_bill(request)
+    report = await run_in_threadpool(LEDGER.verify_bill, bill)
+    if report is None:
+        raise ApiError("This bill has not been agreed", status_code=404)
+    return JSONResponse(report)
+
+
+async def void_bill(request):
+    """Voids a bill, or restores it with ``{"voided": false}``, taking it out of or back into the rollups."""
+    bill, revision = await _get_bill(request)
+    payload = await _read_json(request) if await request.body() else {}
+    voided = payload.get('voided', True) if isinstance(payload, dict) else None
+    if not isinstance(voided, bool):
+        raise ApiError("'voided' must be true or false")
+    bill.set_voided(voided)
+    revision = await _save_bill(bill, revision)
+    return JSONResponse({'bill_id': bill.bill_id, 'revision': revision, 'voided': bill.voided})
+
+
+async def get_rollups(request):
+    """Per-period totals across all stored bills, read from the store's rollups."""
+    period = request.query_params.get('period', 'month')
+    if period not in PERIODS:
+        raise ApiError(f"'period' must be one of {', '.join(PERIODS)}")
+    table = await run_in_threadpool(STORE.rollups, period, request.query_params.get('start'),
+                                    request.query_params.get('end'))
+    return JSONResponse({
+        'period': period,
+        'buckets': [
+            {
+                'bucket': bucket,
+                'bills': entry['bills'],
+                'total': sum(entry['participants'].values()) / 100.0,
+                'participants': {name: cents / 100.0 for name, cents in sorted(entry['participants'].items())},
+            }
+            for bucket, entry in table.items()
+        ],
+    })
+
+
+async def handle_api_error(request, exc):
+    return JSONResponse({'error': str(exc)}, status_code=exc.status_code)
+
+
+routes = [
+    Route('/bills', create_bill, methods=['POST']),
+    Route('/bills/{bill_id}/items', add_items, methods=['POST']),
+    Route('/bills/{bill_id}/totals', get_totals, methods=['GET']),
+    Route('/bills/{bill_id}/settlement', get_settlement, methods=['GET']),
+    Route('/bills/{bill_id}/participants/{name}', get_statement, methods=['GET']),
+    Route('/bills/{bill_id}/export/{kind}', export_bill, methods=['GET']),
+    Route('/bills/{bill_id}/statements', get_statements, methods=['GET']),
+    Route('/bills/{bill_id}/agree', agree_bill, methods=['POST']),
+    Route('/bills/{bill_id}/proof', get_proof, methods=['GET']),
+    Route('/bills/{bill_id}/void', void_bill, methods=['POST']),
+    Route('/rollups', get_rollups, methods=['GET']),
+    Route('/statements', bulk_statements, methods=['POST']),
+    Route('/split', split_batch, methods=['POST']),
+    Route('/reconcile', reconcile_payments, methods=['POST']),
+]
+
+app = Starlette(routes=routes, exception_handlers={ApiError: handle_api_error})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bill Splitter HTTP API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
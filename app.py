@@ -1,22 +1,46 @@
 import streamlit as st
 import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from core.logic import (
     calculate_totals, 
     save_to_json, 
     create_bill_dataframe,
-    get_bill_as_json_string,
+    create_category_dataframe,
+    get_participant_statement,
     load_participants,
     save_participants,
     load_groups,
-    save_groups
+    save_groups,
+    resource_path
 )
 from core.models import Bill
+from core.allocation import MAX_PRICE, MAX_QUANTITY
+from core.events import EventLog
+from core.storage import decode_bill
+from core.state import create_bill_store, RevisionConflict
+from core.collab import LiveBill, create_op_log, share_changes
+from core.sessions import SessionRegistry, bill_memory_usage
+from core.search import ParticipantIndex
+from core.templates import BillTemplate, load_templates, save_templates
+from core.summaries import aggregate_summaries
+from core.rollups import PERIODS, group_rollups
+from core.reconcile import load_transactions, reconcile
+from core.ledger import MerkleLedger
+from core.exports import ExportManager, EXPORT_FORMATS
+from core.analytics import (
+    history_to_bytes,
+    load_history,
+    bills_to_long_frame,
+    spend_per_participant_over_time,
+    top_items,
+    category_spend,
+    group_spend
+)
+import json
+import os
+from datetime import date
+from functools import partial, wraps
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -722,56 +746,289 @@ def generate_custom_table_html(df):
     
     return html
 
-def generate_pdf(bill):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    title_style = styles['Title']
-    title_style.fontName = 'Helvetica-Bold'
-    elements.append(Paragraph(f"Bill: {bill.description}", title_style))
-    elements.append(Spacer(1, 12))
-
-    # Data for table
-    data = [['Item', 'Price', 'Participants']]
-    for item in bill.items:
-        data.append([
-            item['item_name'],
-            f"${item['price']:.2f}",
-            ", ".join(item['participants'])
-        ])
-    
-    # Create Table
-    if len(data) > 1:
-        t = Table(data, colWidths=[200, 100, 200])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(t)
-    else:
-        elements.append(Paragraph("No items in this bill.", styles['Normal']))
-    
-    # Total
-    elements.append(Spacer(1, 12))
-    total = sum(item['price'] for item in bill.items)
-    elements.append(Paragraph(f"Total: ${total:.2f}", styles['Heading2']))
+@st.cache_resource
+def get_export_manager():
+    return ExportManager()
 
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+@st.cache_resource
+def get_ledger():
+    return MerkleLedger.load()
 
-def reset_bill():
-    st.session_state.bill = Bill(description="New Bill")
+def request_export(export_manager, kind):
+    check_in_session()
+    export_manager.request(st.session_state.bill, kind)
+    # Redeclare the downloads fragment so it polls until the export is ready
     st.rerun()
 
+def render_downloads(export_manager, polling=False):
+    """Shows a Prepare button per export format, then its download once rendered."""
+    bill = st.session_state.bill
+    if not bill.items:
+        return
+    st.markdown('<div class="section-header"><i class="bi bi-download"></i> Download Options</div>', unsafe_allow_html=True)
+    file_stem = bill.description.replace(' ', '_')
+    for column, (kind, (label, extension, mime, _)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+        with column:
+            status = export_manager.status(bill, kind)
+            if status == 'done':
+                st.download_button(
+                    label=f"Download {label}",
+                    data=export_manager.result(bill, kind),
+                    file_name=f"{file_stem}.{extension}",
+                    mime=mime,
+                    key=f"download_{kind}",
+                )
+            elif status == 'running':
+                st.button(f"Preparing {label}...", key=f"prepare_{kind}", disabled=True)
+            else:
+                st.button(f"Prepare {label}", key=f"prepare_{kind}", on_click=request_export, args=(export_manager, kind))
+                if status == 'failed':
+                    st.error(f"Could not export {label}: {export_manager.error(bill, kind)}")
+    if polling and not any(export_manager.status(bill, kind) == 'running' for kind in EXPORT_FORMATS):
+        # Every export is ready; rerun once more to stop polling
+        st.rerun()
+
+PARTICIPANT_SEARCH_LIMIT = 50
+# Item lists show at most this many matches; filters narrow the rest down
+ITEM_QUERY_LIMIT = 200
+# Sort choice -> (sort_by, descending) for Bill.query_items
+ITEM_SORTS = {
+    "Bill order": (None, False),
+    "Price: low to high": ('price', False),
+    "Price: high to low": ('price', True),
+    "Name: A to Z": ('name', False),
+    "Name: Z to A": ('name', True),
+}
+DEFAULT_CATEGORIES = ["Groceries", "Rent", "Utilities", "Dining", "Travel"]
+# The only folder the Analytics tab totals saved summaries from
+SUMMARIES_DIR = os.environ.get("SUMMARIES_DIR") or resource_path("summaries")
+
+def category_options():
+    """Suggested categories followed by the ones already used on the bill."""
+    return list(dict.fromkeys(DEFAULT_CATEGORIES + sorted(st.session_state.bill.get_categories())))
+
+def participant_options(search_key, selected_key=None, shown=()):
+    """Returns the top matches for a participant search box, plus the names already selected.
+
+    Multiselects get these instead of the whole roster, which may hold thousands of names.
+    ``shown`` adds names that must stay valid options, such as those in an editor's cells.
+    """
+    query = st.session_state.get(search_key) or ""
+    matches = st.session_state.all_participants.search(query, PARTICIPANT_SEARCH_LIMIT)
+    selected = list(st.session_state.get(selected_key) or []) if selected_key else []
+    return list(dict.fromkeys(selected + list(shown) + matches))
+
+def sync_header_inputs():
+    # Keyed header widgets keep their own values, so push the bill's back into them
+    st.session_state.bill_title_input = st.session_state.bill.description
+    st.session_state.bill_date_input = date.fromisoformat(st.session_state.bill.date)
+
+@st.cache_resource
+def get_session_registry():
+    registry = SessionRegistry(
+        idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", 1800)),
+        spill_dir=os.environ.get("SESSION_SPILL_DIR"),
+        export_manager=get_export_manager()
+    )
+    registry.start_background_sweeps()
+    return registry
+
+def current_session_id():
+    return get_script_run_ctx().session_id
+
+def check_in_session():
+    # Callbacks run before the script body, so any callback touching the bill checks in first
+    # to reload a bill that was spilled to disk while the session was idle
+    if 'bill' in st.session_state:
+        get_session_registry().check_in(current_session_id(), st.session_state.bill)
+
+def reset_bill():
+    check_in_session()
+    st.session_state.bill.reset(description="New Bill")
+    sync_header_inputs()
+    rerun_readers('bill')
+
+def update_bill_header():
+    check_in_session()
+    st.session_state.bill.set_description(st.session_state.bill_title_input)
+    st.session_state.bill.set_date(st.session_state.bill_date_input.isoformat())
+    rerun_readers('bill')
+
+def open_bill():
+    check_in_session()
+    uploaded = st.session_state.open_bill_file
+    if uploaded is None:
+        return
+    try:
+        bill = decode_bill(uploaded.getbuffer())
+    except ValueError as e:
+        st.session_state.form_msg = f"Could not open bill file: {e}"
+        st.session_state.form_msg_type = "error"
+        return
+    EventLog.attach(bill)
+    st.session_state.bill = bill
+    # A file downloaded from this deployment names a stored bill; the opened state is saved on top of it
+    st.session_state.bill_revisions = {bill.bill_id: get_bill_store().revision(bill.bill_id)}
+    st.session_state.bill_saved_version = -1
+    # The registry tracks the opened bill from now on, not the one it replaced
+    check_in_session()
+    sync_header_inputs()
+    st.session_state.form_msg = f"Opened bill: {bill.description}"
+    st.session_state.form_msg_type = "success"
+
+@st.cache_resource
+def get_bill_store():
+    return create_bill_store()
+
+def adopt_bill(bill, revision):
+    """Makes a bill loaded from the shared store this session's bill."""
+    EventLog.attach(bill)
+    st.session_state.bill = bill
+    st.session_state.bill_revisions = {bill.bill_id: revision}
+    st.session_state.bill_saved_version = bill.version
+    sync_header_inputs()
+
+def sync_bill_state(pull=True):
+    """Saves local bill changes to the shared store and, if pull is set, loads changes made elsewhere.
+
+    Saves are optimistic: if another session saved the bill first, the
+    stored bill wins and is loaded here instead of being overwritten. A bill
+    that has been live is changed through its shared log first, so live
+    replicas saving it later keep the change.
+    """
+    store = get_bill_store()
+    bill = st.session_state.bill
+    revisions = st.session_state.bill_revisions
+    if bill.version != st.session_state.bill_saved_version:
+        if get_op_log().latest_seq(bill.bill_id):
+            stored, revision = store.load(bill.bill_id)
+            if revision == revisions.get(bill.bill_id, 0):
+                # The stored bill is what this session started from, so it tells its edits apart
+                baseline = stored.to_state() if stored is not None else None
+                st.session_state.live_baseline = share_changes(bill, get_op_log(), baseline)
+                sync_header_inputs()
+        try:
+            revisions[bill.bill_id] = store.save(bill, revisions.get(bill.bill_id, 0))
+            st.session_state.bill_saved_version = bill.version
+        except RevisionConflict:
+            if not pull:
+                # Header widgets are already drawn; resolve the conflict at the top of a fresh run
+                st.rerun()
+            adopt_bill(*store.load(bill.bill_id))
+            st.session_state.form_msg = "This bill was changed in another session. Your last change was not saved; the latest version is shown."
+            st.session_state.form_msg_type = "error"
+    elif pull and store.revision(bill.bill_id) > revisions.get(bill.bill_id, 0):
+        adopt_bill(*store.load(bill.bill_id))
+    st.query_params["bill"] = st.session_state.bill.bill_id
+
+def save_live_bill():
+    """Saves a live bill's merged state to the shared store, so sessions loading it from there see it too.
+
+    Every change to a bill that has a shared log goes through the log (see
+    sync_bill_state), so a newer stored revision holds nothing the log
+    lacks. On a conflict the replica catches up with the log, which covers
+    everything saved up to the revision read, and saves on top of that.
+    """
+    store = get_bill_store()
+    live = st.session_state.live_bill
+    revisions = st.session_state.bill_revisions
+    if live.bill.version == st.session_state.bill_saved_version:
+        return
+    while True:
+        try:
+            revisions[live.bill_id] = store.save(live.bill, revisions.get(live.bill_id, 0))
+            break
+        except RevisionConflict:
+            revision = store.revision(live.bill_id)
+            if live.sync():
+                sync_header_inputs()
+            revisions[live.bill_id] = revision
+    st.session_state.bill_saved_version = live.bill.version
+
+@st.cache_resource
+def get_op_log():
+    return create_op_log()
+
+def join_live_bill():
+    # The state the bill had when it last left tells edits made since then apart from remote ones
+    baseline = st.session_state.pop('live_baseline', None)
+    if baseline is not None and baseline['bill_id'] != st.session_state.bill.bill_id:
+        baseline = None
+    st.session_state.live_bill = LiveBill.join(st.session_state.bill, get_op_log(), baseline=baseline)
+    st.query_params["live"] = "1"
+
+def toggle_live():
+    check_in_session()
+    if st.session_state.live_toggle:
+        join_live_bill()
+        sync_header_inputs()
+    elif st.session_state.get('live_bill') is not None:
+        st.session_state.live_baseline = st.session_state.live_bill.leave()
+        st.session_state.live_bill = None
+        del st.query_params["live"]
+
+def is_live():
+    return st.session_state.get('live_bill') is not None
+
+def undo_bill():
+    check_in_session()
+    if st.session_state.bill.event_log.undo(st.session_state.bill):
+        sync_header_inputs()
+        rerun_readers('bill')
+
+def redo_bill():
+    check_in_session()
+    if st.session_state.bill.event_log.redo(st.session_state.bill):
+        sync_header_inputs()
+        rerun_readers('bill')
+
+# State each page fragment reads. Widgets inside a fragment rerun only that
+# fragment; callbacks that change shared state end with rerun_readers(), which
+# reruns exactly the fragments reading it instead of the whole page.
+FRAGMENT_READS = {
+    'header': {'bill'},
+    'add_item': {'participants', 'groups', 'message', 'bill'},
+    'receipt': {'participants', 'receipt'},
+    'edit_items': {'bill', 'participants'},
+    'remove_item': {'bill'},
+    'summary': {'bill'},
+    'statement': {'bill'},
+    'reconcile': {'bill'},
+    'ledger': {'bill'},
+    'templates': {'templates', 'bill'},
+    'downloads': {'bill'},
+    'participants': {'participants'},
+    'groups': {'participants', 'groups'},
+    'team_summary': {'participants'},
+    'analytics': {'bill', 'groups'},
+}
+
+def page_fragment(key, run_every=None):
+    """Declares a page section as a keyed fragment listed in FRAGMENT_READS."""
+    def decorator(render):
+        @wraps(render)
+        def run(*args, **kwargs):
+            # Fragment reruns skip the top of the script, so they check in here
+            check_in_session()
+            render(*args, **kwargs)
+        return st.fragment(run, key=key, run_every=run_every)
+    return decorator
+
+def save_bill_changes():
+    """Shares local bill changes: live bills push operations, and every bill is saved to the bill store."""
+    if is_live():
+        st.session_state.live_bill.push()
+        save_live_bill()
+    else:
+        sync_bill_state(pull=False)
+
+def rerun_readers(*changed):
+    """Ends a callback by rerunning only the fragments that read the changed state."""
+    if 'bill' in changed:
+        # Fragment reruns never reach the end of the script, where changes are otherwise saved
+        save_bill_changes()
+    st.rerun([key for key, reads in FRAGMENT_READS.items() if reads & set(changed)])
+
 # --- Main App Logic ---
 
 # Bootstrap Header Card
@@ -784,134 +1041,471 @@ st.markdown('''
 
 # Initialize state
 if 'bill' not in st.session_state:
-    st.session_state.bill = Bill(description="New Bill")
+    # Bills live in the shared store, so any app process can serve this session
+    shared_bill, shared_revision = None, 0
+    if "bill" in st.query_params:
+        shared_bill, shared_revision = get_bill_store().load(st.query_params["bill"])
+    if shared_bill is not None:
+        adopt_bill(shared_bill, shared_revision)
+    else:
+        # Keep the id from the link, so sessions joining a live bill share it
+        st.session_state.bill = Bill(description="New Bill", bill_id=st.query_params.get("bill"))
+        st.session_state.bill_revisions = {}
+        st.session_state.bill_saved_version = -1
 if 'all_participants' not in st.session_state:
-    st.session_state.all_participants = load_participants()
-    for name in st.session_state.all_participants:
-        st.session_state.bill.add_participant(name)
+    st.session_state.all_participants = ParticipantIndex(load_participants())
+    if st.session_state.bill_saved_version == -1:
+        for name in st.session_state.all_participants:
+            st.session_state.bill.add_participant(name)
 if 'groups' not in st.session_state:
     st.session_state.groups = load_groups()
+if 'templates' not in st.session_state:
+    st.session_state.templates = load_templates()
+check_in_session()
+if st.session_state.bill.event_log is None:
+    EventLog.attach(st.session_state.bill)
+if st.query_params.get("live") == "1" and 'live_bill' not in st.session_state:
+    join_live_bill()
+    st.session_state.live_toggle = True
+if 'bill_title_input' not in st.session_state:
+    sync_header_inputs()
+if is_live():
+    # Live bills exchange operations instead of whole-bill snapshots
+    if st.session_state.live_bill.sync():
+        sync_header_inputs()
+    save_live_bill()
+else:
+    sync_bill_state()
+
+# Top Bar: Title, Undo/Redo and New Bill Buttons
+@page_fragment('header')
+def render_header():
+    col_header_1, col_header_date, col_header_2, col_header_3, col_header_4 = st.columns([3, 1, 1, 1, 1])
+    with col_header_1:
+        st.text_input("Bill Title", key="bill_title_input", on_change=update_bill_header,
+                      label_visibility="collapsed", placeholder="Enter bill title...")
+    with col_header_date:
+        st.date_input("Bill Date", key="bill_date_input", on_change=update_bill_header, label_visibility="collapsed")
+    with col_header_2:
+        # Undo would roll back other people's changes too, so it is off for live bills
+        st.button("Undo", key="undo_btn", on_click=undo_bill, disabled=is_live() or not st.session_state.bill.event_log.can_undo())
+    with col_header_3:
+        st.button("Redo", key="redo_btn", on_click=redo_bill, disabled=is_live() or not st.session_state.bill.event_log.can_redo())
+    with col_header_4:
+        st.button("New Bill", key="new_bill_btn", on_click=reset_bill)
+
+render_header()
+
+col_live, col_open = st.columns([1, 3])
+with col_live:
+    st.toggle("Live collaboration", key="live_toggle", on_change=toggle_live,
+              help="Share this bill's link to edit it together in real time.")
+with col_open:
+    with st.expander("📂 Open Saved Bill", expanded=False):
+        st.file_uploader("Bill file", type=["bill"], key="open_bill_file", on_change=open_bill,
+                         label_visibility="collapsed", disabled=is_live())
 
-# Top Bar: New Bill Button
-col_header_1, col_header_2 = st.columns([3, 1])
-with col_header_1:
-    bill_title = st.text_input("Bill Title", value=st.session_state.bill.description, key="bill_title_input", label_visibility="collapsed", placeholder="Enter bill title...")
-    st.session_state.bill.description = bill_title
-with col_header_2:
-    if st.button("New Bill", key="new_bill_btn"):
-        reset_bill()
+if is_live():
+    @st.fragment(run_every=2)
+    def poll_live_changes():
+        # Cheap check; the full page reruns only when another session pushed operations
+        if st.session_state.live_bill.has_remote_changes():
+            st.rerun()
+    poll_live_changes()
 
-tab1, tab2 = st.tabs(["📝 Bill Entry", "👥 Participants & Groups"])
+tab1, tab2, tab3 = st.tabs(["📝 Bill Entry", "👥 Participants & Groups", "📊 Analytics"])
 
 with tab1:
+    # --- Templates ---
+    def apply_template_callback():
+        check_in_session()
+        template = st.session_state.templates[st.session_state.template_select]
+        prices = template.default_prices()
+        edited_rows = st.session_state.get(f"template_prices_{template.name}", {}).get("edited_rows", {})
+        for row_index, changes in edited_rows.items():
+            if changes.get("Price") is not None:
+                prices[int(row_index)] = changes["Price"]
+        # One vectorized split of every item instead of an add_item call per item
+        try:
+            bill = template.instantiate(prices, bill_date=date.today().isoformat())
+        except ValueError as e:
+            st.session_state.form_msg = f"Could not create the bill: {e}"
+            st.session_state.form_msg_type = "error"
+            rerun_readers('message')
+            return
+        EventLog.attach(bill)
+        st.session_state.bill = bill
+        sync_header_inputs()
+        st.session_state.form_msg = f"Created bill from template: {template.name}"
+        st.session_state.form_msg_type = "success"
+        rerun_readers('bill', 'message')
+
+    def save_template_callback():
+        check_in_session()
+        name = st.session_state.new_template_name
+        if name:
+            st.session_state.templates[name] = BillTemplate.from_bill(name, st.session_state.bill)
+            save_templates(st.session_state.templates)
+            st.session_state.new_template_name = ""
+            rerun_readers('templates')
+
+    def delete_template_callback():
+        del st.session_state.templates[st.session_state.template_select]
+        save_templates(st.session_state.templates)
+        rerun_readers('templates')
+
+    @page_fragment('templates')
+    def render_templates():
+        with st.expander("🔁 Bill Templates", expanded=False):
+            if st.session_state.templates:
+                template_name = st.selectbox("Template", list(st.session_state.templates.keys()), key="template_select")
+                template = st.session_state.templates[template_name]
+                st.data_editor(
+                    pd.DataFrame({
+                        "Item": [item['item_name'] for item in template.items],
+                        "Participants": [", ".join(item['participants']) for item in template.items],
+                        "Price": template.default_prices(),
+                    }),
+                    key=f"template_prices_{template_name}",
+                    num_rows="fixed",
+                    hide_index=True,
+                    width="stretch",
+                    disabled=["Item", "Participants"],
+                    column_config={"Price": st.column_config.NumberColumn("Price", min_value=0.0, max_value=float(MAX_PRICE),
+                                                                          format="$%.2f")},
+                )
+                c_t1, c_t2 = st.columns(2)
+                with c_t1:
+                    st.button("Create Bill from Template", key="apply_template_btn", on_click=apply_template_callback,
+                              disabled=is_live())
+                with c_t2:
+                    st.button("Delete Template", key="delete_template_btn", on_click=delete_template_callback)
+                st.markdown("---")
+            st.text_input("Template Name", key="new_template_name", placeholder="e.g., Monthly Rent")
+            st.button("Save Current Bill as Template", key="save_template_btn", on_click=save_template_callback,
+                      disabled=not st.session_state.bill.items)
+
+    render_templates()
+
     # --- Input Section ---
     st.markdown('<div class="section-header"><i class="bi bi-plus-circle"></i> Add Items</div>', unsafe_allow_html=True)
-    
+
     # Group Selection Logic
     if 'group_selector_key' not in st.session_state:
         st.session_state.group_selector_key = 0
-    
+
     def on_group_select():
         group = st.session_state[f"group_select_{st.session_state.group_selector_key}"]
         if group and group != "— Select a group to pre-fill —":
             st.session_state.participant_multiselect = st.session_state.groups[group]
-    
-    group_options = ["— Select a group to pre-fill —"] + list(st.session_state.groups.keys())
-    
-    col_input_1, col_input_2 = st.columns([1, 2])
-    
-    with col_input_1:
-         st.selectbox(
-            "Quick Select a Group", 
-            options=group_options, 
-            key=f"group_select_{st.session_state.group_selector_key}",
-            on_change=on_group_select
-        )
-    
+
     # Callback for adding item
     def add_item_callback():
+        check_in_session()
         name = st.session_state.new_item_name
         price = st.session_state.new_item_price
         participants = st.session_state.participant_multiselect
-        
-        if name and price > 0 and participants:
-            st.session_state.bill.add_item(name, price, participants)
+
+        if name and 0 < price <= MAX_PRICE and participants:
+            st.session_state.bill.add_item(name, price, participants, category=st.session_state.new_item_category)
             st.session_state.form_msg = f"Added item: {name}"
             st.session_state.form_msg_type = "success"
-            
+
             # Clear inputs manually since we aren't using clear_on_submit
             st.session_state.new_item_name = ""
             st.session_state.new_item_price = 0.0
             st.session_state.participant_multiselect = []
+            st.session_state.new_item_category = None
             st.session_state.group_selector_key += 1 # Reset group selector
+            rerun_readers('bill', 'message')
         else:
             st.session_state.form_msg = "Please fill all fields and select at least one participant."
             st.session_state.form_msg_type = "error"
 
-    # Display message if exists
-    if 'form_msg' in st.session_state and st.session_state.form_msg:
-        if st.session_state.form_msg_type == "success":
-            st.success(st.session_state.form_msg)
-        else:
-            st.error(st.session_state.form_msg)
-        # Clear message after display so it doesn't persist forever
-        st.session_state.form_msg = None
-
-    # Form
-    with st.form("add_item_form", clear_on_submit=False):
-        c1, c2 = st.columns([1, 1])
-        with c1:
-            st.text_input("Item Name", placeholder="e.g., Pizza, Drinks", key="new_item_name")
-        with c2:
-            st.number_input("Item Price", min_value=0.0, format="%.2f", key="new_item_price")
-        
-        # Participants Multiselect
-        if 'participant_multiselect' not in st.session_state:
-            st.session_state.participant_multiselect = []
+    @page_fragment('add_item')
+    def render_add_item():
+        group_options = ["— Select a group to pre-fill —"] + list(st.session_state.groups.keys())
+
+        col_input_1, col_input_2 = st.columns([1, 2])
+
+        with col_input_1:
+             st.selectbox(
+                "Quick Select a Group",
+                options=group_options,
+                key=f"group_select_{st.session_state.group_selector_key}",
+                on_change=on_group_select
+            )
+        with col_input_2:
+            # Participants are picked outside the form, so the options follow the search as you type
+            if 'participant_multiselect' not in st.session_state:
+                st.session_state.participant_multiselect = []
+            st.text_input("Find Participants", key="participant_search", placeholder="Type to search participants...")
+            st.multiselect(
+                "Select Participants for this item",
+                participant_options("participant_search", "participant_multiselect"),
+                key="participant_multiselect"
+            )
+
+        # Display message if exists
+        if 'form_msg' in st.session_state and st.session_state.form_msg:
+            if st.session_state.form_msg_type == "success":
+                st.success(st.session_state.form_msg)
+            else:
+                st.error(st.session_state.form_msg)
+            # Clear message after display so it doesn't persist forever
+            st.session_state.form_msg = None
+
+        # Form
+        with st.form("add_item_form", clear_on_submit=False):
+            c1, c2, c3 = st.columns([1, 1, 1])
+            with c1:
+                st.text_input("Item Name", placeholder="e.g., Pizza, Drinks", key="new_item_name")
+            with c2:
+                st.number_input("Item Price", min_value=0.0, max_value=float(MAX_PRICE), format="%.2f",
+                                key="new_item_price")
+            with c3:
+                st.selectbox("Category", category_options(), index=None, key="new_item_category",
+                             placeholder="Optional", accept_new_options=True)
+
+            st.form_submit_button("Add Item", on_click=add_item_callback)
+
+    render_add_item()
+
+    # --- Receipt Lines ---
+    RECEIPT_COLUMNS = ["Item", "Unit Price", "Participant", "Units"]
+
+    def add_receipt_callback(editor_key):
+        check_in_session()
+        # The editor starts empty, so every line is an added row
+        rows = st.session_state[editor_key]["added_rows"]
+        # Participants are typed in, so a misspelt name must not silently drop someone's units
+        typed = {(row.get("Participant") or "").strip() for row in rows} - {""}
+        unknown = sorted(name for name in typed if name not in st.session_state.all_participants)
+        if unknown:
+            st.session_state.form_msg = f"Not on the participant list: {', '.join(unknown)}. Add them first or fix the spelling."
+            st.session_state.form_msg_type = "error"
+            rerun_readers('message')
+            return
+        lines = {}
+        for row in rows:
+            name = (row.get("Item") or "").strip()
+            unit_price = row.get("Unit Price")
+            participant = (row.get("Participant") or "").strip()
+            units = row.get("Units")
+            if (not name or not unit_price or not 0 < unit_price <= MAX_PRICE or not participant
+                    or not units or not 0 < units <= MAX_QUANTITY):
+                continue
+            # Rows with the same item and unit price are one receipt line
+            quantities = lines.setdefault((name, unit_price), {})
+            quantities[participant] = quantities.get(participant, 0) + units
+        # A line's price is its unit price times everyone's units, which is bounded too
+        lines = {key: quantities for key, quantities in lines.items() if key[1] * sum(quantities.values()) <= MAX_PRICE}
+        if not lines:
+            st.session_state.form_msg = ("Each receipt row needs an item, a positive unit price, a participant and units, "
+                                         f"and each line can total at most ${MAX_PRICE:,}.")
+            st.session_state.form_msg_type = "error"
+            rerun_readers('message')
+            return
+        st.session_state.bill.add_items([
+            {'item_name': name, 'price': round(unit_price * sum(quantities.values()), 2), 'quantities': quantities}
+            for (name, unit_price), quantities in lines.items()
+        ])
+        st.session_state.form_msg = f"Added {len(lines)} receipt line{'s' if len(lines) != 1 else ''}."
+        st.session_state.form_msg_type = "success"
+        # A fresh editor for the next receipt
+        st.session_state.receipt_editor_version = st.session_state.get('receipt_editor_version', 0) + 1
+        rerun_readers('bill', 'message', 'receipt')
+
+    @page_fragment('receipt')
+    def render_receipt():
+        with st.expander("🧾 Add Receipt Lines", expanded=False):
+            st.caption("One row per person and item, e.g. Beer @ 6.50: Aashi 2, Esha 1. "
+                       "Each item is split by the units everyone had.")
+            editor_key = f"receipt_editor_{st.session_state.get('receipt_editor_version', 0)}"
+            st.data_editor(
+                pd.DataFrame({"Item": pd.Series(dtype=str), "Unit Price": pd.Series(dtype=float),
+                              "Participant": pd.Series(dtype=str), "Units": pd.Series(dtype=float)},
+                             columns=RECEIPT_COLUMNS),
+                key=editor_key,
+                num_rows="dynamic",
+                hide_index=True,
+                width="stretch",
+                column_config={
+                    "Unit Price": st.column_config.NumberColumn("Unit Price", min_value=0.0, max_value=float(MAX_PRICE),
+                                                                format="$%.2f"),
+                    # A text column, since the roster may hold thousands of names (checked when added)
+                    "Participant": st.column_config.TextColumn("Participant", help="A name from the participant list"),
+                    "Units": st.column_config.NumberColumn("Units", min_value=0.0, max_value=float(MAX_QUANTITY), step=0.5,
+                                                           default=1.0),
+                },
+            )
+            st.button("Add Receipt Lines", key="add_receipt_btn", on_click=add_receipt_callback, args=(editor_key,))
+
+    render_receipt()
+
+    # --- Edit Items ---
+    def edit_items_callback(editor_key):
+        check_in_session()
+        # Only the changed cells are applied, so each edit is a single update_item delta
+        edited_rows = st.session_state[editor_key]["edited_rows"]
+        # Rows are the filtered items the editor showed, not bill positions
+        rows = st.session_state.item_editor_rows
+        for row_index, changes in edited_rows.items():
+            price = changes.get("Price")
+            participants = changes.get("Participants")
+            if (price is not None and not 0 < price <= MAX_PRICE) or (participants is not None and not participants):
+                st.session_state.form_msg = f"Items need a positive price up to ${MAX_PRICE:,} and at least one participant."
+                st.session_state.form_msg_type = "error"
+                continue
+            position = st.session_state.bill.item_position(rows[int(row_index)])
+            if position is None:
+                continue
+            st.session_state.bill.update_item(
+                position,
+                item_name=changes.get("Item") or None,
+                price=price,
+                participant_names=participants,
+                # A cleared category cell removes the item's category
+                category=(changes["Category"] or "") if "Category" in changes else None
+            )
+        rerun_readers('bill', 'message')
+
+    @page_fragment('edit_items')
+    def render_edit_items():
+        bill = st.session_state.bill
+        if not bill.items:
+            return
+        with st.expander("✏️ Edit Items", expanded=False):
+            f1, f2, f3, f4, f5 = st.columns([2, 2, 1, 1, 2])
+            with f1:
+                name = st.text_input("Name contains", key="item_filter_name", placeholder="e.g., pizza")
+            with f2:
+                st.text_input("Find participant", key="item_filter_participant_search",
+                              placeholder="Type to search participants...")
+                current = st.session_state.get('item_filter_participant')
+                participant = st.selectbox(
+                    "Participant",
+                    ["Anyone"] + participant_options("item_filter_participant_search",
+                                                     shown=[current] if current not in (None, "Anyone") else []),
+                    key="item_filter_participant",
+                )
+            with f3:
+                min_price = st.number_input("Min price", min_value=0.0, value=None, format="%.2f",
+                                            key="item_filter_min_price")
+            with f4:
+                max_price = st.number_input("Max price", min_value=0.0, value=None, format="%.2f",
+                                            key="item_filter_max_price")
+            with f5:
+                sort_label = st.selectbox("Sort by", list(ITEM_SORTS), key="item_filter_sort")
+            sort_by, descending = ITEM_SORTS[sort_label]
+            filters = (name, participant, min_price, max_price, sort_label)
+
+            # The indexes keep this fast on bills with many thousands of items
+            rows = bill.query_items(
+                participant=None if participant == "Anyone" else participant,
+                min_price=min_price, max_price=max_price, name=name or None,
+                sort_by=sort_by, descending=descending, limit=ITEM_QUERY_LIMIT,
+            )
+            st.session_state.item_editor_rows = rows
+            if len(rows) < len(bill.items):
+                st.caption(f"Showing {len(rows)} of {len(bill.items)} items"
+                           + (" (filter to narrow down)" if len(rows) == ITEM_QUERY_LIMIT else ""))
+            items_df = pd.DataFrame({
+                "Item": [item['item_name'] for item in rows],
+                "Price": [item['price'] for item in rows],
+                "Category": [item.get('category') for item in rows],
+                "Participants": [item['participants'] for item in rows],
+            })
+            # A fresh key per bill version and filter keeps the editor's diff relative to the rows shown
+            editor_key = f"item_editor_{bill.version}_{hash(filters)}"
+            st.data_editor(
+                items_df,
+                key=editor_key,
+                on_change=edit_items_callback,
+                args=(editor_key,),
+                num_rows="fixed",
+                hide_index=True,
+                width="stretch",
+                column_config={
+                    "Price": st.column_config.NumberColumn("Price", min_value=0.0, max_value=float(MAX_PRICE),
+                                                           format="$%.2f"),
+                    "Category": st.column_config.TextColumn("Category"),
+                    # The rows' own names plus the top matches, never the whole roster
+                    "Participants": st.column_config.MultiselectColumn(
+                        "Participants",
+                        options=participant_options("item_filter_participant_search",
+                                                    shown=[name for item in rows for name in item['participants']])
+                    ),
+                }
+            )
+
+    render_edit_items()
 
-        st.multiselect(
-            "Select Participants for this item",
-            st.session_state.all_participants,
-            key="participant_multiselect"
-        )
-        
-        st.form_submit_button("Add Item", on_click=add_item_callback)
-    
     # --- Remove Items ---
-    if st.session_state.bill.items:
+    def remove_item_callback():
+        check_in_session()
+        choice = st.session_state.item_to_remove
+        if choice is not None:
+            # Removed by identity, so an earlier item with the same name stays
+            position = st.session_state.bill.item_position(st.session_state.item_remove_matches[choice])
+            if position is not None:
+                st.session_state.bill.remove_item_at(position)
+        rerun_readers('bill')
+
+    @page_fragment('remove_item')
+    def render_remove_item():
+        bill = st.session_state.bill
+        if not bill.items:
+            return
         with st.expander("🗑️ Remove an Item", expanded=False):
-            item_names = [item['item_name'] for item in st.session_state.bill.items]
-            item_to_remove = st.selectbox("Select item to remove", options=item_names)
-            if st.button("Remove Selected Item", key="remove_item_btn"):
-                st.session_state.bill.remove_item(item_to_remove)
-                st.success(f"Removed item: {item_to_remove}")
-                st.rerun()
+            search = st.text_input("Find item", key="item_to_remove_search", placeholder="Type to search items...")
+            matches = bill.query_items(name=search or None, limit=ITEM_QUERY_LIMIT)
+            st.session_state.item_remove_matches = matches
+            st.selectbox(
+                "Select item to remove",
+                options=range(len(matches)),
+                format_func=lambda i: f"{matches[i]['item_name']} (${matches[i]['price']:.2f})",
+                key="item_to_remove",
+            )
+            st.button("Remove Selected Item", key="remove_item_btn", on_click=remove_item_callback)
+
+    render_remove_item()
 
     # --- Table Section (Full Width) ---
-    st.markdown("---")
-    st.markdown(f'''
-    <div class="section-header">
-        <i class="bi bi-table"></i> {st.session_state.bill.description}
-    </div>
-    ''', unsafe_allow_html=True)
-    
-    if st.session_state.bill.items:
+    @page_fragment('summary')
+    def render_summary():
+        st.markdown("---")
+        st.markdown(f'''
+        <div class="section-header">
+            <i class="bi bi-table"></i> {st.session_state.bill.description}
+        </div>
+        ''', unsafe_allow_html=True)
+
+        if not st.session_state.bill.items:
+            st.markdown('''
+            <div class="alert-custom alert-info-custom">
+                <i class="bi bi-info-circle me-2"></i>
+                No items added to the bill yet. Add items above to see the breakdown here.
+            </div>
+            ''', unsafe_allow_html=True)
+            return
+
         summary_df = create_bill_dataframe(st.session_state.bill)
-        
+
         # Column Visibility
         participant_cols = [c for c in summary_df.columns if c != 'Total Price']
-        
+
         cols_to_show = st.multiselect("Show/Hide Participants", participant_cols, default=participant_cols, key="column_visibility")
-        
+
         if not summary_df.empty:
             # Filter columns: Total Price + Selected Participants
             final_cols = ['Total Price'] + cols_to_show
             df_to_show = summary_df[final_cols].round(2)
-            
+
             # Render custom HTML table
             table_html = generate_custom_table_html(df_to_show)
             st.markdown(table_html, unsafe_allow_html=True)
-            
+
             # Totals with custom card
             if 'Total Price' in summary_df.columns:
                 total_bill = summary_df.loc['Total', 'Total Price']
@@ -923,102 +1517,387 @@ with tab1:
                     <div class="total-amount">${total_bill:,.2f}</div>
                 </div>
                 ''', unsafe_allow_html=True)
-            
-            # Downloads
-            st.markdown('<div class="section-header"><i class="bi bi-download"></i> Download Options</div>', unsafe_allow_html=True)
-            c_d1, c_d2 = st.columns(2)
-            with c_d1:
-                json_string = get_bill_as_json_string(st.session_state.bill)
-                st.download_button(
-                    label="Download JSON",
-                    data=json_string,
-                    file_name=f"{st.session_state.bill.description.replace(' ', '_')}.json",
-                    mime="application/json",
-                )
-            with c_d2:
-                pdf_data = generate_pdf(st.session_state.bill)
-                st.download_button(
-                    label="Download PDF",
-                    data=pdf_data,
-                    file_name=f"{st.session_state.bill.description.replace(' ', '_')}.pdf",
-                    mime="application/pdf",
-                )
-    else:
-        st.markdown('''
-        <div class="alert-custom alert-info-custom">
-            <i class="bi bi-info-circle me-2"></i>
-            No items added to the bill yet. Add items above to see the breakdown here.
+
+            # Category breakdown, read from the rollups the bill keeps up to date
+            if st.session_state.bill.get_categories():
+                st.markdown("##### By Category")
+                category_df = create_category_dataframe(st.session_state.bill)[cols_to_show + ['Total']]
+                st.dataframe(category_df.style.format("${:,.2f}"), width="stretch")
+
+    render_summary()
+
+    # --- Per-Person View ---
+    @page_fragment('statement')
+    def render_statement():
+        names = sorted(st.session_state.bill.get_item_participants())
+        if not names:
+            return
+        st.markdown('<div class="section-header"><i class="bi bi-person-lines-fill"></i> What Do I Owe?</div>', unsafe_allow_html=True)
+        name = st.selectbox("Participant", names, key="statement_participant")
+        statement = get_participant_statement(st.session_state.bill, name)
+        statement_df = pd.DataFrame(statement['items']).rename(columns={
+            'item_name': "Item", 'price': "Price", 'shared_with': "Shared With",
+            'share': "Share", 'running_total': "Running Total",
+        })
+        st.dataframe(
+            statement_df.style.format({"Price": "${:,.2f}", "Share": "${:,.2f}", "Running Total": "${:,.2f}"}),
+            hide_index=True,
+            width="stretch"
+        )
+        st.markdown(f'''
+        <div class="total-card">
+            <div class="total-label">
+                <i class="bi bi-wallet2 me-2"></i>{name} Owes
+            </div>
+            <div class="total-amount">${statement['total']:,.2f}</div>
         </div>
         ''', unsafe_allow_html=True)
 
+    render_statement()
+
+    # --- Payment Reconciliation ---
+    @page_fragment('reconcile')
+    def render_reconcile():
+        names = sorted(st.session_state.bill.get_item_participants())
+        if not names:
+            return
+        with st.expander("🏦 Check Payments Against a Bank Statement", expanded=False):
+            st.caption("Upload your bank transactions as CSV with date, name and amount columns. "
+                       "Add saved bills to check several at once.")
+            payer = st.selectbox("Paid by", names, key="reconcile_payer")
+            bank_file = st.file_uploader("Bank statement", type=["csv"], key="reconcile_csv")
+            bill_files = st.file_uploader("More bills", type=["bill"], accept_multiple_files=True,
+                                          key="reconcile_bills")
+            days_after = st.number_input("Days allowed after each bill", min_value=0, value=30, step=1,
+                                         key="reconcile_days")
+            if bank_file is None:
+                return
+
+            bills = [st.session_state.bill]
+            for bill_file in bill_files or []:
+                try:
+                    bills.append(decode_bill(bill_file.getbuffer()))
+                except ValueError as e:
+                    # decode_bill reports every malformed or truncated file as a ValueError
+                    st.warning(f"Skipped {bill_file.name}: {e}")
+            try:
+                transactions, skipped = load_transactions(BytesIO(bank_file.getvalue()))
+            except ValueError as e:
+                st.error(f"Could not read bank statement: {e}")
+                return
+            report = reconcile(bills, transactions, payer, days_after=int(days_after))
+
+            counts = report['summary']
+            col_paid, col_partial, col_unmatched = st.columns(3)
+            col_paid.metric("Paid", counts['paid'])
+            col_partial.metric("Partly Paid", counts['partial'])
+            col_unmatched.metric("Not Found", counts['unmatched'])
+            if skipped:
+                st.caption(f"{skipped} rows without a readable date or amount were skipped.")
+            if report['settlements']:
+                settlements_df = pd.DataFrame(report['settlements'])[
+                    ['bill', 'bill_date', 'from', 'owed', 'paid', 'status']
+                ].rename(columns={'bill': "Bill", 'bill_date': "Date", 'from': "From",
+                                  'owed': "Owed", 'paid': "Paid", 'status': "Status"})
+                st.dataframe(settlements_df.style.format({"Owed": "${:,.2f}", "Paid": "${:,.2f}"}),
+                             hide_index=True, width="stretch")
+
+    render_reconcile()
+
+    # --- Agreement Ledger ---
+    def agree_bill_callback():
+        check_in_session()
+        get_ledger().append(st.session_state.bill)
+
+    @page_fragment('ledger')
+    def render_ledger():
+        bill = st.session_state.bill
+        if not bill.items:
+            return
+        ledger_expander = st.expander("🔏 Agreement Ledger", expanded=False, key="ledger_expander", on_change="rerun")
+        # Checking the bill hashes all of it, so only an open expander pays for it, once per bill version
+        if not ledger_expander.open:
+            return
+        with ledger_expander:
+            ledger = get_ledger()
+            digest = get_export_manager().content_digest(bill)
+            report = ledger.verify_bill(bill, digest)
+            if report is None:
+                st.info("This bill hasn't been agreed yet. Record it once everyone has signed off.")
+            elif report['unchanged'] and report['in_ledger']:
+                st.success(f"Unchanged since it was agreed on {report['entry']['agreed_at']}.")
+            else:
+                st.warning(f"Changed since it was agreed on {report['entry']['agreed_at']}.")
+            st.button("Record Agreement", key="agree_bill_btn", on_click=agree_bill_callback,
+                      disabled=report is not None and report['unchanged'])
+            st.caption("Content digest")
+            st.code(digest, language=None)
+            if report is not None:
+                st.caption(f"Ledger root, {len(ledger)} agreements; "
+                           f"this bill's proof is {len(report['proof'])} hashes")
+                st.code(report['root'], language=None)
+
+            # Exported JSON summaries carry the digest of the bill they were made from
+            exported = st.file_uploader("Check an exported JSON summary", type=["json"], key="ledger_json")
+            if exported is not None:
+                try:
+                    summary = json.loads(exported.getvalue())
+                    exported_report = ledger.verify(summary['bill_id'], summary['content_digest'])
+                except (ValueError, KeyError, TypeError):
+                    st.error("This file has no bill digest to check.")
+                    return
+                if exported_report is None:
+                    st.warning("That bill was never agreed.")
+                elif exported_report['unchanged'] and exported_report['in_ledger']:
+                    st.success(f"Matches the agreement of {exported_report['entry']['agreed_at']}.")
+                else:
+                    st.error("Does not match the bill as agreed.")
+
+    render_ledger()
+
+    # Downloads
+    export_manager = get_export_manager()
+    pending = any(export_manager.status(st.session_state.bill, kind) == 'running' for kind in EXPORT_FORMATS)
+    # Poll only while an export is rendering; otherwise this section costs nothing per rerun
+    page_fragment('downloads', run_every=1 if pending else None)(render_downloads)(export_manager, polling=pending)
+
 with tab2:
     st.markdown('<div class="section-header"><i class="bi bi-gear"></i> Manage Your Team</div>', unsafe_allow_html=True)
-    
-    col_p, col_g = st.columns(2)
-    with col_p:
+
+    def add_participant_callback():
+        check_in_session()
+        new_p = st.session_state.new_p_input
+        if new_p and new_p not in st.session_state.all_participants:
+            st.session_state.all_participants.add(new_p)
+            st.session_state.bill.add_participant(new_p)
+            save_participants(st.session_state.all_participants)
+            rerun_readers('participants', 'bill')
+
+    def remove_participants_callback():
+        for p in st.session_state.remove_participants_select:
+            st.session_state.all_participants.remove(p)
+        st.session_state.remove_participants_select = []
+        save_participants(st.session_state.all_participants)
+        rerun_readers('participants')
+
+    def create_group_callback():
+        g_name = st.session_state.new_group_name
+        g_mems = st.session_state.group_members
+        if g_name and g_mems:
+            st.session_state.groups[g_name] = g_mems
+            save_groups(st.session_state.groups)
+            rerun_readers('groups')
+
+    def delete_group_callback():
+        del st.session_state.groups[st.session_state.delete_group_select]
+        save_groups(st.session_state.groups)
+        rerun_readers('groups')
+
+    @page_fragment('participants')
+    def render_participants():
         st.markdown('''
         <div class="bs-card">
             <div class="bs-card-header"><i class="bi bi-person-plus me-2"></i>Participants</div>
         </div>
         ''', unsafe_allow_html=True)
-        new_p = st.text_input("Add New Participant", key="new_p_input", placeholder="Enter name")
-        if st.button("Add Participant", key="add_participant_btn"):
-            if new_p and new_p not in st.session_state.all_participants:
-                st.session_state.all_participants.append(new_p)
-                st.session_state.bill.add_participant(new_p)
-                save_participants(st.session_state.all_participants)
-                st.success(f"Added {new_p}")
-                st.rerun()
-        
+        st.text_input("Add New Participant", key="new_p_input", placeholder="Enter name")
+        st.button("Add Participant", key="add_participant_btn", on_click=add_participant_callback)
+
         if st.session_state.all_participants:
             st.markdown("##### Remove Participants")
-            rem_p = st.multiselect("Select participants to remove", st.session_state.all_participants)
-            if st.button("Remove Selected", key="remove_participants_btn"):
-                for p in rem_p:
-                    if p in st.session_state.all_participants:
-                        st.session_state.all_participants.remove(p)
-                save_participants(st.session_state.all_participants)
-                st.rerun()
+            st.text_input("Find participants to remove", key="remove_participants_search", placeholder="Type to search...")
+            st.multiselect("Select participants to remove",
+                           participant_options("remove_participants_search", "remove_participants_select"),
+                           key="remove_participants_select")
+            st.button("Remove Selected", key="remove_participants_btn", on_click=remove_participants_callback)
 
-    with col_g:
+    @page_fragment('groups')
+    def render_groups():
         st.markdown('''
         <div class="bs-card">
             <div class="bs-card-header"><i class="bi bi-people me-2"></i>Groups</div>
         </div>
         ''', unsafe_allow_html=True)
-        g_name = st.text_input("New Group Name", placeholder="e.g., Family")
-        g_mems = st.multiselect("Select members", st.session_state.all_participants, key="group_members")
-        if st.button("Create Group", key="create_group_btn"):
-            if g_name and g_mems:
-                st.session_state.groups[g_name] = g_mems
-                save_groups(st.session_state.groups)
-                st.success(f"Group '{g_name}' created.")
-                st.rerun()
-        
+        st.text_input("New Group Name", placeholder="e.g., Family", key="new_group_name")
+        st.text_input("Find members", key="group_members_search", placeholder="Type to search...")
+        st.multiselect("Select members", participant_options("group_members_search", "group_members"), key="group_members")
+        st.button("Create Group", key="create_group_btn", on_click=create_group_callback)
+
         if st.session_state.groups:
             st.markdown("##### Delete Groups")
-            del_g = st.selectbox("Select group to delete", list(st.session_state.groups.keys()))
-            if st.button("Delete Group", key="delete_group_btn"):
-                del st.session_state.groups[del_g]
-                save_groups(st.session_state.groups)
-                st.rerun()
+            st.selectbox("Select group to delete", list(st.session_state.groups.keys()), key="delete_group_select")
+            st.button("Delete Group", key="delete_group_btn", on_click=delete_group_callback)
+
+    col_p, col_g = st.columns(2)
+    with col_p:
+        render_participants()
+    with col_g:
+        render_groups()
 
     # Summary with Bootstrap badges
-    st.markdown("---")
-    if st.session_state.all_participants:
-        participant_badges = ' '.join([f'<span class="participant-badge">{p}</span>' for p in st.session_state.all_participants])
-        st.markdown(f'''
-        <div class="bs-card">
-            <strong>Current Participants:</strong>
-            <div class="participant-list">
-                {participant_badges}
+    @page_fragment('team_summary')
+    def render_team_summary():
+        st.markdown("---")
+        if st.session_state.all_participants:
+            # Large rosters show only their first names here; the search boxes reach the rest
+            shown = st.session_state.all_participants.search("", PARTICIPANT_SEARCH_LIMIT)
+            participant_badges = ' '.join([f'<span class="participant-badge">{p}</span>' for p in shown])
+            hidden = len(st.session_state.all_participants) - len(shown)
+            if hidden:
+                participant_badges += f' <span class="participant-badge">+{hidden} more</span>'
+            st.markdown(f'''
+            <div class="bs-card">
+                <strong>Current Participants:</strong>
+                <div class="participant-list">
+                    {participant_badges}
+                </div>
             </div>
-        </div>
-        ''', unsafe_allow_html=True)
-    else:
-        st.markdown('''
-        <div class="alert-custom alert-info-custom">
-            <i class="bi bi-info-circle me-2"></i>
-            No participants added yet. Add participants above to get started.
-        </div>
-        ''', unsafe_allow_html=True)
\ No newline at end of file
+            ''', unsafe_allow_html=True)
+        else:
+            st.markdown('''
+            <div class="alert-custom alert-info-custom">
+                <i class="bi bi-info-circle me-2"></i>
+                No participants added yet. Add participants above to get started.
+            </div>
+            ''', unsafe_allow_html=True)
+
+    render_team_summary()
+
+with tab3:
+    def toggle_void_bill():
+        check_in_session()
+        st.session_state.bill.set_voided(not st.session_state.bill.voided)
+        rerun_readers('bill')
+
+    @page_fragment('analytics')
+    def render_analytics():
+        st.markdown('<div class="section-header"><i class="bi bi-graph-up"></i> Spending History</div>', unsafe_allow_html=True)
+        history_files = st.file_uploader(
+            "Load bill history (Parquet or Arrow exports)",
+            type=["parquet", "arrow", "feather"],
+            accept_multiple_files=True,
+            key="history_files"
+        )
+        include_current = st.checkbox("Include the current bill", value=True, key="history_include_current")
+
+        frames = []
+        if history_files:
+            frames.append(load_history(history_files))
+        if include_current and st.session_state.bill.items:
+            frames.append(bills_to_long_frame([st.session_state.bill]))
+
+        if frames:
+            history = pd.concat(frames, ignore_index=True).drop_duplicates(
+                subset=['bill_id', 'item_index', 'participant'], keep='last'
+            )
+            c_h1, c_h2 = st.columns([1, 3])
+            with c_h1:
+                freq = st.selectbox("Period", options=["W", "M", "Y"], index=1,
+                                    format_func=lambda f: {"W": "Week", "M": "Month", "Y": "Year"}[f],
+                                    key="history_period")
+                st.metric("Bills", history['bill_id'].nunique())
+            with c_h2:
+                over_time = spend_per_participant_over_time(history, freq=freq)
+                st.bar_chart(over_time)
+
+            st.markdown("##### Spend per Participant")
+            st.dataframe(over_time.style.format("${:,.2f}"), width="stretch")
+
+            c_h3, c_h4 = st.columns(2)
+            with c_h3:
+                st.markdown("##### Top Items")
+                st.dataframe(top_items(history).style.format({"total": "${:,.2f}"}), width="stretch")
+            with c_h4:
+                st.markdown("##### Group Spend")
+                if st.session_state.groups:
+                    st.dataframe(group_spend(history, st.session_state.groups).to_frame("total").style.format("${:,.2f}"), width="stretch")
+                else:
+                    st.caption("No groups defined yet.")
+
+            st.markdown("##### Spend per Category")
+            st.dataframe(category_spend(history).style.format("${:,.2f}"), width="stretch")
+
+            st.download_button(
+                label="Download Combined History (Parquet)",
+                # Rendered only when clicked, not on every rerun
+                data=partial(history_to_bytes, history, 'parquet'),
+                file_name="bill_history.parquet",
+                mime="application/vnd.apache.parquet",
+            )
+        else:
+            st.markdown('''
+            <div class="alert-custom alert-info-custom">
+                <i class="bi bi-info-circle me-2"></i>
+                Upload Parquet or Arrow exports, or add items to the current bill, to see analytics here.
+            </div>
+            ''', unsafe_allow_html=True)
+
+        with st.expander("📅 Saved Bills by Period", expanded=False):
+            st.caption("What everyone owes across all saved bills, totalled as bills are saved; voided bills don't count.")
+            c_r1, c_r2 = st.columns([1, 3])
+            with c_r1:
+                rollup_period = st.selectbox("Period", options=list(PERIODS), index=1, format_func=str.title,
+                                             key="rollup_period")
+                if st.session_state.bill.voided:
+                    st.warning("This bill is voided.")
+                st.button("Restore This Bill" if st.session_state.bill.voided else "Void This Bill",
+                          key="void_bill_btn", on_click=toggle_void_bill)
+            # Read from the store's precomputed rollups; no saved bill is loaded
+            rollups = get_bill_store().rollups(rollup_period)
+            if rollups:
+                owed = pd.DataFrame.from_dict(
+                    {bucket: entry['participants'] for bucket, entry in rollups.items()}, orient='index'
+                ).fillna(0).sort_index(axis=1) / 100.0
+                owed.index.name = rollup_period
+                with c_r1:
+                    st.metric("Bills", sum(entry['bills'] for entry in rollups.values()))
+                with c_r2:
+                    st.bar_chart(owed)
+                st.dataframe(owed.style.format("${:,.2f}"), width="stretch")
+                if st.session_state.groups:
+                    st.markdown("##### Group Spend per Period")
+                    by_group = pd.DataFrame.from_dict(group_rollups(rollups, st.session_state.groups), orient='index') / 100.0
+                    st.dataframe(by_group.style.format("${:,.2f}"), width="stretch")
+            else:
+                with c_r2:
+                    st.caption("No saved bills with items yet.")
+
+        with st.expander("🗄️ Summarize Saved Summaries", expanded=False):
+            # Only the server's summaries folder is read; visitors never choose a path
+            st.caption(f"Totals the JSON bill summaries saved in `{SUMMARIES_DIR}` per participant and group, "
+                       "a batch at a time, however many there are.")
+            if st.button("Summarize", key="summarize_btn", disabled=not os.path.isdir(SUMMARIES_DIR)):
+                st.session_state.summary_totals = aggregate_summaries(
+                    [SUMMARIES_DIR], groups=st.session_state.groups, workers=min(os.cpu_count() or 1, 4)
+                ).to_dict()
+            totals = st.session_state.get('summary_totals')
+            if totals:
+                c_s1, c_s2, c_s3 = st.columns(3)
+                c_s1.metric("Bills", totals['bills'])
+                c_s2.metric("Total", f"${totals['total']:,.2f}")
+                c_s3.metric("Unreadable Files", totals['skipped'])
+                c_s4, c_s5 = st.columns(2)
+                with c_s4:
+                    st.dataframe(pd.Series(totals['participants'], name="owed").to_frame().style.format("${:,.2f}"), width="stretch")
+                with c_s5:
+                    st.dataframe(pd.Series(totals['groups'], name="owed", dtype=float).to_frame().style.format("${:,.2f}"), width="stretch")
+
+        with st.expander("🧠 Session Memory", expanded=False):
+            usage = bill_memory_usage(st.session_state.bill)
+            export_bytes = get_export_manager().memory_usage(st.session_state.bill.bill_id)
+            c_m1, c_m2, c_m3 = st.columns(3)
+            c_m1.metric("Bill", f"{usage['bill'] / 1024:,.1f} KB")
+            c_m2.metric("Undo History", f"{usage['history'] / 1024:,.1f} KB")
+            c_m3.metric("Cached Exports", f"{export_bytes / 1024:,.1f} KB")
+            registry = get_session_registry()
+            st.caption(f"Sessions idle for {registry.idle_ttl / 60:.0f} minutes are saved to disk and reloaded when they return.")
+            # Other sessions' ids and usage are only shown to operators who turn the report on
+            show_all = os.environ.get("SESSION_MEMORY_REPORT") == "1"
+            report = registry.memory_report(None if show_all else current_session_id())
+            st.dataframe(pd.DataFrame(report), hide_index=True, width="stretch")
+
+    render_analytics()
+
+# Save changes made while drawing the page (title, date, participants)
+save_bill_changes()
+get_session_registry().check_out(current_session_id())
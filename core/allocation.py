@@ -0,0 +1,98 @@
+import numpy as np
+
+# Quantities are split to the thousandth of a unit
+QUANTITY_SCALE = 1000
+
+# Largest price and units per participant accepted as input. Cents times
+# quantity weights then stay far inside the int64 range allocate_cents uses.
+MAX_PRICE = 1_000_000
+MAX_QUANTITY = 1_000_000
+
+
+def quantity_weight(quantity):
+    """Integer weight of a consumed quantity; any positive quantity weighs at least one."""
+    return max(1, int(round(quantity * QUANTITY_SCALE)))
+
+
+def split_quantities_in_cents(price, quantities):
+    """Splits a price into integer-cent shares in proportion to each participant's quantity.
+
+    Everyone gets the floor of their exact share, then the cents left over go
+    one each to the largest remainders, earlier participants first on a tie.
+    Equal quantities therefore split exactly like split_price_in_cents.
+    """
+    names = list(quantities)
+    weights = [quantity_weight(quantities[name]) for name in names]
+    total = sum(weights)
+    if not total:
+        return {}
+    price_in_cents = int(round(price * 100))
+    shares = {}
+    remainders = []
+    for position, (name, weight) in enumerate(zip(names, weights)):
+        shares[name], remainder = divmod(price_in_cents * weight, total)
+        remainders.append((-remainder, position, name))
+    for _, _, name in sorted(remainders)[:price_in_cents - sum(shares.values())]:
+        shares[name] += 1
+    return shares
+
+
+def allocate_cents(cents, weights, sizes):
+    """Vectorized largest-remainder split of many items' cents at once.
+
+    ``sizes`` holds the number of slots per item and ``weights`` one integer
+    weight per slot, grouped by item in order. Returns every slot's share in
+    cents, the same as split_quantities_in_cents gives item by item.
+    """
+    cents = np.asarray(cents, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.int64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    item_of = np.repeat(np.arange(len(sizes)), sizes)
+    starts = np.cumsum(sizes) - sizes
+    ends = starts + sizes
+
+    # Per-item sums from prefix sums, which stay exact and handle items without slots
+    cumulative = np.concatenate(([0], np.cumsum(weights)))
+    totals = (cumulative[ends] - cumulative[starts])[item_of]
+    scaled = cents[item_of] * weights
+    base = scaled // totals
+    remainder = scaled % totals
+    cumulative = np.concatenate(([0], np.cumsum(base)))
+    left = cents - (cumulative[ends] - cumulative[starts])
+
+    # Rank the slots of each item by remainder, largest first and earlier slots first on a tie
+    order = np.lexsort((np.arange(len(weights)), -remainder, item_of))
+    rank = np.empty(len(weights), dtype=np.int64)
+    rank[order] = np.arange(len(weights)) - starts[item_of[order]]
+    return base + (rank < left[item_of])
+
+
+def allocate_item_shares(items):
+    """Splits a list of bill items in one vectorized pass.
+
+    Returns each item's ``{participant: cents}``, identical to splitting the
+    items one at a time: items with ``quantities`` are split by quantity and
+    the others evenly (a name listed twice keeps its last share).
+    """
+    names, quantities, sizes, cents = [], [], [], []
+    for item in items:
+        start = len(names)
+        item_quantities = item.get('quantities')
+        if item_quantities:
+            names.extend(item_quantities)
+            quantities.extend(item_quantities.values())
+        else:
+            # Equal quantities split evenly
+            names.extend(item['participants'])
+            quantities.extend([1] * len(item['participants']))
+        sizes.append(len(names) - start)
+        cents.append(int(round(item['price'] * 100)))
+    # quantity_weight() for every slot at once
+    weights = np.maximum(1, np.rint(np.asarray(quantities, dtype=np.float64) * QUANTITY_SCALE)).astype(np.int64)
+    shares = allocate_cents(cents, weights, sizes).tolist()
+    result = []
+    start = 0
+    for size in sizes:
+        result.append(dict(zip(names[start:start + size], shares[start:start + size])))
+        start += size
+    return result
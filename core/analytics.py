@@ -0,0 +1,146 @@
+from io import BytesIO
+
+import pandas as pd
+from .models import Bill, UNCATEGORIZED
+from .allocation import allocate_item_shares
+
+# Long format: one row per (bill, item, participant) split
+LONG_COLUMNS = [
+    'bill_id', 'bill_date', 'bill_title',
+    'item_index', 'item_name', 'item_category', 'item_price',
+    'participant', 'share_cents',
+]
+
+
+def bill_to_long_frame(bill: Bill):
+    """Flattens a bill into long-format columns with one row per participant split."""
+    columns = {name: [] for name in LONG_COLUMNS}
+    for index, (item, shares) in enumerate(zip(bill.items, allocate_item_shares(bill.items))):
+        for participant, cents in shares.items():
+            columns['item_index'].append(index)
+            columns['item_name'].append(item['item_name'])
+            columns['item_category'].append(item.get('category') or UNCATEGORIZED)
+            columns['item_price'].append(item['price'])
+            columns['participant'].append(participant)
+            columns['share_cents'].append(cents)
+
+    rows = len(columns['item_index'])
+    columns['bill_id'] = [bill.bill_id] * rows
+    columns['bill_date'] = [bill.date] * rows
+    columns['bill_title'] = [bill.description] * rows
+
+    df = pd.DataFrame(columns, columns=LONG_COLUMNS)
+    df['bill_date'] = pd.to_datetime(df['bill_date'])
+    df['item_index'] = df['item_index'].astype('int64')
+    df['item_price'] = df['item_price'].astype('float64')
+    df['share_cents'] = df['share_cents'].astype('int64')
+    return df
+
+
+def bills_to_long_frame(bills):
+    """Concatenates the long-format frames of several bills into one history."""
+    frames = [bill_to_long_frame(bill) for bill in bills]
+    if not frames:
+        return bill_to_long_frame(Bill(""))
+    return pd.concat(frames, ignore_index=True)
+
+
+def history_to_bytes(history, file_format='parquet'):
+    """Serializes a long-format history frame as Parquet or Arrow IPC (Feather) bytes."""
+    buffer = BytesIO()
+    if file_format == 'arrow':
+        history.reset_index(drop=True).to_feather(buffer)
+    else:
+        history.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def export_parquet(bills, destination=None):
+    """Writes bills as a long-format Parquet table. Returns bytes if no destination is given."""
+    df = bills_to_long_frame(bills)
+    if destination is None:
+        return history_to_bytes(df, 'parquet')
+    df.to_parquet(destination, index=False)
+
+
+def export_arrow(bills, destination=None):
+    """Writes bills as a long-format Arrow IPC (Feather) file. Returns bytes if no destination is given."""
+    df = bills_to_long_frame(bills)
+    if destination is None:
+        return history_to_bytes(df, 'arrow')
+    df.to_feather(destination)
+
+
+def _is_arrow_file(source):
+    """Tells Arrow IPC files (magic b"ARROW1") apart from Parquet (magic b"PAR1")."""
+    if hasattr(source, 'read'):
+        position = source.tell()
+        magic = source.read(6)
+        source.seek(position)
+    else:
+        with open(source, 'rb') as f:
+            magic = f.read(6)
+    return magic == b"ARROW1"
+
+
+def load_history(sources):
+    """Reads and concatenates long-format Parquet or Arrow exports.
+
+    Rows of a bill that appears in more than one source are kept only once.
+    """
+    frames = []
+    for source in sources:
+        if _is_arrow_file(source):
+            frames.append(pd.read_feather(source))
+        else:
+            frames.append(pd.read_parquet(source))
+    if not frames:
+        return bills_to_long_frame([])
+    history = pd.concat(frames, ignore_index=True)
+    # Exports made before items had categories have no category column
+    if 'item_category' not in history:
+        history['item_category'] = UNCATEGORIZED
+    history['item_category'] = history['item_category'].fillna(UNCATEGORIZED)
+    return history.drop_duplicates(subset=['bill_id', 'item_index', 'participant'], keep='last')
+
+
+def spend_per_participant_over_time(history, freq='M'):
+    """Returns a period x participant table of amounts owed, in dollars."""
+    periods = history['bill_date'].dt.to_period(freq)
+    table = (
+        history.groupby([periods, 'participant'])['share_cents'].sum()
+        .unstack('participant', fill_value=0)
+        .sort_index()
+    )
+    table.index = table.index.astype(str)
+    table.index.name = 'period'
+    return table / 100.0
+
+
+def top_items(history, n=10):
+    """Returns the n item names with the highest total spend across the history."""
+    by_item = history.groupby('item_name').agg(
+        total_cents=('share_cents', 'sum'),
+        bills=('bill_id', 'nunique'),
+    )
+    by_item = by_item.nlargest(n, 'total_cents')
+    by_item['total'] = by_item.pop('total_cents') / 100.0
+    return by_item[['total', 'bills']]
+
+
+def category_spend(history):
+    """Returns a category x participant table of amounts owed, in dollars."""
+    table = history.groupby(['item_category', 'participant'])['share_cents'].sum().unstack('participant', fill_value=0)
+    return table / 100.0
+
+
+def group_spend(history, groups):
+    """Returns the total owed by the members of each group, in dollars."""
+    membership = pd.DataFrame(
+        [(group, member) for group, members in groups.items() for member in members],
+        columns=['group', 'participant']
+    )
+    per_participant = history.groupby('participant', as_index=False)['share_cents'].sum()
+    merged = membership.merge(per_participant, on='participant', how='left').fillna({'share_cents': 0})
+    totals = merged.groupby('group')['share_cents'].sum().sort_values(ascending=False)
+    return totals / 100.0
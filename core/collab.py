@@ -0,0 +1,517 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from contextlib import contextmanager
+
+from .logic import resource_path
+
+# Item fields that can be edited concurrently, mapped to Bill.update_item arguments
+ITEM_FIELDS = {'item_name': 'item_name', 'price': 'price', 'category': 'category'}
+# Participants and quantities derive from each other in Bill.update_item, so they are one
+# register: a 'split' write carries the item's resulting participants and quantities together
+REGISTERS = (*ITEM_FIELDS, 'split')
+# Fields written on their own by logs from before the 'split' register
+_SPLIT_ARGS = {'participants': 'participant_names', 'quantities': 'quantities'}
+
+
+class MemoryOpLog:
+    """In-process operation log shared by the sessions of one app process."""
+
+    def __init__(self):
+        self._seq = 0
+        # bill_id -> [(seq, site, op), ...] after the bill's snapshot
+        self._ops = {}
+        # bill_id -> latest snapshot (see LiveBill.snapshot())
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def append(self, bill_id, site, ops):
+        with self._lock:
+            entries = self._ops.setdefault(bill_id, [])
+            for op in ops:
+                self._seq += 1
+                entries.append((self._seq, site, json.dumps(op)))
+
+    def _since(self, bill_id, seq):
+        entries = self._ops.get(bill_id, [])
+        tail = entries[bisect_right(entries, seq, key=lambda entry: entry[0]):]
+        return [(s, site, json.loads(op)) for s, site, op in tail]
+
+    def since(self, bill_id, seq):
+        """Returns ``[(seq, site, op), ...]`` for the bill's operations after ``seq``."""
+        with self._lock:
+            return self._since(bill_id, seq)
+
+    def latest_seq(self, bill_id):
+        with self._lock:
+            entries = self._ops.get(bill_id)
+            return entries[-1][0] if entries else self._snapshot_seq(bill_id)
+
+    def _snapshot_seq(self, bill_id):
+        snapshot = self._snapshots.get(bill_id)
+        return snapshot['seq'] if snapshot else 0
+
+    def snapshot_seq(self, bill_id):
+        """Returns the sequence number the bill's snapshot covers, 0 without one."""
+        with self._lock:
+            return self._snapshot_seq(bill_id)
+
+    def load(self, bill_id):
+        """Returns the bill's latest snapshot (or None) and the operations after it."""
+        with self._lock:
+            snapshot = self._snapshots.get(bill_id)
+            return json.loads(json.dumps(snapshot)) if snapshot else None, self._since(bill_id, self._snapshot_seq(bill_id))
+
+    def compact(self, bill_id, snapshot):
+        """Keeps a snapshot and drops the operations it covers, unless a newer one exists."""
+        with self._lock:
+            if snapshot['seq'] <= self._snapshot_seq(bill_id):
+                return
+            self._snapshots[bill_id] = json.loads(json.dumps(snapshot))
+            entries = self._ops.get(bill_id, [])
+            del entries[:bisect_right(entries, snapshot['seq'], key=lambda entry: entry[0])]
+
+
+class SQLiteOpLog:
+    """Operation log in a local SQLite file that any worker process can open."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bill_ops ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, bill_id TEXT NOT NULL, "
+                "site TEXT NOT NULL, op TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bill_ops_bill_seq ON bill_ops (bill_id, seq)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bill_op_snapshots ("
+                "bill_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, snapshot TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append(self, bill_id, site, ops):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO bill_ops (bill_id, site, op) VALUES (?, ?, ?)",
+                [(bill_id, site, json.dumps(op)) for op in ops]
+            )
+
+    @staticmethod
+    def _since(conn, bill_id, seq):
+        rows = conn.execute(
+            "SELECT seq, site, op FROM bill_ops WHERE bill_id = ? AND seq > ? ORDER BY seq",
+            (bill_id, seq)
+        ).fetchall()
+        return [(s, site, json.loads(op)) for s, site, op in rows]
+
+    @staticmethod
+    def _snapshot_seq(conn, bill_id):
+        row = conn.execute("SELECT seq FROM bill_op_snapshots WHERE bill_id = ?", (bill_id,)).fetchone()
+        return row[0] if row else 0
+
+    def since(self, bill_id, seq):
+        with self._connect() as conn:
+            return self._since(conn, bill_id, seq)
+
+    def latest_seq(self, bill_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(seq) FROM bill_ops WHERE bill_id = ?", (bill_id,)).fetchone()
+            return row[0] or self._snapshot_seq(conn, bill_id)
+
+    def snapshot_seq(self, bill_id):
+        with self._connect() as conn:
+            return self._snapshot_seq(conn, bill_id)
+
+    def load(self, bill_id):
+        with self._connect() as conn:
+            # One read transaction, so a compaction can't drop operations between the two reads
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT snapshot FROM bill_op_snapshots WHERE bill_id = ?", (bill_id,)).fetchone()
+            snapshot = json.loads(row[0]) if row else None
+            return snapshot, self._since(conn, bill_id, snapshot['seq'] if snapshot else 0)
+
+    def compact(self, bill_id, snapshot):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if snapshot['seq'] <= self._snapshot_seq(conn, bill_id):
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO bill_op_snapshots (bill_id, seq, snapshot) VALUES (?, ?, ?)",
+                (bill_id, snapshot['seq'], json.dumps(snapshot))
+            )
+            conn.execute("DELETE FROM bill_ops WHERE bill_id = ? AND seq <= ?", (bill_id, snapshot['seq']))
+
+
+def _item_key(item):
+    """What tells two items apart when merging a bill's local state into the shared one."""
+    return (item['item_name'], item['price'], tuple(item['participants']), item.get('category') or None,
+            tuple(sorted((item.get('quantities') or {}).items())))
+
+
+def create_op_log(backend=None, path=None):
+    """Creates the operation log for the backend named like create_bill_store()'s."""
+    backend = backend or os.environ.get("BILL_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryOpLog()
+    if backend == "sqlite":
+        return SQLiteOpLog(path or os.environ.get("BILL_STORE_PATH") or resource_path("bills.sqlite3"))
+    raise ValueError(f"Unknown bill store backend: {backend}")
+
+
+def share_changes(bill, op_log, baseline):
+    """Merges what a bill edited outside live mode changed since ``baseline`` into its shared log.
+
+    Live replicas save their merged state over the bill store, so a bill
+    that has a log is only changed through it: a direct store write would
+    be lost at the next of those saves. The bill is rebuilt from the log
+    with the changes merged in, as join() then leave() would, and the state
+    leave() returns is returned. A bill without a log is left alone and
+    None is returned.
+    """
+    if not op_log.latest_seq(bill.bill_id):
+        return None
+    return LiveBill.join(bill, op_log, baseline=baseline).leave()
+
+
+class LiveBill:
+    """One session's replica of a bill edited by several sessions at once.
+
+    Local mutations of the bill are observed and turned into operations:
+    adding an item, removing it, setting one of its fields, setting the
+    description or date, and adding a participant. Only those operations
+    travel through the shared log. Remote operations merge without
+    conflicts:
+    - Items have (lamport, site) ids and are ordered by id.
+    - A removal wins over concurrent edits.
+    - Each field is a last-writer-wins register, except that an item's
+      participants and quantities share one.
+    - Participants form a grow-only set.
+
+    Every ``compact_after`` operations a replica folds the log into a
+    snapshot of the merged state, so joining replays only the operations
+    after the latest snapshot.
+    """
+
+    compact_after = 500
+
+    def __init__(self, bill, op_log, site_id=None):
+        self.bill = bill
+        self.bill_id = bill.bill_id
+        self.op_log = op_log
+        self.site_id = site_id or uuid.uuid4().hex[:12]
+        self.clock = 0
+        self.seen_seq = 0
+        # Log operations seen since the snapshot this replica started from or wrote
+        self.ops_since_snapshot = 0
+        # Item ids in bill order; always sorted, so positions are found by bisection
+        self.order = []
+        # Item id -> {field: stamp of the write that set it}
+        self.stamps = {}
+        self.tombstones = set()
+        self.bill_stamps = {}
+        self.outbox = []
+        self._applying = False
+
+    @classmethod
+    def join(cls, bill, op_log, site_id=None, baseline=None):
+        """Connects a bill to its shared log, publishing it if it is the first replica.
+
+        If the log already has the bill, the bill is rebuilt from it and the
+        local changes are merged in. ``baseline`` is the state leave()
+        returned when this bill last stopped being live; it tells local edits
+        made in the meantime apart from remote ones.
+        """
+        live = cls(bill, op_log, site_id)
+        snapshot, history = op_log.load(bill.bill_id)
+        if snapshot or history:
+            local = bill.to_state()
+            live._rebuild(snapshot, history)
+            bill.observers.append(live)
+            live._merge_local(local, baseline)
+        else:
+            live._publish_bill(bill)
+            bill.observers.append(live)
+        live.push()
+        return live
+
+    def leave(self):
+        """Stops sharing local changes.
+
+        Returns the bill's state as last shared, to pass to join() as the
+        baseline when the bill goes live again.
+        """
+        self.push()
+        if self in self.bill.observers:
+            self.bill.observers.remove(self)
+        return self.bill.to_state()
+
+    def _rebuild(self, snapshot, entries):
+        """Replaces the bill and the merge state with a snapshot plus the operations after it."""
+        state = snapshot['bill'] if snapshot else {'description': self.bill.description, 'date': self.bill.date,
+                                                   'participants': [], 'items': []}
+        self._applying = True
+        try:
+            self.bill.load_state(dict(state, bill_id=self.bill_id))
+        finally:
+            self._applying = False
+        self.clock = max(self.clock, snapshot['clock'] if snapshot else 0)
+        self.seen_seq = snapshot['seq'] if snapshot else 0
+        self.order = [tuple(item_id) for item_id in snapshot['order']] if snapshot else []
+        self.stamps = {
+            item_id: {field: tuple(stamp) for field, stamp in stamps.items()}
+            for item_id, stamps in zip(self.order, snapshot['stamps'])
+        } if snapshot else {}
+        self.tombstones = {tuple(item_id) for item_id in snapshot['tombstones']} if snapshot else set()
+        self.bill_stamps = {field: tuple(stamp) for field, stamp in snapshot['bill_stamps'].items()} if snapshot else {}
+        self.ops_since_snapshot = 0
+        # Nothing has been applied yet, so this replica's own operations count too
+        return self._apply_remote(entries, own=True)
+
+    def _merge_local(self, local, baseline):
+        """Publishes what changed in a bill while it was not live.
+
+        With a ``baseline``, items it has that ``local`` lacks were removed
+        here and are removed from the shared bill, items ``local`` added are
+        published, and description, date and voided flag changes win. Without
+        one, only the items and participants the shared bill lacks are added.
+        """
+        bill = self.bill
+        local_items = Counter(_item_key(item) for item in local['items'])
+        if baseline is not None:
+            baseline_items = Counter(_item_key(item) for item in baseline['items'])
+            for key, count in (baseline_items - local_items).items():
+                for _ in range(count):
+                    index = next((i for i, item in enumerate(bill.items) if _item_key(item) == key), None)
+                    if index is None:
+                        break
+                    bill.remove_item_at(index)
+            added = local_items - baseline_items
+        else:
+            added = local_items - Counter(_item_key(item) for item in bill.items)
+        for name in local['participants']:
+            bill.add_participant(name)
+        for item in local['items']:
+            key = _item_key(item)
+            if added[key]:
+                added[key] -= 1
+                bill.add_item(item['item_name'], item['price'], item['participants'], category=item.get('category'),
+                              quantities=item.get('quantities'))
+        if baseline is not None:
+            if local['description'] != baseline['description']:
+                bill.set_description(local['description'])
+            if local['date'] != baseline['date']:
+                bill.set_date(local['date'])
+            if local.get('voided', False) != baseline.get('voided', False):
+                bill.set_voided(local.get('voided', False))
+
+    def snapshot(self):
+        """Returns the merged state as of ``seen_seq``, in the form the op log's compact() stores.
+
+        Only valid right after a sync(), when every local operation has been
+        pushed and read back.
+        """
+        state = self.bill.to_state()
+        del state['history_hash']
+        return {
+            'seq': self.seen_seq, 'clock': self.clock, 'bill': state,
+            'order': self.order, 'stamps': [self.stamps[item_id] for item_id in self.order],
+            'tombstones': sorted(self.tombstones), 'bill_stamps': self.bill_stamps,
+        }
+
+    def _tick(self):
+        self.clock += 1
+        return (self.clock, self.site_id)
+
+    def _publish_bill(self, bill):
+        for field in ('description', 'date', 'voided'):
+            self._local_bill_field(field, getattr(bill, field))
+        for name in bill.participants:
+            self.outbox.append({'type': 'participant', 'name': name})
+        for item in bill.items:
+            self._local_add(item)
+
+    def _local_add(self, item):
+        # A fresh id is newer than every id seen so far, so it sorts last, like the appended item
+        item_id = self._tick()
+        self.order.append(item_id)
+        self.stamps[item_id] = {field: item_id for field in REGISTERS}
+        self.outbox.append({
+            'type': 'add', 'id': item_id,
+            'item_name': item['item_name'], 'price': item['price'], 'participants': list(item['participants']),
+            'category': item.get('category'), 'quantities': item.get('quantities'),
+        })
+
+    def _local_remove(self, index):
+        item_id = self.order.pop(index)
+        del self.stamps[item_id]
+        self.tombstones.add(item_id)
+        self.outbox.append({'type': 'remove', 'id': item_id})
+
+    def _local_item_field(self, item_id, field, value):
+        stamp = self._tick()
+        self.stamps[item_id][field] = stamp
+        self.outbox.append({'type': 'set', 'id': item_id, 'field': field, 'value': value, 'stamp': stamp})
+
+    def _local_bill_field(self, field, value):
+        stamp = self._tick()
+        self.bill_stamps[field] = stamp
+        self.outbox.append({'type': 'bill', 'field': field, 'value': value, 'stamp': stamp})
+
+    def on_bill_event(self, bill, op, args):
+        """Turns a local bill mutation into shared operations."""
+        if self._applying:
+            return
+        if op == 'add_item':
+            position = args['position']
+            if position is not None and position != len(bill.items) - 1:
+                # Live bills order items by creation, so a local insert moves to the end. The
+                # move is made of recorded mutations, so the event log and history hash follow it.
+                item = bill.items[position]
+                self._applying = True
+                try:
+                    bill.remove_item_at(position)
+                    bill.add_item(item['item_name'], item['price'], item['participants'], category=item.get('category'),
+                                  quantities=item.get('quantities'))
+                finally:
+                    self._applying = False
+            self._local_add(bill.items[-1])
+        elif op == 'add_items':
+            for item in bill.items[len(bill.items) - len(args['items']):]:
+                self._local_add(item)
+        elif op == 'remove_item_at':
+            self._local_remove(args['index'])
+        elif op == 'update_item':
+            item_id = self.order[args['index']]
+            for field, arg in ITEM_FIELDS.items():
+                if args[arg] is not None:
+                    self._local_item_field(item_id, field, args[arg])
+            if args['participant_names'] is not None or args['quantities'] is not None:
+                item = bill.items[args['index']]
+                # The roster only grows, so names this write added stay even if a concurrent split wins
+                for name in item['participants']:
+                    self.outbox.append({'type': 'participant', 'name': name})
+                self._local_item_field(item_id, 'split', {'participants': list(item['participants']),
+                                                          'quantities': item.get('quantities') or {}})
+        elif op == 'set_description':
+            self._local_bill_field('description', args['description'])
+        elif op == 'set_date':
+            self._local_bill_field('date', args['bill_date'])
+        elif op == 'set_voided':
+            self._local_bill_field('voided', args['voided'])
+        elif op == 'add_participant':
+            self.outbox.append({'type': 'participant', 'name': args['name']})
+        elif op == 'reset':
+            # A shared bill keeps its identity; a reset clears it for everyone
+            bill.bill_id = self.bill_id
+            while self.order:
+                self._local_remove(len(self.order) - 1)
+            self._local_bill_field('description', args['description'])
+            self._local_bill_field('date', args['bill_date'])
+            self._local_bill_field('voided', False)
+
+    def push(self):
+        """Sends pending local operations to the shared log."""
+        if self.outbox:
+            self.op_log.append(self.bill_id, self.site_id, self.outbox)
+            self.outbox = []
+
+    def has_remote_changes(self):
+        return self.op_log.latest_seq(self.bill_id) > self.seen_seq
+
+    def pull(self):
+        """Applies operations other sessions have pushed. Returns how many were applied."""
+        entries = self.op_log.since(self.bill_id, self.seen_seq)
+        if self.op_log.snapshot_seq(self.bill_id) > self.seen_seq:
+            # Operations this replica never saw were compacted away; start over from the snapshot
+            self.push()
+            return self._rebuild(*self.op_log.load(self.bill_id))
+        return self._apply_remote(entries)
+
+    def sync(self):
+        self.push()
+        applied = self.pull()
+        if self.ops_since_snapshot >= self.compact_after:
+            # Everything local is pushed and read back, so the snapshot covers exactly the log so far
+            self.op_log.compact(self.bill_id, self.snapshot())
+            self.ops_since_snapshot = 0
+        return applied
+
+    def _apply_remote(self, entries, own=False):
+        applied = 0
+        self._applying = True
+        try:
+            for seq, site, op in entries:
+                self.seen_seq = max(self.seen_seq, seq)
+                self.ops_since_snapshot += 1
+                if site == self.site_id and not own:
+                    continue
+                self._apply(op)
+                applied += 1
+        finally:
+            self._applying = False
+        return applied
+
+    def _apply(self, op):
+        bill = self.bill
+        kind = op['type']
+        if kind == 'participant':
+            bill.add_participant(op['name'])
+            return
+
+        stamp = tuple(op['stamp'] if 'stamp' in op else op['id'])
+        self.clock = max(self.clock, stamp[0])
+        if kind == 'bill':
+            if stamp > self.bill_stamps.get(op['field'], (0, '')):
+                self.bill_stamps[op['field']] = stamp
+                if op['field'] == 'description':
+                    bill.set_description(op['value'])
+                elif op['field'] == 'voided':
+                    bill.set_voided(op['value'])
+                else:
+                    bill.set_date(op['value'])
+            return
+
+        item_id = tuple(op['id'])
+        if kind == 'add':
+            if item_id in self.stamps or item_id in self.tombstones:
+                return
+            index = bisect_left(self.order, item_id)
+            self.order.insert(index, item_id)
+            self.stamps[item_id] = {field: item_id for field in REGISTERS}
+            bill.add_item(op['item_name'], op['price'], op['participants'], position=index, category=op.get('category'),
+                          quantities=op.get('quantities'))
+        elif kind == 'remove':
+            self.tombstones.add(item_id)
+            if item_id in self.stamps:
+                index = bisect_left(self.order, item_id)
+                del self.order[index]
+                del self.stamps[item_id]
+                bill.remove_item_at(index)
+        elif kind == 'set':
+            # Edits to an item that has been removed are dropped
+            field = 'split' if op['field'] in _SPLIT_ARGS else op['field']
+            if item_id in self.stamps and stamp > self.stamps[item_id].get(field, item_id):
+                self.stamps[item_id][field] = stamp
+                index = bisect_left(self.order, item_id)
+                if op['field'] == 'split':
+                    # Both halves are set as written, so nothing is derived from the bill's current split
+                    bill.update_item(index, participant_names=op['value']['participants'],
+                                     quantities=op['value']['quantities'])
+                elif op['field'] in _SPLIT_ARGS:
+                    bill.update_item(index, **{_SPLIT_ARGS[op['field']]: op['value']})
+                else:
+                    bill.update_item(index, **{ITEM_FIELDS[op['field']]: op['value']})
@@ -0,0 +1,150 @@
+import json
+import os
+
+
+class EventLog:
+    """Append-only log of bill mutations with periodic state snapshots.
+
+    Every mutating ``Bill`` method is recorded as ``(op, args)``, where ``op`` is
+    the method name and ``args`` its keyword arguments. Undo, redo and crash
+    recovery restore the nearest snapshot and replay only the events after it.
+    """
+
+    def __init__(self, snapshot_interval=50, path=None):
+        self.snapshot_interval = snapshot_interval
+        self.path = path
+        # Absolute index of events[0]; grows when the log is compacted
+        self.base = 0
+        self.events = []
+        # Number of events applied to the bill (events past it can be redone)
+        self.cursor = 0
+        # Absolute event index -> bill state at that point
+        self.snapshots = {}
+
+    @classmethod
+    def attach(cls, bill, snapshot_interval=50, path=None):
+        """Starts recording a bill's mutations, snapshotting its current state."""
+        log = cls(snapshot_interval=snapshot_interval, path=path)
+        log.snapshots[0] = bill.to_state()
+        bill.event_log = log
+        if path:
+            with open(path, 'w') as f:
+                f.write(json.dumps({'snapshot': 0, 'state': log.snapshots[0]}) + "\n")
+        return log
+
+    def _write(self, entry):
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def append(self, bill, op, args):
+        """Records a mutation that has just been applied to the bill."""
+        if self.cursor < self.base + len(self.events):
+            # A new edit after undo discards the redo branch
+            del self.events[self.cursor - self.base:]
+            self.snapshots = {i: s for i, s in self.snapshots.items() if i <= self.cursor}
+        self.events.append((op, args))
+        self.cursor += 1
+        self._write({'op': op, 'args': args})
+
+        if self.cursor - self.last_snapshot_index() >= self.snapshot_interval:
+            self.snapshots[self.cursor] = bill.to_state()
+            self._write({'snapshot': self.cursor, 'state': self.snapshots[self.cursor]})
+
+    def last_snapshot_index(self, at=None):
+        """Returns the index of the newest snapshot at or before ``at`` (default: cursor)."""
+        at = self.cursor if at is None else at
+        return max(i for i in self.snapshots if i <= at)
+
+    def can_undo(self):
+        return self.cursor > self.base
+
+    def can_redo(self):
+        return self.cursor < self.base + len(self.events)
+
+    def _restore(self, bill, target):
+        """Rebuilds the bill as it was after ``target`` events."""
+        start = self.last_snapshot_index(target)
+        bill._replaying = True
+        try:
+            bill.load_state(self.snapshots[start])
+            for op, args in self.events[start - self.base:target - self.base]:
+                getattr(bill, op)(**args)
+        finally:
+            bill._replaying = False
+        self.cursor = target
+        self._write({'cursor': target})
+
+    def undo(self, bill):
+        """Reverts the last applied mutation. Returns False if there is none."""
+        if not self.can_undo():
+            return False
+        self._restore(bill, self.cursor - 1)
+        return True
+
+    def redo(self, bill):
+        """Re-applies the last undone mutation. Returns False if there is none."""
+        if not self.can_redo():
+            return False
+        self._restore(bill, self.cursor + 1)
+        return True
+
+    def compact(self, keep_snapshots=2):
+        """Drops events and snapshots older than the last ``keep_snapshots`` snapshots.
+
+        Undo can no longer go past the oldest kept snapshot. The journal file,
+        if any, is rewritten to hold only the retained snapshots and tail.
+        """
+        kept = sorted(i for i in self.snapshots if i <= self.cursor)[-keep_snapshots:]
+        new_base = kept[0]
+        if new_base > self.base:
+            del self.events[:new_base - self.base]
+            self.base = new_base
+            self.snapshots = {i: s for i, s in self.snapshots.items() if i >= new_base}
+
+        if self.path:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                for index in range(self.base, self.base + len(self.events) + 1):
+                    if index in self.snapshots:
+                        f.write(json.dumps({'snapshot': index, 'state': self.snapshots[index]}) + "\n")
+                    if index < self.base + len(self.events):
+                        op, args = self.events[index - self.base]
+                        f.write(json.dumps({'op': op, 'args': args}) + "\n")
+                f.write(json.dumps({'cursor': self.cursor}) + "\n")
+            os.replace(tmp_path, self.path)
+
+    @classmethod
+    def recover(cls, path, bill_factory, snapshot_interval=50):
+        """Rebuilds a bill and its log from a journal file written by a previous run.
+
+        Only the events after the last snapshot are replayed. ``bill_factory``
+        creates an empty bill (normally ``Bill``). Returns ``(bill, log)``.
+        """
+        log = cls(snapshot_interval=snapshot_interval, path=path)
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash may leave a partially written last line
+                    break
+                if 'snapshot' in entry:
+                    if not log.snapshots:
+                        log.base = log.cursor = entry['snapshot']
+                    log.snapshots[entry['snapshot']] = entry['state']
+                elif 'cursor' in entry:
+                    log.cursor = entry['cursor']
+                else:
+                    if log.cursor < log.base + len(log.events):
+                        del log.events[log.cursor - log.base:]
+                        log.snapshots = {i: s for i, s in log.snapshots.items() if i <= log.cursor}
+                    log.events.append((entry['op'], entry['args']))
+                    log.cursor += 1
+
+        bill = bill_factory("New Bill")
+        path, log.path = log.path, None
+        log._restore(bill, log.cursor)
+        log.path = path
+        bill.event_log = log
+        return bill, log
@@ -0,0 +1,193 @@
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+from .models import Bill, UNCATEGORIZED
+from .logic import get_bill_as_json_string
+from .storage import encode_bill
+from .analytics import export_parquet
+from .statements import statements_zip
+
+
+def generate_pdf(bill):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    title_style = styles['Title']
+    title_style.fontName = 'Helvetica-Bold'
+    elements.append(Paragraph(f"Bill: {bill.description}", title_style))
+    elements.append(Spacer(1, 12))
+
+    # Data for table; the category column only appears once items have categories
+    with_categories = any(item.get('category') for item in bill.items)
+    data = [['Item', 'Category', 'Price', 'Participants'] if with_categories else ['Item', 'Price', 'Participants']]
+    for item in bill.items:
+        row = [item['item_name'], f"${item['price']:.2f}", ", ".join(item['participants'])]
+        if with_categories:
+            row.insert(1, item.get('category') or UNCATEGORIZED)
+        data.append(row)
+
+    # Create Table
+    if len(data) > 1:
+        t = Table(data, colWidths=[150, 100, 80, 170] if with_categories else [200, 100, 200])
+        t.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]))
+        elements.append(t)
+    else:
+        elements.append(Paragraph("No items in this bill.", styles['Normal']))
+
+    # Total
+    elements.append(Spacer(1, 12))
+    total = sum(item['price'] for item in bill.items)
+    elements.append(Paragraph(f"Total: ${total:.2f}", styles['Heading2']))
+
+    # Digests to check this copy against the agreement ledger
+    elements.append(Spacer(1, 24))
+    for label, digest in (("Content digest (SHA-256)", bill.content_digest()), ("History hash", bill.history_hash)):
+        elements.append(Paragraph(label, styles['Normal']))
+        elements.append(Paragraph(digest, styles['Code']))
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def _render_json(bill):
+    return get_bill_as_json_string(bill)
+
+
+def _render_pdf(bill):
+    return generate_pdf(bill).getvalue()
+
+
+# kind -> (label, file extension, mime type, renderer returning str/bytes)
+EXPORT_FORMATS = {
+    'json': ("JSON", "json", "application/json", _render_json),
+    'pdf': ("PDF", "pdf", "application/pdf", _render_pdf),
+    'bill': ("Bill File", "bill", "application/octet-stream", encode_bill),
+    'parquet': ("Parquet", "parquet", "application/vnd.apache.parquet", lambda bill: export_parquet([bill])),
+    'statements': ("Statements", "zip", "application/zip", lambda bill: statements_zip([bill])),
+}
+
+
+class ExportManager:
+    """Renders bill exports on demand in a background thread pool.
+
+    Finished artifacts are cached per (bill id, content digest, history hash,
+    kind), so a file is rendered at most once per bill state and ordinary
+    edits never pay for exports nobody asked for. The version counter can't
+    be part of the key: every freshly loaded bill starts from the same one.
+    The digest is only computed when an export is requested; until then a
+    bill edited since its last request has no exports.
+    """
+
+    def __init__(self, max_workers=2, max_entries=64):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bill-export")
+        self._max_entries = max_entries
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # bill -> (version, content digest), so a digest is only computed once per edit
+        self._digests = weakref.WeakKeyDictionary()
+
+    def content_digest(self, bill, compute=True):
+        """Returns bill.content_digest(), computed once per bill version.
+
+        With compute=False, returns None instead of computing a digest that
+        isn't memoized yet.
+        """
+        with self._lock:
+            version, digest = self._digests.get(bill, (None, None))
+        if version != bill.version:
+            if not compute:
+                return None
+            version, digest = bill.version, bill.content_digest()
+            with self._lock:
+                self._digests[bill] = (version, digest)
+        return digest
+
+    def _key(self, bill, kind, compute=False):
+        """Returns the cache key for the bill's current state, or None if its digest isn't known and compute is False."""
+        digest = self.content_digest(bill, compute)
+        if digest is None:
+            return None
+        return (bill.bill_id, digest, bill.history_hash, kind)
+
+    def request(self, bill: Bill, kind):
+        """Starts rendering an export of the bill's current state, unless one exists."""
+        key = self._key(bill, kind, compute=True)
+        with self._lock:
+            if key in self._jobs:
+                self._jobs.move_to_end(key)
+                return
+            # Workers render a private copy, so later edits can't race with them
+            snapshot = Bill.from_state(bill.to_state())
+            self._jobs[key] = self._executor.submit(EXPORT_FORMATS[kind][3], snapshot)
+            # Older versions of the same export are stale now
+            for stale in [k for k in self._jobs if k[0] == bill.bill_id and k[3] == kind and k != key]:
+                del self._jobs[stale]
+            while len(self._jobs) > self._max_entries:
+                self._jobs.popitem(last=False)
+
+    def status(self, bill: Bill, kind):
+        """Returns 'missing', 'running', 'done' or 'failed' for the bill's current state."""
+        key = self._key(bill, kind)
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None:
+            return 'missing'
+        if not job.done():
+            return 'running'
+        if job.exception() is not None or job.result() is None:
+            return 'failed'
+        return 'done'
+
+    def result(self, bill: Bill, kind):
+        """Returns the finished artifact for the bill's current state, or None."""
+        key = self._key(bill, kind)
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None or not job.done() or job.exception() is not None:
+            return None
+        return job.result()
+
+    def memory_usage(self, bill_id):
+        """Returns the bytes held by finished exports of a bill."""
+        with self._lock:
+            jobs = [job for key, job in self._jobs.items() if key[0] == bill_id]
+        total = 0
+        for job in jobs:
+            if job.done() and job.exception() is None and job.result() is not None:
+                total += len(job.result())
+        return total
+
+    def discard(self, bill_id):
+        """Drops every cached export of a bill."""
+        with self._lock:
+            for key in [k for k in self._jobs if k[0] == bill_id]:
+                del self._jobs[key]
+
+    def error(self, bill: Bill, kind):
+        """Returns the exception raised while rendering, if any."""
+        key = self._key(bill, kind)
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None or not job.done():
+            return None
+        return job.exception()
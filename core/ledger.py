@@ -0,0 +1,176 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone
+
+from .logic import resource_path
+
+LEDGER_FILE = resource_path("ledger.jsonl")
+
+
+def _hash(prefix, data):
+    # Distinct prefixes keep a leaf from ever being mistaken for an inner node
+    return hashlib.sha256(prefix + data).hexdigest()
+
+
+def leaf_hash(entry):
+    return _hash(b"\x00", json.dumps(entry, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+
+def node_hash(left, right):
+    return _hash(b"\x01", bytes.fromhex(left) + bytes.fromhex(right))
+
+
+def verify_proof(leaf, proof, root):
+    """Checks that a leaf hash is in the tree with this root, given its audit path."""
+    current = leaf
+    for side, sibling in proof:
+        current = node_hash(sibling, current) if side == 'left' else node_hash(current, sibling)
+    return current == root
+
+
+class MerkleLedger:
+    """Append-only ledger of agreed bill digests under a Merkle tree.
+
+    Each entry records a bill's content digest and history hash at the time
+    it was agreed. Appending updates one node per tree level, and a bill is
+    verified against the root with an audit path of O(log n) sibling hashes,
+    so checking one bill never rehashes the rest of the history. A node
+    without a sibling is carried up to the next level unchanged.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = []
+        # levels[0] are the leaf hashes, levels[-1] holds the root
+        self.levels = [[]]
+        # bill_id -> index of the bill's latest entry
+        self._latest = {}
+        # Bytes of the ledger file already read
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=LEDGER_FILE):
+        """Opens the ledger kept at ``path``; entries appended later are written there."""
+        ledger = cls(path)
+        ledger.refresh()
+        return ledger
+
+    def refresh(self):
+        """Reads entries other processes appended to the ledger file since the last read."""
+        if not self.path:
+            return
+        with self._lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            # Still being written
+                            break
+                        self._add(json.loads(line))
+                        self._offset += len(line)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _add(self, entry):
+        index = len(self.entries)
+        self.entries.append(entry)
+        self._latest[entry['bill_id']] = index
+        self.levels[0].append(leaf_hash(entry))
+        # Only the nodes on the new leaf's path to the root change
+        position = index
+        for level in range(len(self.levels)):
+            nodes = self.levels[level]
+            if len(nodes) == 1:
+                break
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            parent = position // 2
+            left = parent * 2
+            value = node_hash(nodes[left], nodes[left + 1]) if left + 1 < len(nodes) else nodes[left]
+            parents = self.levels[level + 1]
+            if parent < len(parents):
+                parents[parent] = value
+            else:
+                parents.append(value)
+            position = parent
+        return index
+
+    def append(self, bill):
+        """Records the bill as agreed in its current state. Returns the new entry."""
+        entry = {
+            'bill_id': bill.bill_id,
+            'description': bill.description,
+            'content_digest': bill.content_digest(),
+            'history_hash': bill.history_hash,
+            'agreed_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        if not self.path:
+            with self._lock:
+                self._add(entry)
+            return entry
+        # Entries from other processes come first, so every process builds the same tree
+        self.refresh()
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write((json.dumps(entry) + "\n").encode('utf-8'))
+        self.refresh()
+        return entry
+
+    def root(self):
+        with self._lock:
+            return self.levels[-1][0] if self.levels[0] else None
+
+    def _proof(self, index):
+        path = []
+        position = index
+        for nodes in self.levels[:-1]:
+            sibling = position ^ 1
+            if sibling < len(nodes):
+                path.append(('left' if sibling < position else 'right', nodes[sibling]))
+            position //= 2
+        return path
+
+    def proof(self, index):
+        """Returns the audit path ``[(side, sibling hash), ...]`` from a leaf to the root."""
+        with self._lock:
+            return self._proof(index)
+
+    def verify(self, bill_id, content_digest):
+        """Checks a content digest against the bill's latest agreement.
+
+        Returns None if the bill was never agreed, or a report with the entry,
+        its audit path, the root and whether the digest matches and the path
+        leads to the root.
+        """
+        self.refresh()
+        with self._lock:
+            index = self._latest.get(bill_id)
+            if index is None:
+                return None
+            entry = self.entries[index]
+            proof = self._proof(index)
+            root = self.levels[-1][0]
+        return {
+            'index': index,
+            'entry': entry,
+            'unchanged': entry['content_digest'] == content_digest,
+            'in_ledger': verify_proof(leaf_hash(entry), proof, root),
+            'proof': proof,
+            'root': root,
+        }
+
+    def verify_bill(self, bill, digest=None):
+        """verify() for a bill in memory, also comparing its history hash.
+
+        Pass the bill's content digest if it is already known.
+        """
+        report = self.verify(bill.bill_id, digest or bill.content_digest())
+        if report is not None:
+            report['same_history'] = report['entry']['history_hash'] == bill.history_hash
+        return report
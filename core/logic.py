@@ -2,7 +2,9 @@ import json
 import pandas as pd
 import sys
 import os
-from .models import Bill, Item
+from .models import Bill, Item, item_shares_in_cents
+from .allocation import allocate_item_shares
+from .search import ParticipantIndex
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -26,9 +28,11 @@ def load_participants():
         return []
 
 def save_participants(participants):
-    """Saves the list of participants to a JSON file."""
+    """Saves the list of participants to a JSON file, in sorted order."""
+    # A ParticipantIndex is kept sorted as it changes, so only plain lists need sorting
+    names = participants.names() if isinstance(participants, ParticipantIndex) else sorted(participants)
     with open(PARTICIPANTS_FILE, 'w') as f:
-        json.dump(sorted(participants), f, indent=4)
+        json.dump(names, f, indent=4)
 
 def load_groups():
     """Loads participant groups from a JSON file."""
@@ -52,36 +56,73 @@ def calculate_totals(bill: Bill):
     """Returns the total amount due for each participant."""
     return bill.get_totals()
 
+def calculate_totals_in_cents(bill: Bill):
+    """Returns each participant's total in integer cents, using the same splits as the summary table."""
+    totals = {name: 0 for name in bill.participants}
+    for shares in allocate_item_shares(bill.items):
+        for name, cents in shares.items():
+            totals[name] = totals.get(name, 0) + cents
+    return totals
+
+def get_settlements(bill: Bill, payer: str):
+    """Lists the transfers that settle the bill when one participant paid for everything."""
+    settlements = []
+    for name, cents in sorted(calculate_totals_in_cents(bill).items()):
+        if name != payer and cents > 0:
+            settlements.append({'from': name, 'to': payer, 'amount': cents / 100.0})
+    return settlements
+
+def get_participant_statement(bill: Bill, name: str):
+    """Lists one participant's items with their share of each and a running total, in dollars."""
+    rows = []
+    running_cents = 0
+    for item in bill.get_participant_items(name):
+        share_cents = item_shares_in_cents(item)[name]
+        running_cents += share_cents
+        rows.append({
+            'item_name': item['item_name'],
+            'price': item['price'],
+            'shared_with': len(set(item['participants'])),
+            'share': share_cents / 100.0,
+            'running_total': running_cents / 100.0,
+        })
+    return {'participant': name, 'items': rows, 'total': running_cents / 100.0}
+
+def get_category_breakdown(bill: Bill):
+    """Returns {category: {participant: amount}} in dollars, from the bill's maintained rollups."""
+    return {
+        category: {name: cents / 100.0 for name, cents in sorted(shares.items())}
+        for category, shares in sorted(bill.get_category_totals().items())
+    }
+
+def create_category_dataframe(bill: Bill):
+    """Creates a category x participant DataFrame of shares in dollars, with a Total column."""
+    rollups = bill.get_category_totals()
+    df = pd.DataFrame.from_dict(rollups, orient='index').reindex(
+        index=sorted(rollups), columns=sorted(bill.participants)
+    ).fillna(0) / 100
+    df['Total'] = df.sum(axis=1)
+    return df
+
 def create_bill_dataframe(bill: Bill):
     """Creates a pandas DataFrame from the bill data in the desired format."""
     all_participant_names = sorted(list(bill.participants.keys()))
     item_data = {item['item_name']: item for item in bill.items}
     item_names = list(item_data.keys())
-    
-    # Create DataFrame with item names as index
-    df = pd.DataFrame(0.0, index=item_names, columns=all_participant_names)
+
+    # Per-item splits in cents are maintained incrementally by the bill, using
+    # the same remainder-cent distribution as item_shares_in_cents
+    item_splits = bill.get_item_splits()
+    df = pd.DataFrame.from_dict(
+        {name: item_splits.get(name, {}) for name in item_names},
+        orient='index',
+        columns=all_participant_names,
+        dtype=float
+    ).reindex(index=item_names, columns=all_participant_names).fillna(0.0) / 100.0
 
     # Insert the 'Total Price' column at the beginning
     df.insert(0, 'Total Price', [item_data[name]['price'] for name in item_names])
 
-    # Populate item costs for each participant
-    for item_name, item in item_data.items():
-        price = item['price']
-        participants = item['participants']
-        if participants:
-            num_participants = len(participants)
-            # Calculate split in cents to avoid floating point errors and handle remainder
-            price_in_cents = int(round(price * 100))
-            base_split_cents = price_in_cents // num_participants
-            remainder_cents = price_in_cents % num_participants
-
-            for i, p_name in enumerate(participants):
-                if p_name in df.columns:
-                    # Add one cent from the remainder to the first few participants
-                    extra_cent = 1 if i < remainder_cents else 0
-                    split_amount = (base_split_cents + extra_cent) / 100.0
-                    df.loc[item_name, p_name] = split_amount
-
     # Add 'Total' row at the end
     df.loc['Total'] = df.sum()
     # The 'Total' for the 'Total Price' column is the sum of that column
@@ -95,7 +136,12 @@ def get_bill_as_json_string(bill: Bill):
         df = create_bill_dataframe(bill)
         output_data = {
             "bill_title": bill.description,
-            "summary_table": df.to_dict(orient='index')
+            "bill_id": bill.bill_id,
+            "bill_date": bill.date,
+            "summary_table": df.to_dict(orient='index'),
+            "category_totals": get_category_breakdown(bill),
+            "content_digest": bill.content_digest(),
+            "history_hash": bill.history_hash
         }
         return json.dumps(output_data, indent=4)
     except Exception as e:
@@ -109,7 +155,12 @@ def save_to_json(bill: Bill, filename="bill_summary.json"):
         
         output_data = {
             "bill_title": bill.description,
-            "summary_table": df.to_dict(orient='index')
+            "bill_id": bill.bill_id,
+            "bill_date": bill.date,
+            "summary_table": df.to_dict(orient='index'),
+            "category_totals": get_category_breakdown(bill),
+            "content_digest": bill.content_digest(),
+            "history_hash": bill.history_hash
         }
 
         # Use the resource_path for the output file as well
@@ -1,3 +1,77 @@
+import hashlib
+import json
+import heapq
+import uuid
+from datetime import date
+from itertools import islice
+
+from .allocation import allocate_item_shares, split_quantities_in_cents
+from .search import ItemIndex
+
+def split_price_in_cents(price, participant_names):
+    """Splits a price into integer-cent shares, giving remainder cents to the first participants."""
+    num_participants = len(participant_names)
+    if not num_participants:
+        return {}
+    price_in_cents = int(round(price * 100))
+    base_split_cents = price_in_cents // num_participants
+    remainder_cents = price_in_cents % num_participants
+    shares = {}
+    for i, name in enumerate(participant_names):
+        extra_cent = 1 if i < remainder_cents else 0
+        shares[name] = base_split_cents + extra_cent
+    return shares
+
+def item_shares_in_cents(item):
+    """Splits one bill item: in proportion to its ``quantities`` if it has them, evenly otherwise."""
+    if item.get('quantities'):
+        return split_quantities_in_cents(item['price'], item['quantities'])
+    return split_price_in_cents(item['price'], item['participants'])
+
+def item_shares(item):
+    """Yields ``(participant, unrounded share)`` for one item, as the running totals count it."""
+    quantities = item.get('quantities')
+    if quantities:
+        total = sum(quantities.values())
+        for name, quantity in quantities.items():
+            yield name, item['price'] * quantity / total
+    elif item['participants']:
+        split_amount = item['price'] / len(item['participants'])
+        for name in item['participants']:
+            yield name, split_amount
+
+def _copy_item(item):
+    item = dict(item, participants=list(item['participants']))
+    if 'quantities' in item:
+        item['quantities'] = dict(item['quantities'])
+    return item
+
+# Rollup label for items without a category
+UNCATEGORIZED = "Uncategorized"
+
+# History hash of a bill no mutation has been recorded on
+GENESIS_HASH = "0" * 64
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def chain_hash(previous, op, args):
+    """Folds one recorded mutation into a rolling SHA-256 history hash."""
+    return hashlib.sha256(previous.encode('ascii') + _canonical_json({'op': op, 'args': args})).hexdigest()
+
+def iso_date(value):
+    """Returns a bill date as YYYY-MM-DD, raising ValueError if it isn't a calendar date."""
+    if not isinstance(value, str):
+        raise ValueError(f"Bill date must be a YYYY-MM-DD string, not {value!r}")
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"Bill date must be a YYYY-MM-DD date, not {value!r}") from None
+
+def new_bill_id():
+    """Returns a unique identifier for a bill."""
+    return uuid.uuid4().hex
+
 class Participant:
     def __init__(self, name):
         self.name = name
@@ -13,15 +87,136 @@ class Item:
         self.participants = participants
 
 class Bill:
-    def __init__(self, description):
+    def __init__(self, description, bill_date=None, bill_id=None):
         self.description = description
+        # ISO date (YYYY-MM-DD) the bill was incurred on; checked here so a bad
+        # date never reaches the store's rollups
+        self.date = iso_date(bill_date) if bill_date else date.today().isoformat()
+        self.bill_id = bill_id or new_bill_id()
+        # A voided bill is kept but no longer counts towards saved-bill rollups
+        self.voided = False
         self.items = []
         self.participants = {}
+        # Cached summary matrix: item name -> {participant: share in cents}.
+        # Like the summary table, the last item with a given name wins.
+        # None means it has to be rebuilt from the items.
+        self._item_splits = {}
+        # Inverted index: participant name -> {id(item): item} for the items they share,
+        # in the order they joined them. None means it has to be rebuilt from the items.
+        self._participant_items = {}
+        # Rollups: category -> {participant: share in cents}, kept in step with the items.
+        # None means they have to be rebuilt from the items.
+        self._category_totals = {}
+        # Price and name indexes behind query_items(), built by the first query.
+        # None means it has to be rebuilt from the items.
+        self._item_index = None
+        # Bumped on every mutation so caches can tell bill states apart
+        self.version = 0
+        # Rolling hash over every recorded mutation, so two bills with the same
+        # hash went through the same edits
+        self.history_hash = GENESIS_HASH
+        # Optional core.events.EventLog recording every mutation
+        self.event_log = None
+        self._replaying = False
+        # Objects with an on_bill_event(bill, op, args) method, told about every mutation
+        self.observers = []
+
+    def _record(self, op, **args):
+        """Bumps the version and history hash, appends the mutation to the event log, if any, and notifies observers."""
+        self.version += 1
+        self.history_hash = chain_hash(self.history_hash, op, args)
+        if self.event_log is not None and not self._replaying:
+            self.event_log.append(self, op, args)
+        for observer in self.observers:
+            observer.on_bill_event(self, op, args)
+
+    def to_state(self):
+        """Returns a plain, JSON-serializable copy of the bill's contents."""
+        state = {
+            'bill_id': self.bill_id,
+            'description': self.description,
+            'date': self.date,
+            'participants': list(self.participants.keys()),
+            'items': [_copy_item(item) for item in self.items],
+            'history_hash': self.history_hash,
+        }
+        if self.voided:
+            # Only stored when set, so bills that were never voided keep their content digest
+            state['voided'] = True
+        return state
+
+    def load_state(self, state, copy=True):
+        """Replaces the bill's contents with a state produced by to_state().
+
+        Pass copy=False to take ownership of a freshly built state's item dicts.
+        """
+        self.description = state['description']
+        self.bill_id = state.get('bill_id', self.bill_id)
+        self.date = iso_date(state['date']) if 'date' in state else self.date
+        self.voided = state.get('voided', False)
+        self.history_hash = state.get('history_hash', GENESIS_HASH)
+        self.participants = {name: Participant(name) for name in state['participants']}
+        self.items = []
+        for item in state['items']:
+            if copy:
+                item = _copy_item(item)
+            self.items.append(item)
+            for name in item['participants']:
+                if name not in self.participants:
+                    self.participants[name] = Participant(name)
+        self._recalculate_totals()
+        # The summary cache and the participant index are rebuilt on first use rather than up front
+        self._item_splits = None
+        self._participant_items = None
+        self._category_totals = None
+        self._item_index = None
+        self.version += 1
+
+    @classmethod
+    def from_state(cls, state, copy=True):
+        bill = cls(state['description'])
+        bill.load_state(state, copy=copy)
+        return bill
+
+    def set_description(self, description):
+        """Renames the bill."""
+        if description != self.description:
+            self.description = description
+            self._record('set_description', description=description)
+
+    def set_date(self, bill_date):
+        """Sets the ISO date (YYYY-MM-DD) the bill was incurred on. Raises ValueError for anything else."""
+        bill_date = iso_date(bill_date)
+        if bill_date != self.date:
+            self.date = bill_date
+            self._record('set_date', bill_date=bill_date)
+
+    def set_voided(self, voided=True):
+        """Voids the bill, or restores a voided one."""
+        if voided != self.voided:
+            self.voided = voided
+            self._record('set_voided', voided=voided)
+
+    def reset(self, description="New Bill", bill_date=None, bill_id=None):
+        """Starts a new, empty bill in place of this one."""
+        self.description = description
+        self.date = iso_date(bill_date) if bill_date else date.today().isoformat()
+        # The generated id is recorded so replaying the reset reproduces it
+        self.bill_id = bill_id or new_bill_id()
+        self.voided = False
+        self.items = []
+        self.participants = {}
+        self._item_splits = {}
+        self._participant_items = {}
+        self._category_totals = {}
+        self._item_index = None
+        self._record('reset', description=description, bill_date=self.date, bill_id=self.bill_id)
 
     def add_participant(self, name):
         """Adds a participant to the bill if they don't already exist."""
         if name and name not in self.participants:
             self.participants[name] = Participant(name)
+            self._record('add_participant', name=name)
 
     def _recalculate_totals(self):
         """Helper method to clear and recalculate all participant totals."""
@@ -31,40 +226,331 @@ class Bill:
         
         # Recalculate from scratch based on current items
         for item in self.items:
-            price = item['price']
-            participant_names = item['participants']
-            if participant_names:
-                split_amount = price / len(participant_names)
-                for name in participant_names:
-                    # Ensure participant exists before adding to total
-                    if name in self.participants:
-                        self.participants[name].add_to_total(split_amount)
-
-    def add_item(self, item_name, price, participant_names):
-        self.items.append({'item_name': item_name, 'price': price, 'participants': participant_names})
+            for name, split_amount in item_shares(item):
+                # Ensure participant exists before adding to total
+                if name in self.participants:
+                    self.participants[name].add_to_total(split_amount)
+
+    def _apply_item(self, item, sign, shares=None):
+        """Adds (sign=1) or subtracts (sign=-1) one item's split from participant totals and category rollups.
+
+        ``shares`` are the item's cents if they are already known.
+        """
+        for name, split_amount in item_shares(item):
+            if name in self.participants:
+                self.participants[name].add_to_total(sign * split_amount)
+        if self._category_totals is not None:
+            self._roll_up_item(self._category_totals, item, sign, shares)
+
+    @staticmethod
+    def _roll_up_item(category_totals, item, sign, shares=None):
+        category = item.get('category') or UNCATEGORIZED
+        rollup = category_totals.setdefault(category, {})
+        for name, cents in (shares if shares is not None else item_shares_in_cents(item)).items():
+            rollup[name] = rollup.get(name, 0) + sign * cents
+            if not rollup[name]:
+                del rollup[name]
+        if not rollup:
+            del category_totals[category]
+
+    def get_category_totals(self):
+        """Returns the rollups as {category: {participant: cents}}; items without a category count as UNCATEGORIZED."""
+        if self._category_totals is None:
+            self._category_totals = {}
+            for item, shares in zip(self.items, allocate_item_shares(self.items)):
+                self._roll_up_item(self._category_totals, item, 1, shares)
+        return self._category_totals
+
+    def get_categories(self):
+        """Returns the categories used by the bill's items."""
+        return [category for category in self.get_category_totals() if category != UNCATEGORIZED]
+
+    def _refresh_item_split(self, item_name):
+        """Re-derives the cached summary row for one item name after it changed."""
+        if self._item_splits is None:
+            return
+        for item in reversed(self.items):
+            if item['item_name'] == item_name:
+                self._item_splits[item_name] = item_shares_in_cents(item)
+                return
+        self._item_splits.pop(item_name, None)
+
+    def get_item_splits(self):
+        """Returns the cached summary matrix as {item name: {participant: cents}}."""
+        if self._item_splits is None:
+            # The whole bill is split in one vectorized pass
+            self._item_splits = {
+                item['item_name']: shares for item, shares in zip(self.items, allocate_item_shares(self.items))
+            }
+        return self._item_splits
+
+    def _index_item(self, item, sign):
+        """Adds (sign=1) or removes (sign=-1) an item from its participants' entries in the index."""
+        if self._participant_items is None:
+            return
+        for name in set(item['participants']):
+            if sign > 0:
+                self._participant_items.setdefault(name, {})[id(item)] = item
+            else:
+                entries = self._participant_items.get(name)
+                if entries is not None:
+                    entries.pop(id(item), None)
+                    if not entries:
+                        del self._participant_items[name]
+
+    def _get_participant_index(self):
+        if self._participant_items is None:
+            self._participant_items = {}
+            for item in self.items:
+                self._index_item(item, 1)
+        return self._participant_items
+
+    def get_participant_items(self, name):
+        """Returns the items a participant shares, in the order they joined them.
+
+        Served from an index kept up to date on every change, so the cost is
+        proportional to that participant's items rather than the whole bill.
+        """
+        return list(self._get_participant_index().get(name, {}).values())
+
+    def get_item_participants(self):
+        """Returns the names of participants sharing at least one item."""
+        return list(self._get_participant_index())
+
+    @staticmethod
+    def _new_item(item_name, price, participant_names, category=None, quantities=None):
+        if quantities:
+            # Only what someone consumed counts, and the consumers are the participants
+            quantities = {name: quantity for name, quantity in quantities.items() if quantity > 0}
+            participant_names = list(quantities)
+        item = {'item_name': item_name, 'price': price, 'participants': list(participant_names)}
+        if category:
+            item['category'] = category
+        if quantities:
+            item['quantities'] = quantities
+        return item
+
+    def add_item(self, item_name, price, participant_names, position=None, category=None, quantities=None):
+        """Adds an item at the end of the bill, or before the item at ``position``.
+
+        An item with ``quantities`` ({participant: units consumed}) is shared by
+        the people who consumed it and split in proportion to their units;
+        ``participant_names`` is then ignored.
+        """
+        item = self._new_item(item_name, price, participant_names, category, quantities)
+        participant_names = item['participants']
+        if position is None:
+            self.items.append(item)
+        else:
+            self.items.insert(position, item)
         # Ensure all participants involved in the item exist in the bill's participant list
         for name in participant_names:
             if name not in self.participants:
                 self.participants[name] = Participant(name)
         
-        self._recalculate_totals()
+        # Totals are sums over items, so a new item only adds its own share
+        self._apply_item(item, 1)
+        self._index_item(item, 1)
+        if self._item_index is not None:
+            self._item_index.add(item)
+        if position is None:
+            if self._item_splits is not None:
+                self._item_splits[item_name] = item_shares_in_cents(item)
+        else:
+            # A later item with the same name may still own the summary row
+            self._refresh_item_split(item_name)
+        self._record('add_item', item_name=item_name, price=price, participant_names=participant_names,
+                     position=position, category=category or None, quantities=item.get('quantities'))
+
+    def add_items(self, items):
+        """Appends a batch of items, such as the lines of a receipt, as one change.
+
+        Each item is a dict with 'item_name', 'price' and 'participants', and
+        optionally 'category' and 'quantities' (see add_item). The batch is
+        split in integer cents by one vectorized allocation instead of item by
+        item.
+        """
+        new_items = [
+            self._new_item(item['item_name'], item['price'], item.get('participants', ()),
+                           item.get('category'), item.get('quantities'))
+            for item in items
+        ]
+        if not new_items:
+            return
+        for item, shares in zip(new_items, allocate_item_shares(new_items)):
+            self.items.append(item)
+            for name in item['participants']:
+                if name not in self.participants:
+                    self.participants[name] = Participant(name)
+            self._apply_item(item, 1, shares)
+            self._index_item(item, 1)
+            if self._item_index is not None:
+                self._item_index.add(item)
+            if self._item_splits is not None:
+                self._item_splits[item['item_name']] = shares
+        self._record('add_items', items=[_copy_item(item) for item in new_items])
 
     def remove_item(self, item_name_to_remove):
         """Removes an item from the bill by its name and recalculates totals."""
         # Find the item to remove
-        item_found = None
-        for item in self.items:
+        for index, item in enumerate(self.items):
             if item['item_name'] == item_name_to_remove:
-                item_found = item
-                break
-        
-        if item_found:
-            self.items.remove(item_found)
-            # After removing, we must recalculate everyone's total
-            self._recalculate_totals()
-            return True
+                return self.remove_item_at(index)
         return False
 
+    def remove_item_at(self, index):
+        """Removes the item at a position in ``items``, subtracting only its share from totals."""
+        if not 0 <= index < len(self.items):
+            return False
+        item = self.items.pop(index)
+        self._apply_item(item, -1)
+        self._index_item(item, -1)
+        if self._item_index is not None:
+            self._item_index.remove(item)
+        self._refresh_item_split(item['item_name'])
+        self._record('remove_item_at', index=index)
+        return True
+
+    def update_item(self, index, item_name=None, price=None, participant_names=None, category=None,
+                    quantities=None):
+        """Edits the item at a position in ``items`` in place.
+
+        Only the fields that are passed change; an empty category removes it.
+        Passing ``quantities`` also sets the participants. New participants of
+        an item split by quantity get one unit, and an empty ``quantities``
+        turns it back into an even split.
+        Totals, category rollups and the cached summary matrix are adjusted by
+        the difference between the old and new item instead of being
+        recalculated.
+        """
+        if not 0 <= index < len(self.items):
+            return False
+        item = self.items[index]
+        old_name = item['item_name']
+
+        self._apply_item(item, -1)
+        if self._item_index is not None:
+            self._item_index.remove(item)
+        if item_name is not None:
+            item['item_name'] = item_name
+        if price is not None:
+            item['price'] = price
+        if category is not None:
+            if category:
+                item['category'] = category
+            else:
+                item.pop('category', None)
+        if quantities is not None:
+            quantities = {name: quantity for name, quantity in quantities.items() if quantity > 0}
+            if quantities:
+                participant_names = list(quantities)
+        elif participant_names is not None and item.get('quantities'):
+            quantities = {name: item['quantities'].get(name, 1) for name in dict.fromkeys(participant_names)}
+            participant_names = list(quantities)
+        if quantities is not None:
+            # A new dict, never changed in place, since snapshots may share the old one
+            if quantities:
+                item['quantities'] = quantities
+            else:
+                item.pop('quantities', None)
+        if participant_names is not None:
+            self._index_item(item, -1)
+            item['participants'] = list(participant_names)
+            self._index_item(item, 1)
+            for name in item['participants']:
+                if name not in self.participants:
+                    self.participants[name] = Participant(name)
+        self._apply_item(item, 1)
+        if self._item_index is not None:
+            self._item_index.add(item)
+
+        self._refresh_item_split(old_name)
+        if item['item_name'] != old_name:
+            self._refresh_item_split(item['item_name'])
+        self._record('update_item', index=index, item_name=item_name, price=price,
+                     participant_names=None if participant_names is None else item['participants'],
+                     category=category, quantities=None if quantities is None else dict(quantities))
+        return True
+
+    def _get_item_index(self):
+        if self._item_index is None:
+            self._item_index = ItemIndex(self.items)
+        return self._item_index
+
+    def query_items(self, participant=None, min_price=None, max_price=None, name=None,
+                    sort_by=None, descending=False, limit=None):
+        """Returns the items matching every filter given, optionally sorted by 'price' or 'name'.
+
+        Candidates come from whichever index narrows the search most: the
+        participant index, the sorted prices or the item name trigrams. Only
+        those candidates are checked against the other filters. A limited
+        sorted query may instead walk the sorted prices or names and stop
+        early, when that should take fewer steps. Without ``sort_by``, an
+        unfiltered query lists items in bill order and a filtered one in the
+        order of the index used.
+        """
+        index = self._get_item_index()
+        # (candidate count, order the candidates come in, candidate stream)
+        sources = []
+        if participant is not None:
+            entries = self._get_participant_index().get(participant, {})
+            sources.append((len(entries), None, lambda: list(entries.values())))
+        if name:
+            named = index.name_matches(name)
+            sources.append((len(named), None, lambda: named))
+        if min_price is not None or max_price is not None or sort_by == 'price':
+            sources.append((index.count_in_price_range(min_price, max_price), 'price',
+                            lambda: index.iter_price_range(min_price, max_price, descending)))
+        if sort_by == 'name':
+            sources.append((len(index), 'name', lambda: index.iter_by_name(descending)))
+        if not sources:
+            sources.append((len(self.items), None, lambda: self.items))
+        # The smallest candidate set wins; on a tie, one already in the requested order
+        smallest, order, stream = min(sources, key=lambda source: (source[0], source[1] != sort_by))
+        ordered = next((source for source in sources if source[1] == sort_by), None)
+        if limit is not None and ordered is not None and order != sort_by:
+            # Walking the ordered candidates stops after ``limit`` matches; if
+            # matches are spread evenly that takes about this many steps
+            steps = ordered[0] * limit / max(smallest, 1)
+            if steps <= smallest:
+                _, order, stream = ordered
+
+        text = name.lower() if name else None
+        matches = (
+            item for item in stream()
+            if (participant is None or participant in item['participants'])
+            and (min_price is None or item['price'] >= min_price)
+            and (max_price is None or item['price'] <= max_price)
+            and (text is None or text in item['item_name'].lower())
+        )
+        if sort_by is None or order == sort_by:
+            # Already in order, so a limited query stops after ``limit`` matches
+            return list(islice(matches, limit))
+
+        key = (lambda item: item['price']) if sort_by == 'price' else (lambda item: item['item_name'].lower())
+        if limit is not None:
+            return (heapq.nlargest if descending else heapq.nsmallest)(limit, matches, key=key)
+        return sorted(matches, key=key, reverse=descending)
+
+    def item_position(self, item):
+        """Returns the position of this very item (not an equal one) in ``items``, or None."""
+        for position, candidate in enumerate(self.items):
+            if candidate is item:
+                return position
+        return None
+
+    def content_digest(self):
+        """SHA-256 of the bill's contents (id, description, date, participants and items).
+
+        Unlike the history hash it only depends on what the bill holds, not
+        on how it got there.
+        """
+        state = self.to_state()
+        del state['history_hash']
+        for item in state['items']:
+            # 3 and 3.0 are the same price
+            item['price'] = float(item['price'])
+        return hashlib.sha256(_canonical_json(state)).hexdigest()
 
     def get_totals(self):
-        return {name: participant.total_due for name, participant in self.participants.items()}
\ No newline at end of file
+        return {name: participant.total_due for name, participant in self.participants.items()}
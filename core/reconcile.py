@@ -0,0 +1,189 @@
+import csv
+import io
+import re
+from bisect import bisect_left, bisect_right
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from .logic import get_settlements
+
+# Column names looked up in the bank CSV, first match wins
+DATE_COLUMNS = ('date', 'transaction date', 'posted date', 'booking date')
+COUNTERPARTY_COLUMNS = ('counterparty', 'name', 'payee', 'description', 'details')
+AMOUNT_COLUMNS = ('amount', 'credit', 'value')
+
+
+def normalize_name(name):
+    """Case- and whitespace-insensitive form of a counterparty name."""
+    return " ".join(name.split()).casefold()
+
+
+def _parse_cents(text):
+    cleaned = re.sub(r"[^\d.\-]", "", text.replace("(", "-"))
+    try:
+        return int((Decimal(cleaned) * 100).quantize(Decimal(1)))
+    except InvalidOperation:
+        return None
+
+
+def _pick_column(fieldnames, candidates):
+    columns = {name.strip().casefold(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in columns:
+            return columns[candidate]
+    raise ValueError(f"The CSV needs one of these columns: {', '.join(candidates)}")
+
+
+def load_transactions(source):
+    """Reads a bank CSV (a path or a file object) into transaction dicts.
+
+    Returns ``(transactions, skipped)``. Each transaction has an ``id`` (its
+    row number), an ISO ``date``, a ``counterparty`` and an amount in
+    ``cents``. Rows without a readable date or amount are skipped.
+    """
+    if isinstance(source, str):
+        with open(source, 'r', newline='', encoding='utf-8-sig') as f:
+            return load_transactions(f)
+    if isinstance(source.read(0), bytes):
+        # Uploaded files are binary
+        source = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+
+    reader = csv.DictReader(source)
+    date_column = _pick_column(reader.fieldnames or [], DATE_COLUMNS)
+    counterparty_column = _pick_column(reader.fieldnames or [], COUNTERPARTY_COLUMNS)
+    amount_column = _pick_column(reader.fieldnames or [], AMOUNT_COLUMNS)
+
+    transactions = []
+    skipped = 0
+    for row_number, row in enumerate(reader, start=2):
+        cents = _parse_cents(row.get(amount_column) or "")
+        try:
+            day = date.fromisoformat((row.get(date_column) or "").strip()[:10])
+        except ValueError:
+            day = None
+        if cents is None or day is None:
+            skipped += 1
+            continue
+        transactions.append({
+            'id': row_number,
+            'date': day.isoformat(),
+            'counterparty': (row.get(counterparty_column) or "").strip(),
+            'cents': cents,
+        })
+    return transactions, skipped
+
+
+class TransactionIndex:
+    """Incoming transactions indexed for matching against expected transfers.
+
+    - A hash index on (counterparty, cents) finds exact payments directly.
+    - Per counterparty, transactions are sorted by date, so the ones inside a
+      date window are found by bisection.
+    Each transaction can settle only one transfer.
+    """
+
+    def __init__(self, transactions):
+        self.transactions = {t['id']: t for t in transactions}
+        # (counterparty, cents) -> ([day ordinals], [ids]), both sorted by date
+        self._exact = {}
+        # counterparty -> ([day ordinals], [ids]), both sorted by date
+        self._by_counterparty = {}
+        self.used = set()
+
+        # Outgoing payments can't settle what someone owes the payer
+        incoming = sorted(
+            (date.fromisoformat(t['date']).toordinal(), t['id'], normalize_name(t['counterparty']), t['cents'])
+            for t in transactions if t['cents'] > 0
+        )
+        for day, transaction_id, counterparty, cents in incoming:
+            for index, key in ((self._exact, (counterparty, cents)), (self._by_counterparty, counterparty)):
+                days, ids = index.setdefault(key, ([], []))
+                days.append(day)
+                ids.append(transaction_id)
+
+    @staticmethod
+    def _window(entry, start, end):
+        days, ids = entry
+        return ids[bisect_left(days, start):bisect_right(days, end)]
+
+    def take_exact(self, counterparty, cents, start, end):
+        """Claims the earliest unused payment of exactly ``cents`` in the window, if any."""
+        entry = self._exact.get((normalize_name(counterparty), cents))
+        if entry is None:
+            return None
+        for transaction_id in self._window(entry, start, end):
+            if transaction_id not in self.used:
+                self.used.add(transaction_id)
+                return transaction_id
+        return None
+
+    def take_partial(self, counterparty, cents, start, end):
+        """Claims unused smaller payments in the window, in date order, up to ``cents``."""
+        entry = self._by_counterparty.get(normalize_name(counterparty))
+        if entry is None:
+            return []
+        taken, paid = [], 0
+        for transaction_id in self._window(entry, start, end):
+            amount = self.transactions[transaction_id]['cents']
+            if transaction_id not in self.used and paid + amount <= cents:
+                taken.append(transaction_id)
+                paid += amount
+                if paid == cents:
+                    break
+        self.used.update(taken)
+        return taken
+
+    def unused(self):
+        return [t for t in self.transactions.values() if t['id'] not in self.used]
+
+
+def reconcile(bills, transactions, payer, days_before=3, days_after=30):
+    """Matches what each participant owes ``payer`` on the bills against the payer's bank transactions.
+
+    Each expected transfer is first matched to a single payment of the exact
+    amount from that participant, dated between ``days_before`` days before
+    and ``days_after`` days after the bill. Transfers without one then add up
+    smaller payments in the same window. Every transfer is reported as 'paid',
+    'partial' or 'unmatched'. Transactions left over are listed too.
+    """
+    expected = []
+    for bill in bills:
+        day = date.fromisoformat(bill.date).toordinal()
+        for settlement in get_settlements(bill, payer):
+            expected.append((day, bill, settlement))
+    # Older bills claim payments first
+    expected.sort(key=lambda entry: entry[0])
+
+    index = TransactionIndex(transactions)
+    windows = [(day - days_before, day + days_after) for day, _, _ in expected]
+    owed = [int(round(settlement['amount'] * 100)) for _, _, settlement in expected]
+    # Exact payments are claimed for every transfer before any are added up,
+    # so one bill's partial match can't take another bill's exact payment
+    matched = [
+        [] if transaction_id is None else [transaction_id]
+        for transaction_id in (
+            index.take_exact(settlement['from'], cents, *window)
+            for (_, _, settlement), cents, window in zip(expected, owed, windows)
+        )
+    ]
+    for position, (_, _, settlement) in enumerate(expected):
+        if not matched[position]:
+            matched[position] = index.take_partial(settlement['from'], owed[position], *windows[position])
+
+    rows = []
+    for (_, bill, settlement), cents, transaction_ids in zip(expected, owed, matched):
+        paid = sum(index.transactions[transaction_id]['cents'] for transaction_id in transaction_ids)
+        rows.append({
+            'bill_id': bill.bill_id,
+            'bill': bill.description,
+            'bill_date': bill.date,
+            'from': settlement['from'],
+            'to': payer,
+            'owed': cents / 100.0,
+            'paid': paid / 100.0,
+            'status': 'paid' if paid == cents else 'partial' if paid else 'unmatched',
+            'transactions': transaction_ids,
+        })
+
+    counts = {status: sum(1 for row in rows if row['status'] == status) for status in ('paid', 'partial', 'unmatched')}
+    return {'settlements': rows, 'unmatched_transactions': index.unused(), 'summary': counts}
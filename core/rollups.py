@@ -0,0 +1,111 @@
+from datetime import date
+
+from .logic import calculate_totals_in_cents
+
+PERIODS = ('week', 'month', 'year')
+
+
+def period_keys(bill_date):
+    """Returns the bucket an ISO date falls in for each period: '2025-W09', '2025-03' and '2025'."""
+    day = date.fromisoformat(bill_date)
+    iso_year, iso_week, _ = day.isocalendar()
+    return {
+        'week': f"{iso_year}-W{iso_week:02d}",
+        'month': f"{day.year}-{day.month:02d}",
+        'year': f"{day.year}",
+    }
+
+
+def bill_contribution(bill):
+    """What a saved bill adds to the rollups: ``{'date', 'participants': {name: cents}}``.
+
+    Voided bills and bills nobody owes anything on add nothing (None).
+    """
+    if bill.voided:
+        return None
+    owed = {name: cents for name, cents in calculate_totals_in_cents(bill).items() if cents}
+    if not owed:
+        return None
+    return {'date': bill.date, 'participants': owed}
+
+
+def rollup_delta(old, new):
+    """The bucket changes when a bill's contribution goes from ``old`` to ``new`` (either may be None).
+
+    Returns ``{(period, bucket): {'bills': change in bill count, 'participants':
+    {name: change in cents}}}``, holding only the buckets that change; an edit
+    that keeps the bill's date touches one bucket per period.
+    """
+    delta = {}
+    for contribution, sign in ((old, -1), (new, 1)):
+        if contribution is None:
+            continue
+        for period, bucket in period_keys(contribution['date']).items():
+            entry = delta.setdefault((period, bucket), {'bills': 0, 'participants': {}})
+            entry['bills'] += sign
+            for name, cents in contribution['participants'].items():
+                entry['participants'][name] = entry['participants'].get(name, 0) + sign * cents
+    for key in list(delta):
+        entry = delta[key]
+        entry['participants'] = {name: cents for name, cents in entry['participants'].items() if cents}
+        if not entry['bills'] and not entry['participants']:
+            del delta[key]
+    return delta
+
+
+class PeriodRollups:
+    """Per-period totals of saved bills per participant, in integer cents.
+
+    Each bill's last contribution is kept, so saving a bill again or voiding
+    it only applies the difference to the buckets it was and is in.
+    """
+
+    def __init__(self):
+        # bill_id -> contribution
+        self.contributions = {}
+        # (period, bucket) -> {'bills': count, 'participants': {name: cents}}
+        self.buckets = {}
+
+    def update(self, bill_id, contribution):
+        """Replaces a bill's contribution; None takes the bill out of the rollups."""
+        delta = rollup_delta(self.contributions.get(bill_id), contribution)
+        if contribution is None:
+            self.contributions.pop(bill_id, None)
+        else:
+            self.contributions[bill_id] = contribution
+        for key, change in delta.items():
+            entry = self.buckets.setdefault(key, {'bills': 0, 'participants': {}})
+            entry['bills'] += change['bills']
+            participants = entry['participants']
+            for name, cents in change['participants'].items():
+                participants[name] = participants.get(name, 0) + cents
+                if not participants[name]:
+                    del participants[name]
+            if not entry['bills']:
+                del self.buckets[key]
+
+    def table(self, period, start=None, end=None):
+        """Returns ``{bucket: {'bills', 'participants'}}`` for one period, oldest first.
+
+        ``start`` and ``end`` are inclusive bucket labels, like '2025-01'.
+        """
+        rows = {}
+        for (bucket_period, bucket), entry in self.buckets.items():
+            if bucket_period == period and (start is None or bucket >= start) and (end is None or bucket <= end):
+                rows[bucket] = {'bills': entry['bills'], 'participants': dict(entry['participants'])}
+        return dict(sorted(rows.items()))
+
+
+def group_rollups(table, groups):
+    """Adds up a rollup table's participant totals per group: ``{bucket: {group: cents}}``.
+
+    Groups are read from the precomputed buckets, so editing a group never
+    needs the bills again.
+    """
+    return {
+        bucket: {
+            group: sum(entry['participants'].get(member, 0) for member in set(members))
+            for group, members in groups.items()
+        }
+        for bucket, entry in table.items()
+    }
@@ -0,0 +1,204 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+
+# Fuzzy matches less similar than this are noise rather than typos
+MIN_SIMILARITY = 0.2
+
+
+def _trigrams(key):
+    # Padding lets the first and last letters form trigrams of their own
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ParticipantIndex:
+    """Participant roster with prefix and fuzzy search.
+
+    Names are kept sorted by their lowercase form, so prefix matches are a
+    bisection away, and a trigram index finds near matches such as typos.
+    Adding or removing a name updates both in place; nothing is rebuilt.
+    Iterating yields the names in sorted order.
+    """
+
+    def __init__(self, names=()):
+        self._sorted = []
+        self._names = set()
+        # trigram -> names containing it
+        self._grams = {}
+        for name in names:
+            self.add(name)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return (name for _, name in self._sorted)
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def __bool__(self):
+        return bool(self._sorted)
+
+    def add(self, name):
+        """Adds a name; returns False if it is already on the roster."""
+        if name in self._names:
+            return False
+        self._names.add(name)
+        key = name.lower()
+        insort(self._sorted, (key, name))
+        for gram in _trigrams(key):
+            self._grams.setdefault(gram, set()).add(name)
+        return True
+
+    def remove(self, name):
+        """Removes a name; returns False if it isn't on the roster."""
+        if name not in self._names:
+            return False
+        self._names.discard(name)
+        key = name.lower()
+        del self._sorted[bisect_left(self._sorted, (key, name))]
+        for gram in _trigrams(key):
+            members = self._grams[gram]
+            members.discard(name)
+            if not members:
+                del self._grams[gram]
+        return True
+
+    def names(self):
+        """Returns every name in sorted order."""
+        return [name for _, name in self._sorted]
+
+    def prefix_matches(self, prefix, limit=None):
+        """Returns names starting with ``prefix`` (case-insensitive), in sorted order."""
+        prefix = prefix.lower()
+        matches = []
+        for i in range(bisect_left(self._sorted, (prefix,)), len(self._sorted)):
+            key, name = self._sorted[i]
+            if not key.startswith(prefix) or (limit is not None and len(matches) >= limit):
+                break
+            matches.append(name)
+        return matches
+
+    def search(self, query, limit=20):
+        """Returns up to ``limit`` names matching ``query``.
+
+        Prefix matches come first, in sorted order, followed by the closest
+        fuzzy matches by trigram similarity. An empty query returns the first
+        names on the roster.
+        """
+        query = query.strip()
+        matches = self.prefix_matches(query, limit)
+        if not query or len(matches) >= limit:
+            return matches
+
+        query_grams = _trigrams(query.lower())
+        shared = {}
+        for gram in query_grams:
+            for name in self._grams.get(gram, ()):
+                shared[name] = shared.get(name, 0) + 1
+
+        already = set(matches)
+        scored = []
+        for name, count in shared.items():
+            if name in already:
+                continue
+            # Jaccard similarity of the two trigram sets
+            score = count / (len(query_grams) + len(_trigrams(name.lower())) - count)
+            if score >= MIN_SIMILARITY:
+                scored.append((-score, name))
+        return matches + [name for _, name in heapq.nsmallest(limit - len(matches), scored)]
+
+
+def _substring_grams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+class ItemIndex:
+    """A bill's items indexed by price and by name.
+
+    Prices and lowercase names are kept in sorted lists, so a price range
+    is two bisections away and items can be walked in price or name order,
+    and names are indexed by trigram, so a name substring only looks at
+    names sharing all of its trigrams. Items are tracked by identity and
+    updated in place as they are added, edited and removed.
+    """
+
+    def __init__(self, items=()):
+        self._items = {}
+        # Sorted (price, id(item)) pairs
+        self._prices = []
+        # Sorted (lowercase name, id(item)) pairs
+        self._sorted_names = []
+        # lowercase name -> {id(item): item}
+        self._names = {}
+        # trigram -> lowercase names containing it
+        self._grams = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        key = id(item)
+        self._items[key] = item
+        insort(self._prices, (item['price'], key))
+        name = item['item_name'].lower()
+        insort(self._sorted_names, (name, key))
+        if name not in self._names:
+            self._names[name] = {}
+            for gram in _substring_grams(name):
+                self._grams.setdefault(gram, set()).add(name)
+        self._names[name][key] = item
+
+    def remove(self, item):
+        """Removes an item, which must still have the price and name it was added with."""
+        key = id(item)
+        del self._items[key]
+        del self._prices[bisect_left(self._prices, (item['price'], key))]
+        name = item['item_name'].lower()
+        del self._sorted_names[bisect_left(self._sorted_names, (name, key))]
+        entries = self._names[name]
+        del entries[key]
+        if not entries:
+            del self._names[name]
+            for gram in _substring_grams(name):
+                names = self._grams[gram]
+                names.discard(name)
+                if not names:
+                    del self._grams[gram]
+
+    def _price_bounds(self, low=None, high=None):
+        start = 0 if low is None else bisect_left(self._prices, (low,))
+        # Ids are ints, so (high, inf) sorts after every pair priced at high
+        end = len(self._prices) if high is None else bisect_right(self._prices, (high, float('inf')))
+        return start, max(start, end)
+
+    def count_in_price_range(self, low=None, high=None):
+        start, end = self._price_bounds(low, high)
+        return end - start
+
+    def iter_price_range(self, low=None, high=None, descending=False):
+        """Yields the items priced between ``low`` and ``high`` (inclusive), in price order."""
+        start, end = self._price_bounds(low, high)
+        positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+        for position in positions:
+            yield self._items[self._prices[position][1]]
+
+    def iter_by_name(self, descending=False):
+        """Yields every item in name order, ignoring case."""
+        pairs = reversed(self._sorted_names) if descending else iter(self._sorted_names)
+        for _, key in pairs:
+            yield self._items[key]
+
+    def name_matches(self, text):
+        """Returns the items whose name contains ``text``, ignoring case."""
+        text = text.lower()
+        grams = sorted((self._grams.get(gram, set()) for gram in _substring_grams(text)), key=len)
+        if grams:
+            names = set(grams[0]).intersection(*grams[1:])
+        else:
+            # Too short to have trigrams; the distinct names are far fewer than the items
+            names = self._names
+        return [item for name in names if text in name for item in self._names[name].values()]
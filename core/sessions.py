@@ -0,0 +1,174 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from .models import Bill
+from .storage import save_bill, load_bill
+
+
+def estimate_size(obj, _seen=None):
+    """Approximates the bytes held by an object graph.
+
+    Follows containers and instance attributes, counting each object once.
+    pandas objects report their own deep memory usage.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'dtypes'):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, seen) + estimate_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            size += estimate_size(value, seen)
+    if hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+def bill_memory_usage(bill: Bill):
+    """Returns the approximate bytes held by a bill, split into the bill itself and its undo history."""
+    seen = set()
+    history = 0
+    if bill.event_log is not None:
+        history = estimate_size(bill.event_log, seen)
+    # Observers (e.g. live replicas) hold their own state; count only the bill's data
+    seen.update(id(observer) for observer in bill.observers)
+    return {'bill': estimate_size(bill, seen), 'history': history}
+
+
+class SessionRegistry:
+    """Tracks the bill of every app session and spills idle ones to disk.
+
+    A session checks in at the start of each run and out at the end. When a
+    session has been idle for ``idle_ttl`` seconds, its bill is saved as a
+    compact .bill file and emptied in place, and its cached exports and undo
+    history are dropped. The bill is reloaded when the session checks in
+    again. Spilled sessions idle for ``expire_after`` seconds are forgotten.
+    """
+
+    def __init__(self, idle_ttl=1800, spill_dir=None, expire_after=86400, export_manager=None):
+        self.idle_ttl = idle_ttl
+        self.expire_after = expire_after
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), "bill_splitter_sessions")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.export_manager = export_manager
+        # session id -> {'bill', 'last_seen', 'spilled_path'}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def check_in(self, session_id, bill: Bill):
+        """Marks a session as in use. Returns True if its bill had to be reloaded from disk.
+
+        Safe to call several times per run; call it before anything touches the bill.
+        """
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, {'spilled_path': None})
+            entry.update(bill=bill, last_seen=time.time())
+            path = entry['spilled_path']
+            if path is None:
+                return False
+            # Reload under the lock so a concurrent sweep can't see a half-loaded bill
+            bill.load_state(load_bill(path).to_state(), copy=False)
+            entry['spilled_path'] = None
+        os.remove(path)
+        return True
+
+    def check_out(self, session_id):
+        """Marks the end of a session's run, so idle time counts from here."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry['last_seen'] = time.time()
+
+    def is_spilled(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry is not None and entry['spilled_path'] is not None
+
+    def _spill(self, session_id, entry):
+        bill = entry['bill']
+        path = os.path.join(self.spill_dir, f"{session_id}.bill")
+        save_bill(bill, path)
+        # Empty the bill in place; the session still holds this object
+        bill.items = []
+        bill.participants = {}
+        bill._item_splits = None
+        bill._participant_items = None
+        bill._category_totals = None
+        bill._item_index = None
+        bill.event_log = None
+        entry['spilled_path'] = path
+        if self.export_manager is not None:
+            self.export_manager.discard(bill.bill_id)
+
+    def sweep(self, now=None):
+        """Spills sessions idle longer than idle_ttl. Returns the ids spilled."""
+        now = time.time() if now is None else now
+        spilled = []
+        with self._lock:
+            for session_id, entry in list(self._sessions.items()):
+                idle = now - entry['last_seen']
+                if entry['spilled_path'] is None and idle >= self.idle_ttl:
+                    self._spill(session_id, entry)
+                    spilled.append(session_id)
+                elif entry['spilled_path'] is not None and idle >= self.expire_after:
+                    if os.path.exists(entry['spilled_path']):
+                        os.remove(entry['spilled_path'])
+                    del self._sessions[session_id]
+        return spilled
+
+    def start_background_sweeps(self, interval=None):
+        """Sweeps periodically in a daemon thread, so idle sessions are spilled even when no one is active."""
+        if self._sweeper is not None:
+            return
+        interval = interval or max(self.idle_ttl / 4, 1)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def memory_report(self, session_id=None):
+        """Returns one row per tracked session with its idle time and approximate memory use in bytes.
+
+        Pass ``session_id`` to report only that session.
+        """
+        now = time.time()
+        with self._lock:
+            entries = [
+                (key, entry) for key, entry in self._sessions.items() if session_id is None or key == session_id
+            ]
+        rows = []
+        for session_id, entry in entries:
+            spilled = entry['spilled_path'] is not None
+            try:
+                usage = bill_memory_usage(entry['bill'])
+            except RuntimeError:
+                # The session is mutating its bill right now; skip it this time
+                continue
+            rows.append({
+                'session': session_id,
+                'idle_seconds': round(now - entry['last_seen']),
+                'spilled': spilled,
+                'bill_bytes': usage['bill'],
+                'history_bytes': usage['history'],
+                'export_bytes': self.export_manager.memory_usage(entry['bill'].bill_id) if self.export_manager else 0,
+                'disk_bytes': os.path.getsize(entry['spilled_path']) if spilled and os.path.exists(entry['spilled_path']) else 0,
+            })
+        return rows
@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .models import Bill
+from .logic import resource_path
+from .rollups import PeriodRollups, bill_contribution, rollup_delta
+from .storage import encode_bill, decode_bill
+
+
+class RevisionConflict(Exception):
+    """Raised when a bill was saved by someone else since it was loaded."""
+
+    def __init__(self, bill_id, expected_revision, actual_revision):
+        super().__init__(
+            f"Bill {bill_id} is at revision {actual_revision}, expected {expected_revision}"
+        )
+        self.bill_id = bill_id
+        self.expected_revision = expected_revision
+        self.actual_revision = actual_revision
+
+
+class BillStore:
+    """Shared bill storage with optimistic concurrency.
+
+    Every save bumps the bill's revision. A save must name the revision it
+    was based on (0 for a new bill) and fails with RevisionConflict if the
+    stored bill has moved on, so concurrent writers can't overwrite each
+    other's changes.
+
+    Stores also keep week, month and year rollups of what each participant
+    owes across all stored bills. Saves and deletes update them together
+    with the bill, touching only the buckets the bill was and is in.
+    """
+
+    def revision(self, bill_id):
+        """Returns the stored revision of a bill, or 0 if it isn't stored."""
+        raise NotImplementedError
+
+    def load(self, bill_id):
+        """Returns ``(bill, revision)``, or ``(None, 0)`` if the bill isn't stored."""
+        raise NotImplementedError
+
+    def save(self, bill: Bill, expected_revision):
+        """Stores the bill and returns its new revision."""
+        raise NotImplementedError
+
+    def delete(self, bill_id):
+        raise NotImplementedError
+
+    def rollups(self, period, start=None, end=None):
+        """Returns ``{bucket: {'bills', 'participants': {name: cents}}}`` for a period in PERIODS, oldest first."""
+        raise NotImplementedError
+
+
+class MemoryBillStore(BillStore):
+    """In-process store, for tests and single-process deployments."""
+
+    def __init__(self):
+        self._bills = {}
+        self._rollups = PeriodRollups()
+        self._lock = threading.Lock()
+
+    def revision(self, bill_id):
+        with self._lock:
+            return self._bills.get(bill_id, (None, 0))[1]
+
+    def load(self, bill_id):
+        with self._lock:
+            data, revision = self._bills.get(bill_id, (None, 0))
+        if data is None:
+            return None, 0
+        return decode_bill(data), revision
+
+    def save(self, bill: Bill, expected_revision):
+        # Encode outside the lock; the stored bytes are an immutable snapshot
+        data = encode_bill(bill)
+        contribution = bill_contribution(bill)
+        with self._lock:
+            current = self._bills.get(bill.bill_id, (None, 0))[1]
+            if current != expected_revision:
+                raise RevisionConflict(bill.bill_id, expected_revision, current)
+            self._bills[bill.bill_id] = (data, current + 1)
+            self._rollups.update(bill.bill_id, contribution)
+            return current + 1
+
+    def delete(self, bill_id):
+        with self._lock:
+            self._bills.pop(bill_id, None)
+            self._rollups.update(bill_id, None)
+
+    def rollups(self, period, start=None, end=None):
+        with self._lock:
+            return self._rollups.table(period, start, end)
+
+
+class SQLiteBillStore(BillStore):
+    """Store backed by a local SQLite file that any worker process can open."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bills ("
+                "bill_id TEXT PRIMARY KEY, revision INTEGER NOT NULL, "
+                "data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # Each bill's last contribution (JSON, 'null' for none), so a save knows what to take back out
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bill_rollups ("
+                "bill_id TEXT PRIMARY KEY, contribution TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS period_bills ("
+                "period TEXT NOT NULL, bucket TEXT NOT NULL, bills INTEGER NOT NULL, "
+                "PRIMARY KEY (period, bucket))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS period_rollups ("
+                "period TEXT NOT NULL, bucket TEXT NOT NULL, participant TEXT NOT NULL, cents INTEGER NOT NULL, "
+                "PRIMARY KEY (period, bucket, participant))"
+            )
+            # Bills saved before the rollups existed are added once
+            missing = conn.execute(
+                "SELECT bill_id, data FROM bills WHERE bill_id NOT IN (SELECT bill_id FROM bill_rollups)"
+            ).fetchall()
+            for bill_id, data in missing:
+                self._update_rollups(conn, bill_id, bill_contribution(decode_bill(data)))
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the store safe to share between threads
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _update_rollups(conn, bill_id, contribution):
+        """Applies the change in a bill's contribution inside the caller's transaction."""
+        row = conn.execute("SELECT contribution FROM bill_rollups WHERE bill_id = ?", (bill_id,)).fetchone()
+        delta = rollup_delta(json.loads(row[0]) if row else None, contribution)
+        for (period, bucket), change in delta.items():
+            if change['bills']:
+                conn.execute(
+                    "INSERT INTO period_bills (period, bucket, bills) VALUES (?, ?, ?) "
+                    "ON CONFLICT (period, bucket) DO UPDATE SET bills = bills + excluded.bills",
+                    (period, bucket, change['bills'])
+                )
+            conn.executemany(
+                "INSERT INTO period_rollups (period, bucket, participant, cents) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (period, bucket, participant) DO UPDATE SET cents = cents + excluded.cents",
+                [(period, bucket, name, cents) for name, cents in change['participants'].items()]
+            )
+            conn.execute("DELETE FROM period_bills WHERE period = ? AND bucket = ? AND bills = 0", (period, bucket))
+            conn.execute("DELETE FROM period_rollups WHERE period = ? AND bucket = ? AND cents = 0", (period, bucket))
+        conn.execute(
+            "INSERT OR REPLACE INTO bill_rollups (bill_id, contribution) VALUES (?, ?)",
+            (bill_id, json.dumps(contribution))
+        )
+
+    def revision(self, bill_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT revision FROM bills WHERE bill_id = ?", (bill_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, bill_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, revision FROM bills WHERE bill_id = ?", (bill_id,)).fetchone()
+        if row is None:
+            return None, 0
+        return decode_bill(row[0]), row[1]
+
+    def save(self, bill: Bill, expected_revision):
+        data = encode_bill(bill)
+        contribution = bill_contribution(bill)
+        new_revision = expected_revision + 1
+        with self._connect() as conn:
+            if expected_revision == 0:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO bills (bill_id, revision, data, updated_at) VALUES (?, ?, ?, ?)",
+                    (bill.bill_id, new_revision, data, time.time())
+                )
+            else:
+                # The revision check and the write are a single atomic statement
+                cursor = conn.execute(
+                    "UPDATE bills SET revision = ?, data = ?, updated_at = ? WHERE bill_id = ? AND revision = ?",
+                    (new_revision, data, time.time(), bill.bill_id, expected_revision)
+                )
+            if cursor.rowcount == 0:
+                row = conn.execute("SELECT revision FROM bills WHERE bill_id = ?", (bill.bill_id,)).fetchone()
+                raise RevisionConflict(bill.bill_id, expected_revision, row[0] if row else 0)
+            # Same transaction as the write, so the rollups always match the stored bills
+            self._update_rollups(conn, bill.bill_id, contribution)
+        return new_revision
+
+    def delete(self, bill_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM bills WHERE bill_id = ?", (bill_id,))
+            self._update_rollups(conn, bill_id, None)
+            conn.execute("DELETE FROM bill_rollups WHERE bill_id = ?", (bill_id,))
+
+    def rollups(self, period, start=None, end=None):
+        query = "SELECT bucket, {} FROM {} WHERE period = ?"
+        args = [period]
+        if start is not None:
+            query += " AND bucket >= ?"
+            args.append(start)
+        if end is not None:
+            query += " AND bucket <= ?"
+            args.append(end)
+        with self._connect() as conn:
+            bills = conn.execute(query.format("bills", "period_bills"), args).fetchall()
+            owed = conn.execute(query.format("participant, cents", "period_rollups"), args).fetchall()
+        table = {bucket: {'bills': count, 'participants': {}} for bucket, count in sorted(bills)}
+        for bucket, name, cents in owed:
+            table[bucket]['participants'][name] = cents
+        return table
+
+
+def create_bill_store(backend=None, path=None):
+    """Creates the store named by ``backend`` or the BILL_STORE environment variable.
+
+    ``"sqlite"`` (the default) uses ``path`` or BILL_STORE_PATH; ``"memory"``
+    keeps bills in this process only.
+    """
+    backend = backend or os.environ.get("BILL_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryBillStore()
+    if backend == "sqlite":
+        return SQLiteBillStore(path or os.environ.get("BILL_STORE_PATH") or resource_path("bills.sqlite3"))
+    raise ValueError(f"Unknown bill store backend: {backend}")
@@ -0,0 +1,203 @@
+import csv
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from itertools import chain, islice
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+from .logic import get_participant_statement
+
+# Below this many statements, starting worker processes costs more than it saves
+PARALLEL_THRESHOLD = 16
+WORKERS = os.cpu_count() or 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Returns the process pool shared by every bulk export in this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers are safe to start from the app's and the API's threads
+            _pool = ProcessPoolExecutor(max_workers=WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def render_statement_pdf(job):
+    """Renders one participant's statement of one bill as PDF bytes."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    statement = job['statement']
+    elements = [
+        Paragraph(f"{statement['participant']}: {job['description']}", styles['Title']),
+        Paragraph(f"Bill date: {job['date']}", styles['Normal']),
+        Spacer(1, 12),
+    ]
+
+    data = [['Item', 'Price', 'Shared With', 'Your Share', 'Running Total']]
+    for row in statement['items']:
+        data.append([
+            row['item_name'],
+            f"${row['price']:.2f}",
+            str(row['shared_with']),
+            f"${row['share']:.2f}",
+            f"${row['running_total']:.2f}",
+        ])
+    if len(data) > 1:
+        t = Table(data, colWidths=[160, 80, 80, 90, 100])
+        t.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]))
+        elements.append(t)
+    else:
+        elements.append(Paragraph("No items on this bill.", styles['Normal']))
+
+    elements.append(Spacer(1, 12))
+    elements.append(Paragraph(f"You owe: ${statement['total']:.2f}", styles['Heading2']))
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_statement_csv(job):
+    """Renders one participant's statement of one bill as CSV bytes."""
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['item_name', 'price', 'shared_with', 'share', 'running_total'])
+    for row in job['statement']['items']:
+        writer.writerow([row['item_name'], f"{row['price']:.2f}", row['shared_with'],
+                         f"{row['share']:.2f}", f"{row['running_total']:.2f}"])
+    writer.writerow(['Total', '', '', f"{job['statement']['total']:.2f}", ''])
+    return out.getvalue().encode('utf-8')
+
+
+STATEMENT_RENDERERS = {
+    'pdf': render_statement_pdf,
+    'csv': render_statement_csv,
+}
+
+
+def safe_file_name(text):
+    """Turns a bill title or participant name into a file name, keeping letters in any script."""
+    return re.sub(r'[^\w.-]+', '_', text).strip('_') or "unnamed"
+
+
+def _unique_name(name, used):
+    """Returns ``name``, or ``name_2``, ``name_3``... if it is taken, and marks it as taken.
+
+    Names are compared case-insensitively, since extracting to a
+    case-insensitive file system would merge them too.
+    """
+    candidate, suffix = name, 1
+    while candidate.casefold() in used:
+        suffix += 1
+        candidate = f"{name}_{suffix}"
+    used.add(candidate.casefold())
+    return candidate
+
+
+def statement_jobs(bills, participants=None):
+    """Yields one small job per (bill, participant) with items on it.
+
+    Only the statement rows travel to the workers, not the bills, and
+    each is looked up through the bill's participant index. Names that
+    sanitize to the same file or folder name get a numbered suffix, so
+    every statement has its own ZIP entry.
+    """
+    folders = set()
+    for bill in bills:
+        folder = _unique_name(f"{safe_file_name(bill.description)}_{bill.bill_id[:8]}", folders)
+        names = bill.get_item_participants() if participants is None else participants
+        files = set()
+        for name in sorted(names):
+            yield {
+                'path': f"{folder}/{_unique_name(safe_file_name(name), files)}",
+                'description': bill.description,
+                'date': bill.date,
+                'statement': get_participant_statement(bill, name),
+            }
+
+
+def iter_statements(bills, file_format='pdf', participants=None, parallel=None):
+    """Yields ``(file name, bytes)`` per participant statement, in order.
+
+    Large batches render in worker processes. At most a couple of results per
+    worker wait in memory at any time, so the batch size doesn't matter.
+    """
+    render = STATEMENT_RENDERERS[file_format]
+    jobs = statement_jobs(bills, participants)
+    head = list(islice(jobs, PARALLEL_THRESHOLD))
+    if parallel is None:
+        parallel = WORKERS > 1 and len(head) >= PARALLEL_THRESHOLD
+    if not parallel:
+        for job in chain(head, jobs):
+            yield f"{job['path']}.{file_format}", render(job)
+        return
+
+    pool = _get_pool()
+    window = deque()
+    for job in chain(head, jobs):
+        window.append((job['path'], pool.submit(render, job)))
+        if len(window) >= 2 * WORKERS:
+            path, future = window.popleft()
+            yield f"{path}.{file_format}", future.result()
+    while window:
+        path, future = window.popleft()
+        yield f"{path}.{file_format}", future.result()
+
+
+class _ChunkSink:
+    """Write-only file object that hands out what was written since the last call."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_statements_zip(bills, file_format='pdf', participants=None, parallel=None):
+    """Yields a ZIP of every participant's statement in chunks, as the statements are rendered."""
+    sink = _ChunkSink()
+    # The sink can't seek, so zipfile streams each entry with a trailing data descriptor
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_name, data in iter_statements(bills, file_format, participants, parallel):
+            archive.writestr(file_name, data)
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    chunk = sink.take()
+    if chunk:
+        yield chunk
+
+
+def statements_zip(bills, file_format='pdf', participants=None, parallel=None):
+    """Returns the whole statements ZIP as bytes."""
+    return b"".join(stream_statements_zip(bills, file_format, participants, parallel))
@@ -0,0 +1,195 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from .models import Bill
+
+# Layout of a .bill file (all integers little-endian):
+#   magic b"BILL", format version (uint16), header length (uint32)
+#   JSON header: description, participant table, item count, extra item columns
+#   prices          float64[n]
+#   name offsets    uint32[n + 1]  byte offsets into the names blob
+#   names blob      UTF-8
+#   member offsets  uint32[n + 1]  offsets into the member indices
+#   member indices  uint32[m]      indices into the participant table
+MAGIC = b"BILL"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<4sHI")
+_CORE_ITEM_FIELDS = ('item_name', 'price', 'participants')
+INVALID_FILE = "Not a valid .bill file"
+
+
+def _to_bytes(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_buffer(buffer, typecode, offset, count):
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    if count < 0 or end > len(buffer):
+        raise ValueError(INVALID_FILE)
+    values.frombytes(buffer[offset:end])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values, end
+
+
+def _check_offsets(offsets, limit):
+    """Offsets must start at 0, never decrease and end within ``limit``."""
+    if offsets[0] != 0 or offsets[-1] > limit or any(a > b for a, b in zip(offsets, offsets[1:])):
+        raise ValueError(INVALID_FILE)
+
+
+def _check_header(header):
+    count = header.get('item_count') if isinstance(header, dict) else None
+    if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+        raise ValueError(INVALID_FILE)
+    participants = header.get('participants')
+    bill_participants = header.get('bill_participants')
+    columns = header.get('extra_columns', {})
+    if (not isinstance(header.get('description'), str)
+            or not isinstance(participants, list) or not all(isinstance(name, str) for name in participants)
+            or not isinstance(bill_participants, int) or not 0 <= bill_participants <= len(participants)
+            or not isinstance(columns, dict)
+            or not all(isinstance(column, list) and len(column) == count for column in columns.values())
+            or not isinstance(header.get('extra_fields', {}), dict)):
+        raise ValueError(INVALID_FILE)
+
+
+def encode_bill(bill: Bill):
+    """Serializes a bill, including all items and participants, to bytes."""
+    state = bill.to_state()
+    items = state['items']
+    participant_table = list(state['participants'])
+    participant_index = {name: i for i, name in enumerate(participant_table)}
+
+    prices = array('d')
+    name_offsets = array('I', [0])
+    names_blob = bytearray()
+    member_offsets = array('I', [0])
+    member_indices = array('I')
+    extra_columns = {}
+
+    for position, item in enumerate(items):
+        prices.append(item['price'])
+        names_blob += item['item_name'].encode('utf-8')
+        name_offsets.append(len(names_blob))
+        for name in item['participants']:
+            if name not in participant_index:
+                participant_index[name] = len(participant_table)
+                participant_table.append(name)
+            member_indices.append(participant_index[name])
+        member_offsets.append(len(member_indices))
+        # Any other item fields are kept as JSON columns so they survive the round trip
+        for key, value in item.items():
+            if key not in _CORE_ITEM_FIELDS:
+                extra_columns.setdefault(key, [None] * len(items))[position] = value
+
+    header = {
+        'description': state['description'],
+        'participants': participant_table,
+        'bill_participants': len(state['participants']),
+        'item_count': len(items),
+        'extra_columns': extra_columns,
+    }
+    for key, value in state.items():
+        if key not in ('description', 'participants', 'items'):
+            header.setdefault('extra_fields', {})[key] = value
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    return b"".join([
+        _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)),
+        header_bytes,
+        _to_bytes(prices),
+        _to_bytes(name_offsets),
+        bytes(names_blob),
+        _to_bytes(member_offsets),
+        _to_bytes(member_indices),
+    ])
+
+
+def decode_bill(buffer):
+    """Rebuilds a bill from bytes (or any buffer, e.g. an mmap) written by encode_bill().
+
+    Raises ValueError for anything that is not a complete, well-formed .bill
+    file; the sizes in the header are checked against the buffer before any
+    column is read.
+    """
+    if len(buffer) < _PREAMBLE.size:
+        raise ValueError(INVALID_FILE)
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(INVALID_FILE)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported bill file version: {version}")
+
+    offset = _PREAMBLE.size
+    if offset + header_length > len(buffer):
+        raise ValueError(INVALID_FILE)
+    try:
+        header = json.loads(bytes(buffer[offset:offset + header_length]).decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError(INVALID_FILE) from None
+    _check_header(header)
+    offset += header_length
+    count = header['item_count']
+
+    prices, offset = _from_buffer(buffer, 'd', offset, count)
+    name_offsets, offset = _from_buffer(buffer, 'I', offset, count + 1)
+    _check_offsets(name_offsets, len(buffer) - offset)
+    names_blob = bytes(buffer[offset:offset + name_offsets[-1]])
+    offset += name_offsets[-1]
+    member_offsets, offset = _from_buffer(buffer, 'I', offset, count + 1)
+    _check_offsets(member_offsets, (len(buffer) - offset) // array('I').itemsize)
+    member_indices, offset = _from_buffer(buffer, 'I', offset, member_offsets[-1])
+    if offset != len(buffer):
+        raise ValueError(INVALID_FILE)
+
+    participant_table = header['participants']
+    if any(i >= len(participant_table) for i in member_indices):
+        raise ValueError(INVALID_FILE)
+    members = [participant_table[i] for i in member_indices]
+    extra_columns = header.get('extra_columns', {})
+    items = []
+    try:
+        for i in range(count):
+            item = {
+                'item_name': names_blob[name_offsets[i]:name_offsets[i + 1]].decode('utf-8'),
+                'price': prices[i],
+                'participants': members[member_offsets[i]:member_offsets[i + 1]],
+            }
+            for key, column in extra_columns.items():
+                if column[i] is not None:
+                    item[key] = column[i]
+            items.append(item)
+    except UnicodeDecodeError:
+        raise ValueError(INVALID_FILE) from None
+
+    state = {
+        'description': header['description'],
+        'participants': participant_table[:header['bill_participants']],
+        'items': items,
+    }
+    state.update(header.get('extra_fields', {}))
+    try:
+        return Bill.from_state(state, copy=False)
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError(INVALID_FILE) from None
+
+
+def save_bill(bill: Bill, path):
+    """Writes a lossless binary snapshot of the bill to a file."""
+    with open(path, 'wb') as f:
+        f.write(encode_bill(bill))
+
+
+def load_bill(path):
+    """Reopens a bill saved with save_bill(), memory-mapping the file."""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_bill(mapped)
@@ -0,0 +1,147 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Summary rows that aren't items
+TOTAL_ROW = 'Total'
+TOTAL_COLUMN = 'Total Price'
+
+
+class SummaryTotals:
+    """Partial totals over a set of bill summaries, in integer cents.
+
+    Partials from separate chunks combine with merge(), so any split of the
+    history into chunks gives the same result.
+    """
+
+    def __init__(self):
+        self.bills = 0
+        self.total_cents = 0
+        self.participants = {}
+        self.groups = {}
+        self.errors = 0
+
+    def add(self, summary, groups=None):
+        """Adds one bill summary as written by save_to_json()."""
+        table = summary['summary_table']
+        if TOTAL_ROW in table:
+            owed = table[TOTAL_ROW]
+        else:
+            # Summaries without a total row are summed item by item
+            owed = {}
+            for row in table.values():
+                for name, amount in row.items():
+                    owed[name] = owed.get(name, 0) + amount
+        cents = {name: int(round(amount * 100)) for name, amount in owed.items() if name != TOTAL_COLUMN}
+
+        self.bills += 1
+        self.total_cents += sum(cents.values())
+        for name, amount in cents.items():
+            self.participants[name] = self.participants.get(name, 0) + amount
+        for group, members in (groups or {}).items():
+            self.groups[group] = self.groups.get(group, 0) + sum(cents.get(member, 0) for member in set(members))
+
+    def merge(self, other):
+        self.bills += other.bills
+        self.total_cents += other.total_cents
+        self.errors += other.errors
+        for name, amount in other.participants.items():
+            self.participants[name] = self.participants.get(name, 0) + amount
+        for group, amount in other.groups.items():
+            self.groups[group] = self.groups.get(group, 0) + amount
+        return self
+
+    def to_dict(self):
+        """Returns the totals in dollars."""
+        return {
+            'bills': self.bills,
+            'skipped': self.errors,
+            'total': self.total_cents / 100.0,
+            'participants': {name: cents / 100.0 for name, cents in sorted(self.participants.items())},
+            'groups': {group: cents / 100.0 for group, cents in sorted(self.groups.items())},
+        }
+
+
+def iter_summary_paths(sources):
+    """Yields summary files from paths and folders (searched recursively), in sorted order."""
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for file_name in sorted(files):
+                    if file_name.endswith(('.json', '.jsonl')):
+                        yield os.path.join(root, file_name)
+        else:
+            yield source
+
+
+def _read_records(path):
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield f.read()
+
+
+def iter_summary_records(sources):
+    """Yields the raw JSON text of each bill summary, one at a time.
+
+    A .json file holds one summary; a .jsonl file holds one per line and is
+    read line by line, so no file is ever loaded whole. A file that can't be
+    read or isn't UTF-8 yields None in place of its remaining summaries, so
+    it is counted as skipped instead of ending the run.
+    """
+    for path in iter_summary_paths(sources):
+        try:
+            yield from _read_records(path)
+        except (OSError, UnicodeDecodeError):
+            yield None
+
+
+def aggregate_chunk(records, groups=None):
+    """Parses and reduces one chunk of raw summaries. Runs in worker processes."""
+    totals = SummaryTotals()
+    for record in records:
+        if record is None:
+            totals.errors += 1
+            continue
+        try:
+            summary = json.loads(record)
+            totals.add(summary, groups)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            totals.errors += 1
+    return totals
+
+
+def aggregate_summaries(sources, groups=None, chunk_size=500, workers=1):
+    """Totals per participant and per group across many save_to_json() summaries.
+
+    Summaries are streamed from disk in chunks of ``chunk_size`` and reduced
+    one chunk at a time. Memory use depends on the chunk size and the number
+    of participants, not on the length of the history. With ``workers`` > 1,
+    chunks are parsed in that many processes, with at most two chunks per
+    worker in flight.
+    """
+    records = iter_summary_records(sources)
+    chunks = iter(lambda: list(islice(records, chunk_size)), [])
+    result = SummaryTotals()
+    if workers <= 1:
+        for chunk in chunks:
+            result.merge(aggregate_chunk(chunk, groups))
+        return result
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        window = deque()
+        for chunk in chunks:
+            window.append(pool.submit(aggregate_chunk, chunk, groups))
+            if len(window) >= 2 * workers:
+                result.merge(window.popleft().result())
+        while window:
+            result.merge(window.popleft().result())
+    return result
@@ -0,0 +1,162 @@
+import json
+
+import numpy as np
+
+from .models import Bill
+from .logic import resource_path
+from .allocation import allocate_cents, quantity_weight, MAX_PRICE
+
+TEMPLATES_FILE = resource_path("templates.json")
+
+
+class SplitPlan:
+    """A template's item-to-participant splits, compiled into flat index arrays.
+
+    Each (item, participant) pair is one slot. Splitting a new set of prices
+    is then a few array operations over all slots at once: the base share is
+    ``cents // n`` and the first ``cents % n`` participants of an item get one
+    extra cent, exactly as split_price_in_cents does for a single item. Plans
+    with items split by quantity weigh each slot and use allocate_cents().
+    """
+
+    def __init__(self, items):
+        self.item_names = [item['item_name'] for item in items]
+        self.item_categories = [item.get('category') for item in items]
+        self.item_quantities = [item.get('quantities') for item in items]
+        self.participants = []
+        self.item_participants = []
+        columns = {}
+        item_of, slot, column, weights = [], [], [], []
+        sizes = []
+        for index, item in enumerate(items):
+            # A name listed twice would get two shares here but one in split_price_in_cents
+            names = list(item['quantities'] if item.get('quantities') else dict.fromkeys(item['participants']))
+            self.item_participants.append(names)
+            sizes.append(len(names))
+            for position, name in enumerate(names):
+                if name not in columns:
+                    columns[name] = len(self.participants)
+                    self.participants.append(name)
+                item_of.append(index)
+                slot.append(position)
+                column.append(columns[name])
+                weights.append(quantity_weight(item['quantities'][name]) if item.get('quantities') else 1)
+        # Only needed when some item is split by quantity
+        self.weights = np.array(weights, dtype=np.int64) if any(self.item_quantities) else None
+        self.sizes = np.array(sizes, dtype=np.int64)
+        self.item_of = np.array(item_of, dtype=np.int64)
+        self.slot = np.array(slot, dtype=np.int64)
+        self.column = np.array(column, dtype=np.int64)
+
+    def to_cents(self, prices):
+        prices = np.asarray(prices, dtype=np.float64)
+        if prices.shape != (len(self.item_names),):
+            raise ValueError(f"Expected {len(self.item_names)} prices, got {prices.shape[0] if prices.ndim else 1}")
+        if not np.all(np.abs(prices) <= MAX_PRICE):
+            # Also catches NaN, which compares false
+            raise ValueError(f"Prices must be numbers no larger than {MAX_PRICE:,}")
+        return np.rint(prices * 100).astype(np.int64)
+
+    def shares(self, prices):
+        """Returns every slot's share in cents for one price per item."""
+        cents = self.to_cents(prices)
+        if self.weights is not None:
+            return allocate_cents(cents, self.weights, self.sizes)
+        sizes = np.maximum(self.sizes, 1)
+        base = cents // sizes
+        remainder = cents % sizes
+        return base[self.item_of] + (self.slot < remainder[self.item_of])
+
+    def totals(self, prices):
+        """Returns each participant's total in cents for one price per item."""
+        per_participant = np.bincount(self.column, weights=self.shares(prices), minlength=len(self.participants))
+        return {name: int(cents) for name, cents in zip(self.participants, per_participant)}
+
+    def instantiate(self, prices, description, bill_date=None):
+        """Builds a bill with this plan's items at the given prices.
+
+        The bill is loaded in one step, and its summary matrix is filled from
+        the vectorized shares instead of being re-split item by item.
+        """
+        prices = [float(price) for price in prices]
+        shares = self.shares(prices).tolist()
+        bill = Bill(description, bill_date=bill_date)
+        bill.load_state({
+            'bill_id': bill.bill_id,
+            'description': description,
+            'date': bill.date,
+            'participants': list(self.participants),
+            'items': [
+                dict({'item_name': name, 'price': price, 'participants': list(names)},
+                     **({'category': category} if category else {}),
+                     **({'quantities': dict(quantities)} if quantities else {}))
+                for name, price, names, category, quantities in zip(self.item_names, prices, self.item_participants,
+                                                                    self.item_categories, self.item_quantities)
+            ],
+        }, copy=False)
+
+        item_splits = {}
+        start = 0
+        for name, names in zip(self.item_names, self.item_participants):
+            # Like the summary table, the last item with a given name wins
+            item_splits[name] = dict(zip(names, shares[start:start + len(names)]))
+            start += len(names)
+        bill._item_splits = item_splits
+        return bill
+
+
+class BillTemplate:
+    """A reusable bill shape: a description and items with their participants and usual prices."""
+
+    def __init__(self, name, description, items):
+        self.name = name
+        self.description = description
+        self.items = [
+            dict({'item_name': item['item_name'], 'price': float(item.get('price', 0.0)),
+                  'participants': list(item['participants'])},
+                 **({'category': item['category']} if item.get('category') else {}),
+                 **({'quantities': dict(item['quantities'])} if item.get('quantities') else {}))
+            for item in items
+        ]
+        self._plan = None
+
+    @classmethod
+    def from_bill(cls, name, bill: Bill):
+        return cls(name, bill.description, bill.items)
+
+    @property
+    def plan(self):
+        """The compiled SplitPlan, built once per template."""
+        if self._plan is None:
+            self._plan = SplitPlan(self.items)
+        return self._plan
+
+    def default_prices(self):
+        return [item['price'] for item in self.items]
+
+    def instantiate(self, prices=None, description=None, bill_date=None):
+        """Creates a new bill from the template, with the usual prices unless others are given."""
+        return self.plan.instantiate(
+            self.default_prices() if prices is None else prices,
+            description or self.description,
+            bill_date=bill_date,
+        )
+
+    def to_dict(self):
+        return {'description': self.description, 'items': self.items}
+
+
+def load_templates():
+    """Loads bill templates from a JSON file, keyed by name."""
+    try:
+        with open(TEMPLATES_FILE, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {name: BillTemplate(name, entry['description'], entry['items']) for name, entry in data.items()}
+
+
+def save_templates(templates):
+    """Saves bill templates to a JSON file."""
+    with open(TEMPLATES_FILE, 'w') as f:
+        json.dump({name: template.to_dict() for name, template in templates.items()}, f, indent=4)
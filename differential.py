@@ -0,0 +1,587 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from fractions import Fraction
+
+from core.models import Bill, UNCATEGORIZED
+from core.logic import calculate_totals_in_cents, create_bill_dataframe, get_participant_statement
+from core.templates import SplitPlan
+from core.events import EventLog
+from core.storage import decode_bill, encode_bill
+from core.collab import LiveBill, MemoryOpLog
+
+# Names that trip up naive string handling: accents, combining marks, CJK, emoji, full-width
+UNICODE_NAMES = [
+    "Zoë", "José", "Zoe\u0308", "李雷", "Ωmega", "🍕 Fan", "Ａｌｉ", "O'Brien", "Ørjan", "सीता",
+    "Müller", "  Pad  ", "a", "A",
+]
+ITEM_NAMES = ["Pizza", "Drinks", "Tip", "Café", "寿司", "🍺", "Tax"]
+CATEGORIES = [None, None, "Food", "Drinks", "Transport"]
+# Amounts that stress the remainder cents
+EDGE_PRICES = [0.01, 0.02, 0.03, 0.99, 1.0, 0.1, 0.3, 100.01, 999999.99]
+
+
+# --- Reference implementation: obvious, slow and independent of the code under test ---
+
+def reference_shares(price, names):
+    """One item's shares in cents, dealt out round-robin: cent k goes to participant k % n."""
+    cents = int(round(price * 100))
+    shares = {}
+    for i, name in enumerate(names):
+        # Like the bill, a name listed twice keeps its last share
+        shares[name] = len(range(i, cents, len(names)))
+    return shares
+
+
+def reference_quantity_shares(price, quantities):
+    """One item's shares in cents by quantity: exact fractional shares, floored, then
+    the leftover cents handed out one at a time to the largest remainder (earliest on a tie)."""
+    cents = int(round(price * 100))
+    # Quantities count to the thousandth of a unit, and any positive quantity at least that much
+    weights = {name: max(1, int(round(quantity * 1000))) for name, quantity in quantities.items()}
+    exact = {name: Fraction(cents * weight, sum(weights.values())) for name, weight in weights.items()}
+    shares = {name: int(share) for name, share in exact.items()}
+    by_remainder = sorted(exact, key=lambda name: exact[name] - shares[name], reverse=True)
+    for name in by_remainder[:cents - sum(shares.values())]:
+        shares[name] += 1
+    return shares
+
+
+def reference_item_shares(item):
+    if item.get('quantities'):
+        return reference_quantity_shares(item['price'], item['quantities'])
+    return reference_shares(item['price'], item['participants'])
+
+
+def reference_totals_cents(items, roster):
+    totals = {name: 0 for name in roster}
+    for item in items:
+        for name, cents in reference_item_shares(item).items():
+            totals[name] = totals.get(name, 0) + cents
+    return totals
+
+
+def reference_totals_exact(items, roster):
+    """Unrounded totals (price / participants, as get_totals defines them), as exact fractions."""
+    totals = {name: Fraction(0) for name in roster}
+    for item in items:
+        price = Fraction(int(round(item['price'] * 100)), 100)
+        if item.get('quantities'):
+            units = sum(Fraction(quantity) for quantity in item['quantities'].values())
+            for name, quantity in item['quantities'].items():
+                totals[name] += price * Fraction(quantity) / units
+        elif item['participants']:
+            # Prices are whole cents, which keeps the denominators small
+            share = price / len(item['participants'])
+            for name in item['participants']:
+                totals[name] += share
+    return totals
+
+
+def reference_item_splits(items):
+    # The last item with a given name owns the summary row
+    return {item['item_name']: reference_item_shares(item) for item in items}
+
+
+def reference_categories(items):
+    rollups = {}
+    for item in items:
+        category = item.get('category') or UNCATEGORIZED
+        for name, cents in reference_item_shares(item).items():
+            if cents:
+                rollups.setdefault(category, {})
+                rollups[category][name] = rollups[category].get(name, 0) + cents
+    return rollups
+
+
+def reference_participant_items(items, name):
+    return sorted(id(item) for item in items if name in item['participants'])
+
+
+def reference_query(items, participant=None, min_price=None, max_price=None, name=None,
+                    sort_by=None, descending=False, limit=None):
+    matches = [
+        item for item in items
+        if (participant is None or participant in item['participants'])
+        and (min_price is None or item['price'] >= min_price)
+        and (max_price is None or item['price'] <= max_price)
+        and (not name or name.lower() in item['item_name'].lower())
+    ]
+    if sort_by == 'price':
+        matches.sort(key=lambda item: item['price'], reverse=descending)
+    elif sort_by == 'name':
+        matches.sort(key=lambda item: item['item_name'].lower(), reverse=descending)
+    return matches if limit is None else matches[:limit]
+
+
+# --- Random bills ---
+
+def random_price(rng):
+    if rng.random() < 0.4:
+        return rng.choice(EDGE_PRICES)
+    return rng.randint(1, 50000) / 100
+
+
+def random_roster(rng, size):
+    roster = list(dict.fromkeys(UNICODE_NAMES[:size]))
+    while len(roster) < size:
+        roster.append(f"{rng.choice(UNICODE_NAMES)} {len(roster)}")
+    return roster
+
+
+def random_participants(rng, roster):
+    if rng.random() < 0.05:
+        return list(roster)
+    return rng.sample(roster, rng.randint(1, min(len(roster), 12)))
+
+
+def random_quantities(rng, roster):
+    # Whole and fractional units, and now and then a zero that drops the name
+    return {name: rng.choice([1, 1, 2, 3, 0.5, 0.25, 1.5, 0.333, 12, 0])
+            for name in rng.sample(roster, rng.randint(1, min(len(roster), 8)))}
+
+
+def random_item(rng, roster):
+    item = {'item_name': rng.choice(ITEM_NAMES), 'price': random_price(rng), 'category': rng.choice(CATEGORIES)}
+    if rng.random() < 0.3:
+        item['quantities'] = random_quantities(rng, roster)
+    item['participants'] = random_participants(rng, roster)
+    return item
+
+
+def random_bill(rng, max_participants, ops, journal_dir=None):
+    """Builds a bill through a random mix of adds, batch adds, inserts, edits and removals.
+
+    Every edit is journaled to a file in ``journal_dir`` (in memory without one).
+    """
+    roster = random_roster(rng, rng.randint(1, max_participants))
+    bill = Bill("Differential")
+    # Build the lazy caches and indexes first, so the edits below maintain them incrementally
+    bill.get_item_splits()
+    bill.get_category_totals()
+    bill.get_participant_items(None)
+    bill.query_items()
+    # Every edit is journaled, with snapshots often enough that recovery replays from one
+    path = os.path.join(journal_dir, f"{rng.getrandbits(64):016x}.jsonl") if journal_dir else None
+    EventLog.attach(bill, snapshot_interval=rng.randint(3, 20), path=path)
+    for _ in range(ops):
+        roll = rng.random()
+        if roll < 0.55 or not bill.items:
+            position = rng.randrange(len(bill.items) + 1) if bill.items and rng.random() < 0.3 else None
+            item = random_item(rng, roster)
+            bill.add_item(item['item_name'], item['price'], item['participants'], position=position,
+                          category=item['category'], quantities=item.get('quantities'))
+        elif roll < 0.6:
+            bill.add_items([random_item(rng, roster) for _ in range(rng.randint(1, 6))])
+        elif roll < 0.85:
+            bill.update_item(
+                rng.randrange(len(bill.items)),
+                item_name=rng.choice(ITEM_NAMES) if rng.random() < 0.3 else None,
+                price=random_price(rng) if rng.random() < 0.5 else None,
+                participant_names=random_participants(rng, roster) if rng.random() < 0.5 else None,
+                category=rng.choice(["", "Food", "Drinks", None]),
+                quantities=rng.choice([None, None, None, {}, random_quantities(rng, roster)]),
+            )
+        else:
+            bill.remove_item_at(rng.randrange(len(bill.items)))
+    return bill
+
+
+# --- Fast paths, each compared against the reference ---
+
+def check_totals(totals, bill):
+    expected = reference_totals_exact(bill.items, bill.participants)
+    for name, exact in expected.items():
+        if abs(Fraction(totals.get(name, 0.0)) - exact) > Fraction(1, 10 ** 6):
+            return f"{name!r}: {totals.get(name)} != {float(exact)}"
+    return None
+
+
+def check_cents(totals, bill):
+    expected = reference_totals_cents(bill.items, bill.participants)
+    if totals != expected:
+        name = next(n for n in set(totals) | set(expected) if totals.get(n) != expected.get(n))
+        return f"{name!r}: {totals.get(name)} != {expected.get(name)}"
+    return None
+
+
+def check_item_splits(splits, bill):
+    expected = reference_item_splits(bill.items)
+    if splits != expected:
+        item_name = next(n for n in set(splits) | set(expected) if splits.get(n) != expected.get(n))
+        found, wanted = splits.get(item_name, {}), expected.get(item_name, {})
+        name = next((n for n in set(found) | set(wanted) if found.get(n) != wanted.get(n)), None)
+        return f"item {item_name!r}, {name!r}: {found.get(name)} != {wanted.get(name)}"
+    return None
+
+
+def check_dataframe(df, bill):
+    expected = reference_item_splits(bill.items)
+    for item_name, shares in expected.items():
+        row = df.loc[item_name]
+        for name in bill.participants:
+            cents = int(round(row[name] * 100))
+            if cents != shares.get(name, 0):
+                return f"[{item_name!r}, {name!r}]: {cents} != {shares.get(name, 0)}"
+    total_row = df.loc['Total']
+    for name in bill.participants:
+        column = sum(shares.get(name, 0) for shares in expected.values())
+        if int(round(total_row[name] * 100)) != column:
+            return f"Total {name!r}: {total_row[name]} != {column / 100}"
+    return None
+
+
+def check_categories(rollups, bill):
+    expected = reference_categories(bill.items)
+    if rollups != expected:
+        category = next(c for c in set(rollups) | set(expected) if rollups.get(c) != expected.get(c))
+        found, wanted = rollups.get(category, {}), expected.get(category, {})
+        name = next(n for n in set(found) | set(wanted) if found.get(n) != wanted.get(n))
+        return f"category {category!r}, {name!r}: {found.get(name)} != {wanted.get(name)}"
+    return None
+
+
+def check_participant_index(index, bill):
+    for name in bill.participants:
+        found = sorted(id(item) for item in index.get(name, []))
+        if found != reference_participant_items(bill.items, name):
+            return f"{name!r}: {len(found)} items indexed"
+    return None
+
+
+def random_queries(bill, count=8):
+    # Seeded by the bill, so a divergence reproduces from the bill's seed alone
+    rng = random.Random(len(bill.items) * 7919 + len(bill.participants))
+    queries = []
+    for _ in range(count):
+        queries.append({
+            'participant': rng.choice(list(bill.participants)) if bill.participants and rng.random() < 0.4 else None,
+            'min_price': random_price(rng) if rng.random() < 0.4 else None,
+            'max_price': random_price(rng) if rng.random() < 0.4 else None,
+            'name': rng.choice(["", "a", "pi", "PIZZA", "café", "寿", "x"]) if rng.random() < 0.5 else None,
+            'sort_by': rng.choice([None, 'price', 'name']),
+            'descending': rng.random() < 0.5,
+            'limit': rng.choice([None, 1, 5]),
+        })
+    return queries
+
+
+def _sort_keys(items, sort_by):
+    if sort_by == 'price':
+        return [item['price'] for item in items]
+    return [item['item_name'].lower() for item in items]
+
+
+def check_queries(results, bill):
+    for query, found in results:
+        matching = {id(item) for item in reference_query(bill.items, **dict(query, limit=None))}
+        expected = reference_query(bill.items, **query)
+        # Unsorted results come in index order, and ties in any order, so only the keys must agree
+        if len(found) != len(expected) or any(id(item) not in matching for item in found):
+            return f"{query}: {len(found)} items, expected {len(expected)}"
+        if query['sort_by'] and _sort_keys(found, query['sort_by']) != _sort_keys(expected, query['sort_by']):
+            return f"{query}: out of order"
+    return None
+
+
+def check_split_plan(totals, bill):
+    expected = reference_totals_cents(bill.items, bill.participants)
+    for name, cents in expected.items():
+        if totals.get(name, 0) != cents:
+            return f"{name!r}: {totals.get(name, 0)} != {cents}"
+    return None
+
+
+def check_statements(statements, bill):
+    expected = reference_totals_cents(bill.items, bill.participants)
+    for name, total in statements.items():
+        if int(round(total * 100)) != expected[name]:
+            return f"{name!r}: {total} != {expected[name] / 100}"
+    return None
+
+
+def check_same_state(state, bill):
+    """The bill rebuilt another way must hold exactly what the bill holds, history hash included."""
+    expected = bill.to_state()
+    if state == expected:
+        return None
+    if len(state['items']) != len(expected['items']):
+        return f"{len(state['items'])} items != {len(expected['items'])}"
+    for position, (found, wanted) in enumerate(zip(state['items'], expected['items'])):
+        if found != wanted:
+            return f"item {position}: {found} != {wanted}"
+    key = next(k for k in set(state) | set(expected) if state.get(k) != expected.get(k))
+    return f"{key}: {state.get(key)!r} != {expected.get(key)!r}"
+
+
+def check_bill_file(result, bill):
+    state, truncations = result
+    problem = check_same_state(state, bill)
+    if problem:
+        return problem
+    for length, error in truncations:
+        if not isinstance(error, ValueError):
+            return f"a file cut to {length} bytes raised {error!r} instead of ValueError"
+    return None
+
+
+def _converged(state):
+    # Replicas agree on the items in order; participants are a set, gathered in arrival order
+    state = dict(state, participants=sorted(state['participants']))
+    del state['history_hash']
+    return state
+
+
+def check_replicas(result, bill):
+    """Replicas synced after every edit match one bill given the same edits, and after
+    concurrent edits every replica and a late joiner end up identical."""
+    serial, plain, replicas, joiner = result
+    if serial != plain:
+        key = next(k for k in set(serial) | set(plain) if serial.get(k) != plain.get(k))
+        return f"serial replicas, {key}: {serial.get(key)!r} != {plain.get(key)!r}"
+    for index, state in enumerate(replicas[1:] + [joiner], start=1):
+        if state != replicas[0]:
+            key = next(k for k in set(state) | set(replicas[0]) if state.get(k) != replicas[0].get(k))
+            who = "late joiner" if index == len(replicas) else f"replica {index}"
+            return f"{who} diverged on {key}: {state.get(key)!r} != {replicas[0].get(key)!r}"
+    return None
+
+
+def _replayed_state(bill):
+    """Replays the journaled events onto a fresh bill from the first snapshot."""
+    log = bill.event_log
+    replica = Bill.from_state(log.snapshots[0])
+    for op, args in log.events[:log.cursor]:
+        getattr(replica, op)(**args)
+    return replica.to_state()
+
+
+def _recovered_state(bill):
+    """Recovers the bill from its journal file: the nearest snapshot plus the events after it."""
+    recovered, _ = EventLog.recover(bill.event_log.path, Bill)
+    return recovered.to_state()
+
+
+def _undo_redo_state(bill):
+    """Undoes a random number of edits on a recovered copy, then redoes them all."""
+    copy, log = EventLog.recover(bill.event_log.path, Bill)
+    log.path = None
+    steps = random.Random(len(bill.items)).randint(0, log.cursor - log.base)
+    for _ in range(steps):
+        log.undo(copy)
+    for _ in range(steps):
+        log.redo(copy)
+    return copy.to_state()
+
+
+def _bill_file_round_trip(bill):
+    data = encode_bill(bill)
+    rng = random.Random(len(data))
+    truncations = []
+    for length in [0, 1, 9] + [rng.randrange(len(data)) for _ in range(4)]:
+        try:
+            decode_bill(data[:length])
+            truncations.append((length, None))
+        except Exception as error:
+            truncations.append((length, error))
+    return decode_bill(data).to_state(), truncations
+
+
+def _random_live_edit(rng, bill, pool, peer=None):
+    """Applies one random local edit, the same way whether the bill is live or not.
+
+    With a ``peer`` replica that has caught up with ``bill``, it instead
+    splits one item by quantity on ``bill`` and sets the same item's
+    participants on the peer, the two edits Bill.update_item derives from
+    each other.
+    """
+    roll = rng.random()
+    if peer is not None and bill.items and len(peer.bill.items) == len(bill.items):
+        index = rng.randrange(len(bill.items))
+        names = sorted({name for item in pool for name in item['participants']} | {"x", "y", "z"})
+        bill.update_item(index, quantities={name: rng.randint(1, 3) for name in rng.sample(names, 2)})
+        peer.bill.update_item(index, participant_names=rng.sample(names, rng.randint(1, 3)))
+    elif roll < 0.5 or not bill.items:
+        item = rng.choice(pool)
+        # Live bills keep items in creation order, so local edits only append
+        bill.add_item(item['item_name'], item['price'], item['participants'], category=item.get('category'),
+                      quantities=item.get('quantities'))
+    elif roll < 0.6:
+        bill.add_items(rng.sample(pool, min(len(pool), rng.randint(1, 3))))
+    elif roll < 0.8:
+        other = rng.choice(pool)
+        field = rng.choice(['item_name', 'price', 'participant_names', 'category', 'quantities'])
+        value = {'item_name': other['item_name'], 'price': other['price'], 'participant_names': other['participants'],
+                 'category': other.get('category') or "", 'quantities': other.get('quantities') or {}}[field]
+        bill.update_item(rng.randrange(len(bill.items)), **{field: value})
+    elif roll < 0.85:
+        bill.set_description(rng.choice(["Dinner", "Trip", "Rent"]))
+    elif roll < 0.9:
+        bill.set_voided(rng.random() < 0.5)
+    else:
+        bill.remove_item_at(rng.randrange(len(bill.items)))
+
+
+def _live_replicas(bill):
+    """Replays random edits built from the bill's items through live replicas sharing one log."""
+    rng = random.Random(len(bill.items) * 31 + len(bill.participants))
+    pool = [dict(item) for item in bill.items] or [{'item_name': "Pizza", 'price': 10.0, 'participants': ["a"]}]
+    edits = rng.randint(5, 40)
+
+    # Serially: every replica catches up before its edit and shares it right after
+    log = MemoryOpLog()
+    first = Bill("Live", bill_date="2025-01-01")
+    plain = Bill("Live", bill_date="2025-01-01", bill_id=first.bill_id)
+    replicas = [LiveBill.join(first, log)]
+    replicas += [LiveBill.join(Bill("Live", bill_date="2025-01-01", bill_id=first.bill_id), log) for _ in range(2)]
+    edit_seed = rng.random()
+    plain_rng, live_rng = random.Random(edit_seed), random.Random(edit_seed)
+    for _ in range(edits):
+        replica = rng.choice(replicas)
+        replica.sync()
+        _random_live_edit(plain_rng, plain, pool)
+        _random_live_edit(live_rng, replica.bill, pool)
+        replica.sync()
+    replicas[0].sync()
+    serial = _converged(replicas[0].bill.to_state())
+
+    # Concurrently: edits made between random syncs, on a log compacted every few operations
+    log = MemoryOpLog()
+    first = Bill("Live", bill_date="2025-01-01")
+    replicas = [LiveBill.join(first, log)]
+    replicas += [LiveBill.join(Bill("Live", bill_date="2025-01-01", bill_id=first.bill_id), log) for _ in range(2)]
+    for replica in replicas:
+        replica.compact_after = rng.randint(3, 30)
+    for _ in range(edits):
+        replica, peer = rng.sample(replicas, 2)
+        if rng.random() < 0.3:
+            # Concurrent split edits on the same item need both replicas to see the same items
+            replica.sync()
+            peer.sync()
+            replica.sync()
+            _random_live_edit(rng, replica.bill, pool, peer)
+        else:
+            _random_live_edit(rng, replica.bill, pool)
+        if rng.random() < 0.3:
+            rng.choice(replicas).sync()
+    for _ in range(2):
+        for replica in replicas:
+            replica.sync()
+    joiner = LiveBill.join(Bill("Late", bill_id=first.bill_id), log)
+    return (serial, _converged(plain.to_state()), [_converged(replica.bill.to_state()) for replica in replicas],
+            _converged(joiner.bill.to_state()))
+
+
+def _recalculated_totals(bill):
+    copy = Bill.from_state(bill.to_state())
+    copy._recalculate_totals()
+    return copy.get_totals()
+
+
+def _rebuilt_item_splits(bill):
+    return Bill.from_state(bill.to_state()).get_item_splits()
+
+
+def _rebuilt_categories(bill):
+    return Bill.from_state(bill.to_state()).get_category_totals()
+
+
+def _split_plan_totals(bill):
+    return SplitPlan(bill.items).totals([item['price'] for item in bill.items])
+
+
+def _query_results(bill):
+    return [(query, bill.query_items(**query)) for query in random_queries(bill)]
+
+
+def _statement_totals(bill):
+    return {name: get_participant_statement(bill, name)['total'] for name in bill.get_item_participants()}
+
+
+# name -> (fast path, check against the reference)
+FAST_PATHS = {
+    'get_totals (incremental)': (lambda bill: bill.get_totals(), check_totals),
+    '_recalculate_totals': (_recalculated_totals, check_totals),
+    'calculate_totals_in_cents': (calculate_totals_in_cents, check_cents),
+    'get_item_splits (incremental)': (lambda bill: dict(bill.get_item_splits()), check_item_splits),
+    'get_item_splits (rebuilt)': (_rebuilt_item_splits, check_item_splits),
+    'create_bill_dataframe': (create_bill_dataframe, check_dataframe),
+    'category rollups (incremental)': (lambda bill: bill.get_category_totals(), check_categories),
+    'category rollups (rebuilt)': (_rebuilt_categories, check_categories),
+    'participant index': (lambda bill: {name: bill.get_participant_items(name) for name in bill.participants},
+                          check_participant_index),
+    'query_items': (_query_results, check_queries),
+    'SplitPlan.totals': (_split_plan_totals, check_split_plan),
+    'participant statements': (_statement_totals, check_statements),
+    'EventLog replay': (_replayed_state, check_same_state),
+    'EventLog recover': (_recovered_state, check_same_state),
+    'EventLog undo/redo': (_undo_redo_state, check_same_state),
+    'encode_bill/decode_bill': (_bill_file_round_trip, check_bill_file),
+    'LiveBill merge': (_live_replicas, check_replicas),
+}
+
+
+def reference_timing(bill):
+    reference_totals_exact(bill.items, bill.participants)
+    reference_totals_cents(bill.items, bill.participants)
+    reference_item_splits(bill.items)
+
+
+def run(bills, seed, max_participants, ops, stop_at_first=False):
+    """Checks every fast path on ``bills`` random bills.
+
+    Returns {path: {'seconds', 'failures', 'first'}}, where 'first' describes
+    the first divergence together with the seed that reproduces it.
+    """
+    results = {name: {'seconds': 0.0, 'failures': 0, 'first': None} for name in ['reference'] + list(FAST_PATHS)}
+    # Journals of the random bills, replayed by the EventLog checks
+    with tempfile.TemporaryDirectory(prefix="bill_differential_") as journal_dir:
+        for case in range(bills):
+            if _check_case(results, seed + case, max_participants, ops, journal_dir, stop_at_first):
+                break
+    return results
+
+
+def _check_case(results, case_seed, max_participants, ops, journal_dir, stop_at_first):
+    """Checks every fast path on one random bill. Returns True to stop at a divergence."""
+    bill = random_bill(random.Random(case_seed), max_participants, ops, journal_dir)
+
+    start = time.perf_counter()
+    reference_timing(bill)
+    results['reference']['seconds'] += time.perf_counter() - start
+
+    for name, (fast_path, check) in FAST_PATHS.items():
+        start = time.perf_counter()
+        output = fast_path(bill)
+        results[name]['seconds'] += time.perf_counter() - start
+        problem = check(output, bill)
+        if problem:
+            results[name]['failures'] += 1
+            if results[name]['first'] is None:
+                results[name]['first'] = f"seed {case_seed}: {problem}"
+            if stop_at_first:
+                return True
+    return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the bill's fast paths cent-for-cent against a reference splitter")
+    parser.add_argument('--bills', type=int, default=200, help="Random bills to check")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first bill; bill i uses seed + i")
+    parser.add_argument('--max-participants', type=int, default=2000, help="Largest roster per bill")
+    parser.add_argument('--ops', type=int, default=60, help="Random edits per bill")
+    parser.add_argument('--stop-at-first', action='store_true', help="Stop at the first divergence")
+    args = parser.parse_args()
+
+    results = run(args.bills, args.seed, args.max_participants, args.ops, args.stop_at_first)
+    width = max(len(name) for name in results)
+    print(f"{'path':<{width}}  {'ms/bill':>9}  {'failures':>8}")
+    for name, result in results.items():
+        print(f"{name:<{width}}  {1000 * result['seconds'] / args.bills:>9.3f}  {result['failures']:>8}")
+    failed = {name: result['first'] for name, result in results.items() if result['failures']}
+    for name, first in failed.items():
+        print(f"\n{name} diverged first at {first}")
+    sys.exit(1 if failed else 0)
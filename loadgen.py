@@ -0,0 +1,198 @@
+import argparse
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# Relative weights of the simulated user actions
+ACTIONS = {'add_item': 6, 'toggle_columns': 2, 'download': 2}
+DOWNLOAD_KINDS = ['json', 'pdf', 'bill']
+
+# AppTest swaps a process-wide runtime in and out around every run, so runs
+# can't overlap. Sessions queue for this lock, much as the server's script
+# threads queue for the interpreter lock, and the wait counts as latency.
+_RUN_LOCK = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident memory of this process; the peak where /proc isn't available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if peak > 1 << 32 else peak * 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class SimulatedSession:
+    """One browser session driven headlessly through AppTest; every rerun is timed.
+
+    After a fragment rerun AppTest only holds that fragment's elements, so a
+    widget elsewhere on the page is reached through a full rerun first, which
+    is timed as 'full_rerun'.
+    """
+
+    def __init__(self, rng, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.rng = rng
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.latencies = {}
+        self.errors = 0
+        self.items_added = 0
+
+    def _timed_run(self, action, element=None):
+        start = time.perf_counter()
+        with _RUN_LOCK:
+            (element or self.app).run()
+        self.latencies.setdefault(action, []).append(time.perf_counter() - start)
+        if self.app.exception:
+            self.errors += 1
+
+    def _find(self, lookup):
+        try:
+            return lookup()
+        except (KeyError, StopIteration, IndexError):
+            self._timed_run('full_rerun')
+            return lookup()
+
+    def start(self):
+        self._timed_run('first_load')
+
+    def add_item(self):
+        picker = self._find(lambda: self.app.multiselect(key="participant_multiselect"))
+        if not picker.options:
+            return
+        self.items_added += 1
+        self.app.text_input(key="new_item_name").set_value(f"Item {self.items_added}")
+        self.app.number_input(key="new_item_price").set_value(self.rng.randint(1, 20000) / 100)
+        picker.set_value(self.rng.sample(picker.options, self.rng.randint(1, min(len(picker.options), 6))))
+        submit = self._find(lambda: next(button for button in self.app.button if button.label == "Add Item"))
+        self._timed_run('add_item', submit.click())
+
+    def toggle_columns(self):
+        try:
+            widget = self._find(lambda: next(widget for widget in self.app.multiselect
+                                             if widget.key == "column_visibility"))
+        except StopIteration:
+            # No items yet, so there is no table to change
+            return self.add_item()
+        hidden = [name for name in widget.options if name not in widget.value]
+        if hidden:
+            widget.select(self.rng.choice(hidden))
+        else:
+            widget.unselect(self.rng.choice(widget.value))
+        self._timed_run('toggle_columns', widget)
+
+    def download(self):
+        kind = self.rng.choice(DOWNLOAD_KINDS)
+        try:
+            button = self._find(lambda: next(button for button in self.app.button
+                                             if button.key == f"prepare_{kind}" and not button.disabled))
+        except StopIteration:
+            # Nothing to export yet, or that export is still rendering
+            return self.add_item()
+        self._timed_run('download', button.click())
+        # Rerun, as the downloads section's polling would, until the file is ready
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline and any(
+                button.key == f"prepare_{kind}" and button.disabled for button in self.app.button):
+            time.sleep(0.2)
+            self._timed_run('download_poll')
+
+    def act(self):
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        getattr(self, action)()
+
+
+def run_load(sessions, actions, seed=0, think=0.0, timeout=60):
+    """Runs ``sessions`` concurrent simulated users doing ``actions`` actions each.
+
+    All sessions share this process, and so the app's cached resources, as
+    they would in one server process.
+
+    Returns rerun latencies per action (in seconds, sorted), the error count
+    and resident memory before, at the peak and after.
+    """
+    # Load the app once so imports and shared caches don't count as growth
+    SimulatedSession(random.Random(seed), timeout).start()
+    memory = {'before': rss_bytes(), 'peak': 0}
+    latencies, errors = {}, [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def sample_memory():
+        while not stop.wait(0.1):
+            memory['peak'] = max(memory['peak'], rss_bytes())
+
+    def user(index):
+        session = SimulatedSession(random.Random(seed + index), timeout)
+        session.start()
+        for _ in range(actions):
+            session.act()
+            if think:
+                time.sleep(session.rng.uniform(0, 2 * think))
+        with lock:
+            for action, values in session.latencies.items():
+                latencies.setdefault(action, []).extend(values)
+            errors[0] += session.errors
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        for future in [pool.submit(user, index) for index in range(sessions)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    memory['after'] = rss_bytes()
+    memory['peak'] = max(memory['peak'], memory['after'])
+    return {
+        'elapsed': elapsed,
+        'latencies': {action: sorted(values) for action, values in latencies.items()},
+        'errors': errors[0],
+        'memory': memory,
+    }
+
+
+def print_report(result, sessions):
+    all_reruns = sorted(value for values in result['latencies'].values() for value in values)
+    rows = sorted(result['latencies'].items()) + [('all reruns', all_reruns)]
+    width = max(len(name) for name, _ in rows)
+    print(f"{sessions} sessions, {len(all_reruns)} reruns in {result['elapsed']:.1f}s, "
+          f"{result['errors']} with exceptions")
+    print(f"{'action':<{width}}  {'count':>6}  {'p50 ms':>8}  {'p90 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+    for name, values in rows:
+        print(f"{name:<{width}}  {len(values):>6}  " + "  ".join(
+            f"{1000 * percentile(values, fraction):>8.1f}" for fraction in (0.5, 0.9, 0.99, 1.0)))
+    memory = result['memory']
+    mib = 1024 * 1024
+    print(f"memory: {memory['before'] / mib:.0f} MiB before, {memory['peak'] / mib:.0f} MiB peak, "
+          f"{memory['after'] / mib:.0f} MiB after (+{(memory['after'] - memory['before']) / mib:.0f} MiB)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive app.py with simulated concurrent sessions and report rerun latency")
+    parser.add_argument('--sessions', type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument('--actions', type=int, default=20, help="Actions per user after the first page load")
+    parser.add_argument('--think', type=float, default=0.0, help="Mean pause between a user's actions, in seconds")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first user; user i uses seed + i")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds a single rerun may take")
+    args = parser.parse_args()
+
+    # Keep the simulated bills out of the real bill store and spill folder
+    with tempfile.TemporaryDirectory(prefix="billsplitter-load-", ignore_cleanup_errors=True) as scratch:
+        os.environ.setdefault('BILL_STORE_PATH', os.path.join(scratch, "bills.sqlite3"))
+        os.environ.setdefault('SESSION_SPILL_DIR', os.path.join(scratch, "spill"))
+        print_report(run_load(args.sessions, args.actions, args.seed, args.think, args.timeout), args.sessions)
@@ -0,0 +1,20 @@
+import argparse
+import json
+
+from core.logic import load_groups
+from core.summaries import aggregate_summaries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Total saved bill summaries per participant and group")
+    parser.add_argument('paths', nargs='+', help="Summary files (.json, or .jsonl with one summary per line) or folders")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Summaries reduced per batch")
+    parser.add_argument('--workers', type=int, default=1, help="Processes parsing batches in parallel")
+    parser.add_argument('--no-groups', action='store_true', help="Skip the per-group totals")
+    args = parser.parse_args()
+    totals = aggregate_summaries(
+        args.paths,
+        groups=None if args.no_groups else load_groups(),
+        chunk_size=args.chunk_size,
+        workers=args.workers
+    )
+    print(json.dumps(totals.to_dict(), indent=4))